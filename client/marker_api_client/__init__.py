@@ -1,7 +1,12 @@
+import os
+import time
+import random
+import hashlib
 import aiohttp
 import asyncio
 import requests
-from typing import List, Union, Dict, Any
+from contextlib import ExitStack
+from typing import AsyncIterator, List, Optional, Union, Dict, Any
 from enum import Enum
 from pydantic import BaseModel
 from tqdm import tqdm
@@ -28,17 +33,53 @@ class HealthResponse(BaseModel):
 
 class ConversionResponse(BaseModel):
     status: str
-    result: Dict[str, Any] = None
+    result: Union[str, Dict[str, Any], None] = None
 
 
 class CeleryTaskResponse(BaseModel):
     task_id: str
     status: str
+    estimated_seconds: Optional[float] = None
+    estimated_completion: Optional[str] = None
 
 
 class BatchConversionResponse(BaseModel):
-    task_id: str
+    # None if every file was answered from the server's cache
+    task_id: Optional[str] = None
+    status: str
+    # Results of files skipped with ``skip_if_cached``, keyed by file path
+    cached: Dict[str, ConversionResponse] = {}
+
+
+class DocumentResult(BaseModel):
+    """Outcome of converting one file with ``aconvert_many``"""
+
+    file_path: str
     status: str
+    markdown: Optional[str] = None
+    images: Optional[Dict[str, str]] = None
+    error: Optional[str] = None
+    task_id: Optional[str] = None
+    elapsed: float = 0.0
+
+
+def hash_file(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of a file, read in chunks. This is the hash the server looks documents up by."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _query_params(options: Optional[Dict[str, Any]]) -> Dict[str, str]:
+    """Conversion options as query parameters (aiohttp rejects bool values)"""
+    params = {}
+    for key, value in (options or {}).items():
+        if value is None:
+            continue
+        params[key] = str(value).lower() if isinstance(value, bool) else str(value)
+    return params
 
 
 class MarkerAPIClient:
@@ -97,21 +138,160 @@ class MarkerAPIClient:
     def _batch_convert_endpoint(self):
         return "/batch_convert"
 
+    def _file_field(self):
+        # The simple server names the upload field differently. A distributed
+        # server without workers reports itself as simple; it accepts this name too
+        return "document_file" if self.server_type == ServerType.simple else "pdf_file"
+
+    def lookup(
+        self, sha256: str, options: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Ask the server for the result of a document by its hash (see ``hash_file``).
+
+        Returns:
+        Optional[Dict[str, Any]]: The server's answer if the document was
+        converted or is being converted with these options, otherwise None.
+        """
+        response = self.session.get(
+            f"{self.base_url}/lookup/{sha256}", params=_query_params(options)
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.json()
+
     def load_data(
-        self, file_paths: Union[str, List[str]], show_progress: bool = False
+        self,
+        file_paths: Union[str, List[str]],
+        show_progress: bool = False,
+        skip_if_cached: bool = False,
     ) -> Union[ConversionResponse, BatchConversionResponse]:
         if isinstance(file_paths, str):
             logger.info(f"Converting single file: {file_paths}")
+            if skip_if_cached:
+                cached = self._cached_result(file_paths)
+                if cached is not None:
+                    return cached
             return self._convert_single(file_paths)
         elif isinstance(file_paths, list):
+            cached = {}
+            if skip_if_cached:
+                for file_path in file_paths:
+                    result = self._cached_result(file_path)
+                    if result is not None:
+                        cached[file_path] = result
+                file_paths = [path for path in file_paths if path not in cached]
+            if not file_paths:
+                return BatchConversionResponse(status="Success", cached=cached)
             logger.info(f"Converting batch of {len(file_paths)} files")
-            return self._convert_batch(file_paths, show_progress)
+            batch = self._convert_batch(file_paths, show_progress)
+            batch.cached = cached
+            return batch
         else:
             raise ValueError("file_paths must be a string or a list of strings")
 
+    def _cached_result(self, file_path: str) -> Optional[ConversionResponse]:
+        """
+        The server's finished result for a file, shaped like ``/convert``'s
+        response, or None if it has to be converted.
+        """
+        body = self.lookup(hash_file(file_path))
+        if body is None or body.get("status") != "Success":
+            return None
+        result = body.get("result")
+        if isinstance(result, dict):
+            # The distributed server answers with the task's result
+            if result.get("status") != "ok":
+                return None
+            result = result.get("markdown")
+        logger.info(f"Server already has a result for {file_path}")
+        return ConversionResponse(status="Success", result=result)
+
+    def upload_resumable(
+        self,
+        file_path: str,
+        options: Optional[Dict[str, Any]] = None,
+        chunk_size: int = 8 * 1024 * 1024,
+        upload_id: Optional[str] = None,
+        max_retries: int = 5,
+    ) -> Union[ConversionResponse, CeleryTaskResponse]:
+        """
+        Upload a large document in chunks and convert it.
+
+        Failed chunks are retried from the offset the server reports, so a
+        dropped connection only costs the chunk in flight. Pass the
+        ``upload_id`` of an earlier, interrupted call to resume it.
+
+        Args:
+        file_path (str): The document to upload.
+        options (Optional[Dict[str, Any]]): Conversion options, e.g. ``{"use_llm": False}``.
+        chunk_size (int): Bytes sent per request.
+        upload_id (Optional[str]): Resume this upload instead of starting a new one.
+        max_retries (int): Consecutive failures tolerated before giving up.
+
+        Returns:
+        Union[ConversionResponse, CeleryTaskResponse]: The conversion result from the
+        simple server, or the queued task from the distributed server.
+        """
+        size = os.path.getsize(file_path)
+        if upload_id is None:
+            response = self.session.post(
+                f"{self.base_url}/uploads",
+                json={
+                    "filename": os.path.basename(file_path),
+                    "size": size,
+                    "sha256": hash_file(file_path),
+                },
+            )
+            response.raise_for_status()
+            upload_id = response.json()["upload_id"]
+            logger.info(f"Started upload {upload_id} for {file_path}")
+        upload_url = f"{self.base_url}/uploads/{upload_id}"
+
+        response = self.session.head(upload_url)
+        response.raise_for_status()
+        offset = int(response.headers["Upload-Offset"])
+
+        failures = 0
+        with open(file_path, "rb") as file:
+            while offset < size:
+                file.seek(offset)
+                chunk = file.read(chunk_size)
+                try:
+                    response = self.session.put(
+                        upload_url, params={"offset": offset}, data=chunk
+                    )
+                    if response.status_code == 409:
+                        # The server got more (or less) than we thought; continue from its offset
+                        offset = int(response.headers["Upload-Offset"])
+                        continue
+                    response.raise_for_status()
+                    offset = response.json()["offset"]
+                    failures = 0
+                except requests.RequestException as e:
+                    failures += 1
+                    if failures > max_retries:
+                        raise
+                    logger.warning(f"Chunk at offset {offset} of {file_path} failed ({e}), retrying")
+                    time.sleep(min(2 ** failures, 30) * random.uniform(0.8, 1.2))
+                    response = self.session.head(upload_url)
+                    response.raise_for_status()
+                    offset = int(response.headers["Upload-Offset"])
+                logger.debug(f"Uploaded {offset} of {size} bytes of {file_path}")
+
+        response = self.session.post(
+            f"{upload_url}/finalize", params=_query_params(options)
+        )
+        response.raise_for_status()
+        logger.info(f"Finished upload {upload_id} for {file_path}")
+        if self.server_type == ServerType.distributed:
+            return CeleryTaskResponse(**response.json())
+        return ConversionResponse(**response.json())
+
     def _convert_single(self, file_path: str) -> ConversionResponse:
         with open(file_path, "rb") as file:
-            files = {"pdf_file": file}
+            files = {self._file_field(): file}
             logger.info(f"Sending request to convert {file_path}")
             response = self.session.post(
                 f"{self.base_url}{self._convert_endpoint()}", files=files
@@ -123,16 +303,17 @@ class MarkerAPIClient:
     def _convert_batch(
         self, file_paths: List[str], show_progress: bool
     ) -> BatchConversionResponse:
-        files = []
-        iterable = tqdm(file_paths, desc="Preparing files", disable=not show_progress)
-        for file_path in iterable:
-            files.append(("pdf_files", open(file_path, "rb")))
-            logger.info(f"Prepared file: {file_path}")
-
-        logger.info("Sending batch conversion request")
-        response = self.session.post(
-            f"{self.base_url}{self._batch_convert_endpoint()}", files=files
-        )
+        with ExitStack() as stack:
+            files = []
+            iterable = tqdm(file_paths, desc="Preparing files", disable=not show_progress)
+            for file_path in iterable:
+                files.append(("pdf_files", stack.enter_context(open(file_path, "rb"))))
+                logger.info(f"Prepared file: {file_path}")
+
+            logger.info("Sending batch conversion request")
+            response = self.session.post(
+                f"{self.base_url}{self._batch_convert_endpoint()}", files=files
+            )
         response.raise_for_status()
         logger.info("Batch conversion request successful")
         return BatchConversionResponse(**response.json())
@@ -150,33 +331,250 @@ class MarkerAPIClient:
             raise ValueError("file_paths must be a string or a list of strings")
 
     async def _aconvert_single(self, file_path: str) -> ConversionResponse:
-        data = aiohttp.FormData()
-        data.add_field("pdf_file", open(file_path, "rb"))
-        logger.info(f"Sending async request to convert {file_path}")
-        async with self.async_session.post(
-            f"{self.base_url}{self._convert_endpoint()}", data=data
-        ) as response:
-            response.raise_for_status()
-            logger.info(f"Successfully converted {file_path} asynchronously")
-            return ConversionResponse(**(await response.json()))
+        with open(file_path, "rb") as file:
+            data = aiohttp.FormData()
+            data.add_field(self._file_field(), file, filename=os.path.basename(file_path))
+            logger.info(f"Sending async request to convert {file_path}")
+            async with self.async_session.post(
+                f"{self.base_url}{self._convert_endpoint()}", data=data
+            ) as response:
+                response.raise_for_status()
+                logger.info(f"Successfully converted {file_path} asynchronously")
+                return ConversionResponse(**(await response.json()))
 
     async def _aconvert_batch(
         self, file_paths: List[str], show_progress: bool
     ) -> BatchConversionResponse:
-        data = aiohttp.FormData()
-        async for file_path in atqdm(
-            file_paths, desc="Preparing files", disable=not show_progress
-        ):
-            data.add_field("pdf_files", open(file_path, "rb"))
-            logger.info(f"Prepared file: {file_path}")
-
-        logger.info("Sending async batch conversion request")
-        async with self.async_session.post(
-            f"{self.base_url}{self._batch_convert_endpoint()}", data=data
-        ) as response:
+        with ExitStack() as stack:
+            data = aiohttp.FormData()
+            async for file_path in atqdm(
+                file_paths, desc="Preparing files", disable=not show_progress
+            ):
+                data.add_field(
+                    "pdf_files",
+                    stack.enter_context(open(file_path, "rb")),
+                    filename=os.path.basename(file_path),
+                )
+                logger.info(f"Prepared file: {file_path}")
+
+            logger.info("Sending async batch conversion request")
+            async with self.async_session.post(
+                f"{self.base_url}{self._batch_convert_endpoint()}", data=data
+            ) as response:
+                response.raise_for_status()
+                logger.info("Async batch conversion request successful")
+                return BatchConversionResponse(**(await response.json()))
+
+    async def aconvert_many(
+        self,
+        file_paths: List[str],
+        options: Optional[Dict[str, Any]] = None,
+        max_connections: int = 8,
+        poll_interval: float = 1.0,
+        max_poll_interval: float = 15.0,
+        timeout: float = 1800.0,
+        skip_if_cached: bool = False,
+        max_server_errors: int = 5,
+    ) -> AsyncIterator[DocumentResult]:
+        """
+        Convert many files concurrently and yield each result as it completes.
+
+        Each file is uploaded in its own request, streamed from disk, with at
+        most ``max_connections`` uploads (and open files) at a time over a
+        bounded connection pool. On a distributed server the tasks are then
+        polled with exponential backoff from ``poll_interval`` up to
+        ``max_poll_interval`` seconds. Failures are yielded as results with
+        status ``Error`` rather than raised.
+
+        With ``skip_if_cached``, each file is hashed locally and looked up on
+        the server first; it is only uploaded if the server has no result or
+        running conversion for it.
+
+        Args:
+        file_paths (List[str]): The files to convert.
+        options (Optional[Dict[str, Any]]): Conversion options sent as query
+        parameters, e.g. ``{"use_llm": False}``.
+        max_connections (int): Concurrent uploads and pooled connections.
+        poll_interval (float): First delay between result polls, in seconds.
+        max_poll_interval (float): Longest delay between result polls.
+        timeout (float): Seconds to wait for one document's result.
+        skip_if_cached (bool): Look files up by hash before uploading them.
+        max_server_errors (int): Consecutive 5xx answers to a result poll
+        tolerated before the document is reported as failed.
+
+        Returns:
+        AsyncIterator[DocumentResult]: Results in completion order.
+        """
+        connector = aiohttp.TCPConnector(limit=max_connections)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            if self.server_type is None:
+                async with session.get(f"{self.base_url}/health") as response:
+                    response.raise_for_status()
+                    self.server_type = HealthResponse(**(await response.json())).type
+
+            semaphore = asyncio.Semaphore(max_connections)
+            params = _query_params(options)
+            tasks = [
+                asyncio.create_task(
+                    self._aconvert_and_wait(
+                        session,
+                        semaphore,
+                        file_path,
+                        params,
+                        poll_interval,
+                        max_poll_interval,
+                        timeout,
+                        skip_if_cached,
+                        max_server_errors,
+                    )
+                )
+                for file_path in file_paths
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    yield await next_done
+            finally:
+                # The caller may stop iterating early
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _aconvert_and_wait(
+        self,
+        session: aiohttp.ClientSession,
+        semaphore: asyncio.Semaphore,
+        file_path: str,
+        params: Dict[str, str],
+        poll_interval: float,
+        max_poll_interval: float,
+        timeout: float,
+        skip_if_cached: bool,
+        max_server_errors: int,
+    ) -> DocumentResult:
+        start = time.monotonic()
+        task_id = None
+        try:
+            body = None
+            if skip_if_cached:
+                digest = await asyncio.to_thread(hash_file, file_path)
+                body = await self._alookup(session, digest, params)
+                if body is not None:
+                    logger.info(f"Server already has {file_path}, skipping upload")
+            if body is None:
+                async with semaphore:
+                    body = await self._aupload(session, file_path, params)
+
+            if self.server_type == ServerType.simple:
+                result = {
+                    "status": "ok" if body.get("status") == "Success" else "Error",
+                    "markdown": body.get("result"),
+                    "images": body.get("images"),
+                    "error": body.get("result"),
+                }
+            elif "result" in body:
+                # A lookup hit on a finished task
+                task_id = body["task_id"]
+                result = body["result"] or {}
+            else:
+                task_id = body["task_id"]
+                result = await asyncio.wait_for(
+                    self._apoll_task(
+                        session, task_id, poll_interval, max_poll_interval, max_server_errors
+                    ),
+                    timeout,
+                )
+
+            if result.get("status") == "ok":
+                return DocumentResult(
+                    file_path=file_path,
+                    status="Success",
+                    markdown=result.get("markdown"),
+                    images=result.get("images") or None,
+                    task_id=task_id,
+                    elapsed=time.monotonic() - start,
+                )
+            error = result.get("error", "Unknown error")
+        except asyncio.TimeoutError:
+            error = f"No result after {timeout}s"
+        except (aiohttp.ClientError, OSError, KeyError, ValueError) as e:
+            error = str(e)
+
+        logger.error(f"Failed to convert {file_path}: {error}")
+        return DocumentResult(
+            file_path=file_path,
+            status="Error",
+            error=error,
+            task_id=task_id,
+            elapsed=time.monotonic() - start,
+        )
+
+    async def _alookup(
+        self, session: aiohttp.ClientSession, sha256: str, params: Dict[str, str]
+    ) -> Optional[Dict[str, Any]]:
+        async with session.get(f"{self.base_url}/lookup/{sha256}", params=params) as response:
+            if response.status == 404:
+                return None
+            # The simple server can't attach to a running conversion without
+            # the upload, which it deduplicates against the running one
+            if response.status == 202 and self.server_type == ServerType.simple:
+                return None
             response.raise_for_status()
-            logger.info("Async batch conversion request successful")
-            return BatchConversionResponse(**(await response.json()))
+            return await response.json()
+
+    async def _aupload(
+        self, session: aiohttp.ClientSession, file_path: str, params: Dict[str, str]
+    ) -> Dict[str, Any]:
+        with open(file_path, "rb") as file:
+            # aiohttp streams file objects in chunks instead of reading them into memory
+            data = aiohttp.FormData()
+            data.add_field(self._file_field(), file, filename=os.path.basename(file_path))
+            logger.info(f"Uploading {file_path}")
+            async with session.post(
+                f"{self.base_url}{self._convert_endpoint()}", data=data, params=params
+            ) as response:
+                response.raise_for_status()
+                return await response.json()
+
+    async def _apoll_task(
+        self,
+        session: aiohttp.ClientSession,
+        task_id: str,
+        poll_interval: float,
+        max_poll_interval: float,
+        max_server_errors: int = 5,
+    ) -> Dict[str, Any]:
+        delay = poll_interval
+        server_errors = 0
+        while True:
+            try:
+                async with session.get(f"{self.base_url}/celery/result/{task_id}") as response:
+                    if response.status == 200:
+                        body = await response.json()
+                        if body.get("status") == "Error":
+                            return {"status": "Error", "error": body.get("error")}
+                        return body.get("result") or {}
+                    if response.status >= 500:
+                        # Retried with backoff, but an error that doesn't clear
+                        # shouldn't look like a slow conversion
+                        server_errors += 1
+                        if server_errors > max_server_errors:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info,
+                                response.history,
+                                status=response.status,
+                                message=await response.text(),
+                            )
+                        logger.warning(f"Polling task {task_id} got {response.status}, retrying")
+                    else:
+                        server_errors = 0
+                        if response.status != 202:
+                            response.raise_for_status()
+            except aiohttp.ClientConnectionError as e:
+                logger.warning(f"Polling task {task_id} failed, retrying: {e}")
+
+            # Back off with jitter so many pending tasks don't poll in lockstep
+            await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+            delay = min(delay * 2, max_poll_interval)
 
     def get_result(self, task_id: str) -> ConversionResponse:
         if self.server_type != ServerType.distributed:
@@ -2,75 +2,63 @@ import argparse
 import uvicorn
 import logging
 import os
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, Header, Query
+from fastapi import Path as FastAPIPath
+from fastapi import Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse
 from celery.exceptions import TimeoutError
 from fastapi.middleware.cors import CORSMiddleware
-from marker_api.celery_worker import celery_app
+from marker_api.celery_worker import broker_url, celery_app
+from marker_api.redis_pool import get_async_redis, pool_stats
+from marker_api.spool import spool_stats
 from marker_api.utils import print_markerapi_text_art
-from marker.logger import configure_logging
+from marker_api.artifacts import artifact_response
 from marker_api.celery_routes import (
     celery_convert_pdf,
     celery_result,
     celery_convert_pdf_concurrent_await,
     celery_convert_pdf_sync,
     celery_batch_convert,
+    celery_batch_items,
     celery_batch_result,
+    celery_batch_stream,
+    celery_dead_letters,
+    CELERY_MAX_UPLOAD_SIZE,
+    celery_finalize_upload,
+    celery_lookup,
+)
+from marker_api.uploads import (
+    create_upload,
+    discard_upload,
+    read_chunk,
+    upload_stats,
+    upload_status,
+    write_chunk,
 )
 # import gradio as gr
 # from marker_api.demo import demo_ui
+from marker_api.batch_results import MAX_PAGE_SIZE
 from marker_api.model.schema import (
     BatchConversionResponse,
+    BatchItemsResponse,
     BatchResultResponse,
     CeleryResultResponse,
     CeleryTaskResponse,
+    ConversionOptions,
     ConversionResponse,
     HealthResponse,
     ServerType,
+    UploadCreateRequest,
+    UploadStatus,
 )
-from typing import List
+from typing import List, Optional
 
-# Initialize logging
-configure_logging()
+# Initialize logging. marker's configure_logging isn't used: this process
+# only enqueues tasks and must not import marker (see tests/import_check.py)
+logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Add this after your imports
-import os
-import asyncio  # Add this import for the async sleep
-
-# Get Redis connection details from environment variables with flexible fallbacks
-REDIS_HOST = os.environ.get('REDIS_HOST', 'service-redis-084qf-health')
-REDIS_PORT = os.environ.get('REDIS_PORT', '3000')
-
-# Try multiple possible service names for Redis
-def get_working_broker_url():
-    """Try multiple possible Redis service names"""
-    possible_hosts = [
-        REDIS_HOST,
-        'service-redis-084qf-health',
-        'redis',
-        'redis.platform-service.svc.cluster.local',
-        'service-redis-084qf-health.platform-service.svc.cluster.local'
-    ]
-    
-    for host in possible_hosts:
-        broker_url = f"redis://{host}:{REDIS_PORT}/0"
-        try:
-            # Try to connect to this Redis
-            import redis
-            r = redis.Redis.from_url(broker_url, socket_connect_timeout=2)
-            if r.ping():
-                logger.info(f"Successfully connected to Redis at {host}")
-                return broker_url
-        except Exception as e:
-            logger.info(f"Failed to connect to Redis at {host}: {e}")
-    
-    # Default fallback
-    return f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
-
-# Set this as your broker URL - these will be used when celery_app is imported
-os.environ['CELERY_BROKER_URL'] = get_working_broker_url()
-os.environ['CELERY_RESULT_BACKEND'] = os.environ['CELERY_BROKER_URL']
+import asyncio
 
 # Define the base URL with health suffix
 APP_SUFFIX = os.environ.get("APP_SUFFIX", "health")
@@ -96,16 +84,18 @@ async def reconnect_celery_workers():
     
     while True:
         try:
-            # Check for active workers
+            # Check for active workers. The broadcasts block, so keep them off the loop
             i = celery_app.control.inspect()
-            workers = i.ping() or {}
+            workers = await asyncio.to_thread(i.ping) or {}
             
             if workers:
                 logger.info(f"Active Celery workers: {list(workers.keys())}")
             else:
                 logger.warning("No active Celery workers, attempting reconnection...")
                 # Force celery to reconnect to broker
-                celery_app.broker_connection().ensure_connection(max_retries=3)
+                await asyncio.to_thread(
+                    celery_app.broker_connection().ensure_connection, max_retries=3
+                )
                 
         except Exception as e:
             logger.error(f"Error checking Celery workers: {e}")
@@ -113,54 +103,13 @@ async def reconnect_celery_workers():
         # Sleep for 30 seconds before checking again
         await asyncio.sleep(30)
 
-def test_redis_connection():
-    from marker_api.celery_worker import redis_host, redis_port, broker_url
-    logger.info(f"Testing Redis connection to {broker_url}")
-    
-    try:
-        import redis
-        # If redis_host is a full URL, extract host and port
-        if isinstance(redis_host, str) and redis_host.startswith("redis://"):
-            from urllib.parse import urlparse
-            parsed_url = urlparse(redis_host)
-            actual_host = parsed_url.hostname
-            actual_port = parsed_url.port or 6379
-        else:
-            actual_host = redis_host
-            actual_port = int(redis_port)
-            
-        logger.info(f"Connecting to Redis at {actual_host}:{actual_port}")
-        
-        # Add connection timeout to avoid hanging if Redis is unreachable
-        r = redis.Redis(
-            host=actual_host, 
-            port=actual_port,
-            socket_timeout=5,
-            socket_connect_timeout=5
-        )
-        
-        # Perform ping with timeout
-        ping_result = r.ping()
-        logger.info(f"Redis ping result: {ping_result}")
-        return ping_result
-    except Exception as e:
-        logger.error(f"Redis connection error: {str(e)}")
-        # Return False but don't fail the application startup
-        return False
-
 @app.on_event("startup")
 async def startup_event():
     """Run tasks when the FastAPI app starts up"""
     logger.info("Running FastAPI startup tasks")
-    
-    # Start Redis connection test
-    test_redis_connection()
-    
-    # Start the worker reconnection task as a background task
-    import asyncio
-    from fastapi import BackgroundTasks
-    
-    background_tasks = BackgroundTasks()
+    # Redis was found when celery_worker was imported (marker_api.startup);
+    # nothing here blocks, workers are checked in the background
+    logger.info(f"Celery broker: {broker_url}")
     asyncio.create_task(reconnect_celery_workers())
     
     logger.info("Startup tasks scheduled")
@@ -246,6 +195,34 @@ def server():
     )
 
 
+@app.get("/livez")
+def livez():
+    """Liveness probe. The API process holds no models, so answering is enough."""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe. Ready when Redis, which carries tasks and results, answers."""
+    try:
+        await get_async_redis().ping()
+    except Exception as e:
+        return JSONResponse({"status": "unavailable", "error": str(e)}, status_code=503)
+    return {"status": "ready"}
+
+
+@app.get("/redis/stats")
+def redis_stats():
+    """Connections of this process's Redis pools, to size MARKER_REDIS_MAX_CONNECTIONS"""
+    return pool_stats(celery_app)
+
+
+@app.get("/spool/stats")
+def spool():
+    """Usage of the spool against its quota, and of the resumable uploads kept in it"""
+    return {**spool_stats(), "uploads": upload_stats()}
+
+
 # def is_celery_alive() -> bool:
 #     logger.debug("Checking if Celery is alive")
 #     try:
@@ -276,44 +253,20 @@ def is_celery_alive() -> bool:
         logger.warning(f"Error checking Celery workers: {str(e)}")
         return False
     
-def check_celery_with_retries(max_retries=3, retry_delay=5):
-    """Try to connect to Celery multiple times with delays between attempts"""
-    import time
-    
-    for attempt in range(max_retries):
-        logger.info(f"Celery connection attempt {attempt+1}/{max_retries}")
-        if is_celery_alive():
-            return True
-        if attempt < max_retries - 1:
-            logger.info(f"Waiting {retry_delay} seconds before retrying...")
-            time.sleep(retry_delay)
-    
-    return False
+def uploaded_document(
+    pdf_file: Optional[UploadFile] = File(None),
+    document_file: Optional[UploadFile] = File(None),
+) -> UploadFile:
+    """
+    The uploaded document. ``document_file``, the simple server's field name,
+    is accepted too: /health reports this server as simple while it has no
+    workers, and clients then send that name.
+    """
+    upload = pdf_file or document_file
+    if upload is None:
+        raise HTTPException(status_code=422, detail="No pdf_file (or document_file) uploaded")
+    return upload
 
-def test_celery_service_connection():
-    """Test direct TCP connection to the Celery worker service"""
-    import socket
-    
-    celery_service = os.environ.get('CELERY_WORKER_SERVICE', 'marker-celery-worker-9v1tr-health')
-    celery_port = 8080
-    
-    logger.info(f"Testing direct connection to {celery_service}:{celery_port}")
-    
-    try:
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(5)
-        result = sock.connect_ex((celery_service, celery_port))
-        sock.close()
-        
-        if result == 0:
-            logger.info(f"Successfully connected to {celery_service}:{celery_port}")
-            return True
-        else:
-            logger.warning(f"Could not connect to {celery_service}:{celery_port}, result code: {result}")
-            return False
-    except Exception as e:
-        logger.error(f"Error testing connection to Celery service: {str(e)}")
-        return False
 
 def setup_routes(app: FastAPI, celery_live: bool):
     logger.info("Setting up routes")
@@ -321,28 +274,114 @@ def setup_routes(app: FastAPI, celery_live: bool):
         logger.info("Adding Celery routes")
 
         @app.post("/convert", response_model=ConversionResponse)
-        async def convert_pdf(pdf_file: UploadFile = File(...)):
-            return await celery_convert_pdf_concurrent_await(pdf_file)
+        async def convert_pdf(
+            pdf_file: UploadFile = Depends(uploaded_document),
+            options: ConversionOptions = Depends(),
+            idempotency_key: Optional[str] = Header(None),
+        ):
+            return await celery_convert_pdf_concurrent_await(pdf_file, options, idempotency_key)
 
         @app.post("/celery/convert", response_model=CeleryTaskResponse)
-        async def celery_convert(pdf_file: UploadFile = File(...)):
-            return await celery_convert_pdf(pdf_file)
+        async def celery_convert(
+            pdf_file: UploadFile = Depends(uploaded_document),
+            options: ConversionOptions = Depends(),
+            idempotency_key: Optional[str] = Header(None),
+        ):
+            return await celery_convert_pdf(pdf_file, options, idempotency_key)
         
         @app.post("/celery/convert-sync", response_model=ConversionResponse)
-        async def convert_pdf_sync(pdf_file: UploadFile = File(...)):
-            return await celery_convert_pdf_sync(pdf_file)
+        async def convert_pdf_sync(
+            pdf_file: UploadFile = Depends(uploaded_document),
+            options: ConversionOptions = Depends(),
+            idempotency_key: Optional[str] = Header(None),
+        ):
+            return await celery_convert_pdf_sync(pdf_file, options, idempotency_key)
 
         @app.get("/celery/result/{task_id}", response_model=CeleryResultResponse)
         async def get_celery_result(task_id: str):
             return await celery_result(task_id)
 
         @app.post("/batch_convert", response_model=BatchConversionResponse)
-        async def batch_convert(pdf_files: List[UploadFile] = File(...)):
-            return await celery_batch_convert(pdf_files)
+        async def batch_convert(
+            pdf_files: List[UploadFile] = File(...),
+            options: ConversionOptions = Depends(),
+        ):
+            return await celery_batch_convert(pdf_files, options)
 
         @app.get("/batch_convert/result/{task_id}", response_model=BatchResultResponse)
-        async def get_batch_result(task_id: str):
-            return await celery_batch_result(task_id)
+        async def get_batch_result(
+            task_id: str,
+            offset: int = Query(0, ge=0),
+            limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        ):
+            return await celery_batch_result(task_id, offset, limit)
+
+        @app.get("/batch_convert/result/{task_id}/items", response_model=BatchItemsResponse)
+        async def get_batch_items(
+            task_id: str,
+            offset: int = Query(0, ge=0),
+            limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        ):
+            return await celery_batch_items(task_id, offset, limit)
+
+        @app.get("/batch_convert/result/{task_id}/stream")
+        async def stream_batch_results(task_id: str):
+            return await celery_batch_stream(task_id)
+
+        @app.api_route("/lookup/{sha256}", methods=["GET", "HEAD"])
+        async def lookup(
+            sha256: str = FastAPIPath(..., pattern="^[0-9a-f]{64}$"),
+            options: ConversionOptions = Depends(),
+        ):
+            return await celery_lookup(sha256, options)
+
+        @app.post("/uploads", response_model=UploadStatus, status_code=201)
+        def start_upload(request: UploadCreateRequest):
+            return create_upload(
+                request.filename, request.size, request.sha256, CELERY_MAX_UPLOAD_SIZE
+            )
+
+        @app.get("/uploads/{upload_id}", response_model=UploadStatus)
+        def get_upload(upload_id: str):
+            return upload_status(upload_id)
+
+        @app.head("/uploads/{upload_id}")
+        def head_upload(upload_id: str):
+            status = upload_status(upload_id)
+            return Response(
+                headers={
+                    "Upload-Offset": str(status["offset"]),
+                    "Upload-Length": str(status["size"]),
+                }
+            )
+
+        @app.put("/uploads/{upload_id}", response_model=UploadStatus)
+        async def put_upload_chunk(
+            upload_id: str, request: Request, offset: int = Query(..., ge=0)
+        ):
+            data = await read_chunk(request)
+            return await asyncio.to_thread(write_chunk, upload_id, offset, data)
+
+        @app.delete("/uploads/{upload_id}", status_code=204)
+        def delete_upload(upload_id: str):
+            upload_status(upload_id)
+            discard_upload(upload_id)
+
+        @app.post("/uploads/{upload_id}/finalize", response_model=CeleryTaskResponse)
+        async def finalize_upload_and_queue(
+            upload_id: str,
+            options: ConversionOptions = Depends(),
+            idempotency_key: Optional[str] = Header(None),
+        ):
+            return await celery_finalize_upload(upload_id, options, idempotency_key)
+
+        @app.get("/celery/dead-letters")
+        async def get_dead_letters(limit: int = Query(100, ge=1, le=1000)):
+            return await celery_dead_letters(limit)
+
+        @app.get("/artifacts/{artifact_id}")
+        def get_artifact(artifact_id: str, range: Optional[str] = Header(None)):
+            return artifact_response(artifact_id, range)
 
         logger.info("Adding real-time conversion route")
     else:
@@ -368,13 +407,9 @@ if __name__ == "__main__":
     print_markerapi_text_art()
     logger.info(f"Starting FastAPI app on {args.host}:{args.port}")
     
-    # Test connectivity, but proceed anyway
-    celery_alive = check_celery_with_retries(max_retries=2, retry_delay=5)
-    if not celery_alive:
-        logger.warning("Couldn't connect to Celery, setting up routes anyway")
-        celery_alive = True
-    
-    setup_routes(app, celery_alive)
+    # Routes are set up whether or not workers are up yet; tasks wait in the
+    # queue and reconnect_celery_workers reports on the workers
+    setup_routes(app, True)
     
     try:
         # No root_path here - it's already set in the FastAPI app
@@ -0,0 +1,156 @@
+import os
+import re
+import io
+import hashlib
+import tempfile
+import logging
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# Directory where extracted images are stored. In the distributed setup this
+# must be a volume shared by the Celery workers and the API server.
+ARTIFACT_DIR = os.environ.get(
+    "MARKER_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "marker_api_artifacts")
+)
+
+ARTIFACT_ID_PATTERN = re.compile(r"[0-9a-f]{64}\.(png|jpeg|jpg)")
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpeg": "image/jpeg",
+    "jpg": "image/jpeg",
+}
+
+
+def _artifact_path(artifact_id: str) -> str:
+    # Shard by hash prefix so a single directory doesn't grow unbounded
+    return os.path.join(ARTIFACT_DIR, artifact_id[:2], artifact_id)
+
+
+def store_artifact(data: bytes, extension: str = "png") -> str:
+    """
+    Store bytes in the content-addressed artifact store.
+
+    Args:
+    data (bytes): The raw artifact content.
+    extension (str): File extension used to derive the content type.
+
+    Returns:
+    str: The artifact ID (sha256 of the content plus extension).
+    """
+    artifact_id = f"{hashlib.sha256(data).hexdigest()}.{extension}"
+    path = _artifact_path(artifact_id)
+
+    # Identical content is only ever written once
+    if os.path.exists(path):
+        return artifact_id
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        # Atomic rename so readers never see a partially written artifact
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+
+    return artifact_id
+
+
+def store_image_artifact(image, filename: str) -> Optional[str]:
+    """
+    Encode a PIL image as PNG and store it in the artifact store.
+
+    Args:
+    image (PIL.Image.Image): The image to store.
+    filename (str): The image name, used for logging.
+
+    Returns:
+    Optional[str]: The artifact ID, or None if the image could not be stored.
+    """
+    try:
+        img_byte_arr = io.BytesIO()
+        image.save(img_byte_arr, format="PNG")
+        return store_artifact(img_byte_arr.getvalue(), "png")
+    except Exception as e:
+        logger.error(f"Error storing image artifact {filename}: {str(e)}")
+        return None
+
+
+def artifact_url(artifact_id: str) -> str:
+    return f"/artifacts/{artifact_id}"
+
+
+def _parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single-range ``Range: bytes=start-end`` header.
+
+    Returns the inclusive (start, end) byte range, or None if the range
+    cannot be satisfied.
+    """
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+
+    start_str, end_str = match.groups()
+    if start_str == "":
+        # Suffix range: the last N bytes
+        length = int(end_str)
+        if length == 0:
+            return None
+        start = max(size - length, 0)
+        end = size - 1
+    else:
+        start = int(start_str)
+        end = int(end_str) if end_str else size - 1
+        end = min(end, size - 1)
+
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+def artifact_response(artifact_id: str, range_header: Optional[str] = None) -> Response:
+    """
+    Build the HTTP response for an artifact, honouring single byte ranges.
+    """
+    if not ARTIFACT_ID_PATTERN.fullmatch(artifact_id):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+    path = _artifact_path(artifact_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+
+    size = os.path.getsize(path)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": f'"{artifact_id}"',
+        # Content-addressed, so the bytes behind an ID never change
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    media_type = CONTENT_TYPES[artifact_id.rsplit(".", 1)[1]]
+
+    if range_header:
+        byte_range = _parse_range(range_header, size)
+        if byte_range is None:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+
+        start, end = byte_range
+        with open(path, "rb") as f:
+            f.seek(start)
+            content = f.read(end - start + 1)
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        return Response(
+            content=content, status_code=206, headers=headers, media_type=media_type
+        )
+
+    with open(path, "rb") as f:
+        content = f.read()
+    return Response(content=content, headers=headers, media_type=media_type)
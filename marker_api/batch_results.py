@@ -0,0 +1,93 @@
+import os
+import json
+from typing import Any, Dict, List, Optional
+
+# Each finished document of a batch is stored on its own, so clients can page
+# through or stream results while the batch runs, and neither the worker nor
+# the API ever holds the whole batch's output.
+BATCH_PREFIX = "marker:batch:"
+# Like Celery's own results, batch items expire after a day by default
+BATCH_RESULT_TTL = int(os.environ.get("MARKER_BATCH_RESULT_TTL", 24 * 3600))
+# Items per page when the client doesn't ask for a page size, and the most it may ask for
+DEFAULT_PAGE_SIZE = int(os.environ.get("MARKER_BATCH_PAGE_SIZE", 20))
+MAX_PAGE_SIZE = 100
+
+
+def items_key(task_id: str) -> str:
+    """Hash of upload index -> JSON result"""
+    return f"{BATCH_PREFIX}{task_id}:items"
+
+
+def finished_key(task_id: str) -> str:
+    """List of upload indices in the order the documents finished"""
+    return f"{BATCH_PREFIX}{task_id}:finished"
+
+
+def status_key(task_id: str) -> str:
+    """Hash of upload index -> ``ok`` or ``Error``, small enough to summarize cheaply"""
+    return f"{BATCH_PREFIX}{task_id}:status"
+
+
+def total_key(task_id: str) -> str:
+    return f"{BATCH_PREFIX}{task_id}:total"
+
+
+def start_batch(client, task_id: str, total: int):
+    """Record the size of a batch before it is queued"""
+    client.set(total_key(task_id), total, ex=BATCH_RESULT_TTL)
+
+
+def batch_total(client, task_id: str) -> Optional[int]:
+    """The number of documents in a batch, or None for an unknown task"""
+    total = client.get(total_key(task_id))
+    return int(total) if total is not None else None
+
+
+def stored_indices(client, task_id: str) -> List[int]:
+    """Indices already stored, e.g. by a delivery of the batch that crashed"""
+    return [int(index) for index in client.hkeys(items_key(task_id))]
+
+
+def store_item(client, task_id: str, index: int, result: Dict[str, Any]):
+    """
+    Store one finished document of a batch.
+
+    Args:
+    client: Redis client.
+    task_id (str): The batch's task ID.
+    index (int): Position of the document in the upload.
+    result (Dict[str, Any]): The document's conversion result.
+    """
+    pipeline = client.pipeline()
+    pipeline.hset(items_key(task_id), str(index), json.dumps({"index": index, **result}))
+    pipeline.hset(status_key(task_id), str(index), result.get("status", "Error"))
+    pipeline.rpush(finished_key(task_id), index)
+    keys = (items_key(task_id), status_key(task_id), finished_key(task_id), total_key(task_id))
+    for key in keys:
+        pipeline.expire(key, BATCH_RESULT_TTL)
+    pipeline.execute()
+
+
+def finished_count(client, task_id: str) -> int:
+    return client.hlen(items_key(task_id))
+
+
+def get_items(client, task_id: str, offset: int, limit: int) -> List[Dict[str, Any]]:
+    """
+    The finished documents among upload positions ``offset`` to ``offset + limit - 1``.
+
+    Returns:
+    List[Dict[str, Any]]: Results in upload order, each with its ``index``.
+    Documents that haven't finished yet are left out.
+    """
+    if limit <= 0:
+        return []
+    fields = [str(index) for index in range(offset, offset + limit)]
+    return [json.loads(item) for item in client.hmget(items_key(task_id), fields) if item]
+
+
+def summarize(client, task_id: str, total: int) -> Dict[str, Any]:
+    """Counts of a finished batch; this, not the results, is the batch task's return value"""
+    statuses = client.hvals(status_key(task_id))
+    successful = sum(1 for status in statuses if status in (b"ok", "ok"))
+    return {"total": total, "successful": successful, "failed": len(statuses) - successful}
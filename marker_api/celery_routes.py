@@ -1,77 +1,383 @@
 from fastapi import UploadFile, File
+from marker_api.model.schema import ConversionOptions, ImageMode
+from celery import chain, states
 from celery.result import AsyncResult
-from fastapi.responses import JSONResponse
-from marker_api.celery_tasks import convert_document_to_markdown, process_batch
+from fastapi.responses import JSONResponse, StreamingResponse
+from marker_api.celery_tasks import (
+    assemble_document,
+    convert_document_to_markdown,
+    describe_pending_images,
+    fail_pipeline,
+    layout_pdf,
+    process_batch,
+)
+from marker_api.redis_pool import get_async_redis, get_redis
+# AsyncResults name the app explicitly: Celery's current app is per thread, and
+# in the threads blocking calls are moved to it is a default app without a backend
+from marker_api.celery_worker import BATCH_TIME_LIMIT, CONVERT_TIME_LIMIT, celery_app
+from marker_api.cost import (
+    Estimate,
+    estimate_batch,
+    estimate_conversion,
+    load_estimate,
+    store_estimate,
+)
+from marker_api.dedup import content_key, hash_key, request_keys
+from marker_api.dead_letter import list_dead_letters
+from marker_api.batch_results import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    batch_total,
+    finished_count,
+    finished_key,
+    get_items,
+    items_key,
+    start_batch,
+    total_key,
+)
+from marker_api.uploads import discard_upload, finalize_upload
 import logging
 import asyncio
-from typing import List
+import os
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# How long a submission stays attachable by content hash or idempotency key
+DEDUP_TTL = int(os.environ.get("MARKER_DEDUP_TTL", 3600))
+DEDUP_PREFIX = "marker:dedup:"
+# Marks a claimed task_id as being queued ("claimed") or sent ("queued"). A
+# PENDING task without it was never sent, e.g. because enqueueing failed.
+QUEUED_PREFIX = "marker:queued:"
+# How long a claim may take to be queued before it is considered abandoned
+CLAIM_GRACE = 60
 
-async def celery_convert_pdf(pdf_file: UploadFile = File(...)):
+# Run image description as its own stage on the VLM queue instead of inside
+# convert_pdf. Requires a worker consuming CELERY_VLM_QUEUE.
+SPLIT_PIPELINE = os.environ.get("MARKER_SPLIT_PIPELINE", "false").lower() == "true"
+
+# Largest resumable upload the distributed server accepts. The finished
+# document is read into memory and sent to the workers through Redis as a task
+# argument, so this is far below the simple server's MARKER_UPLOAD_MAX_SIZE.
+CELERY_MAX_UPLOAD_SIZE = int(os.environ.get("CELERY_MAX_UPLOAD_SIZE", 100 * 1024 * 1024))
+
+# How often a batch result stream checks for newly finished documents
+STREAM_POLL_INTERVAL = float(os.environ.get("MARKER_BATCH_STREAM_POLL_INTERVAL", 1))
+# A stream ends after this many seconds even if the batch hasn't finished, e.g.
+# because its worker died; by then the batch's hard time limit has passed
+STREAM_TIMEOUT = float(os.environ.get("MARKER_BATCH_STREAM_TIMEOUT", BATCH_TIME_LIMIT))
+
+
+def _task_options(estimate: Estimate) -> Dict[str, Any]:
+    """Per-task time limits and queue from the document's cost estimate"""
+    return {
+        "soft_time_limit": estimate.soft_time_limit,
+        "time_limit": estimate.time_limit,
+        "queue": estimate.queue,
+    }
+
+
+def _queue_conversion(
+    task_id: str, filename: str, contents: bytes, options: ConversionOptions, estimate: Estimate
+):
+    args = (filename, contents, options.model_dump(mode="json"))
+    if SPLIT_PIPELINE:
+        # The chain's result (and task_id) is that of its last task, so callers
+        # poll it exactly like a single convert_pdf task. The whole conversion's
+        # estimate bounds the layout stage, which is the larger part of it.
+        # If a stage fails, the tasks after it never run; the errback marks
+        # the last one failed so pollers and deduplication see the failure.
+        errback = fail_pipeline.s(task_id)
+        chain(
+            layout_pdf.s(*args).set(**_task_options(estimate)).on_error(errback),
+            describe_pending_images.s().on_error(errback),
+            assemble_document.s(),
+        ).apply_async(task_id=task_id)
+    else:
+        convert_document_to_markdown.apply_async(
+            args=args, task_id=task_id, **_task_options(estimate)
+        )
+
+
+def _estimate_fields(estimate: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not estimate:
+        return {}
+    return {
+        "estimated_seconds": estimate["estimated_seconds"],
+        "estimated_completion": estimate["estimated_completion"],
+    }
+
+
+def _wait_timeout(estimate: Optional[Dict[str, Any]]) -> float:
+    """How long the synchronous endpoints wait for a task before giving up"""
+    if not estimate:
+        return CONVERT_TIME_LIMIT
+    return estimate["queue_wait_seconds"] + estimate["time_limit"]
+
+
+def _is_reusable(task_id: str) -> bool:
+    """A previous submission can be reused unless it failed or was never queued"""
+    task = AsyncResult(task_id, app=celery_app)
+    if task.state in ("FAILURE", "REVOKED"):
+        return False
+    if task.state == "SUCCESS":
+        result = task.result
+        return not (isinstance(result, dict) and result.get("status") == "Error")
+    if task.state == "PENDING":
+        # Celery reports unknown task IDs as PENDING too
+        return bool(get_redis().exists(QUEUED_PREFIX + task_id))
+    return True
+
+
+def _task_outcome(task_id: str) -> Tuple[bool, bool, Any]:
+    """
+    Read a task's state and result. Blocking; the routes run it in a thread.
+
+    Returns:
+    Tuple[bool, bool, Any]: Whether the task finished, whether it failed, and
+    its return value, its exception if it failed, or its progress info while
+    it runs.
+    """
+    task = AsyncResult(task_id, app=celery_app)
+    if not task.ready():
+        return False, False, task.info
+    return True, task.state in states.PROPAGATE_STATES, task.get(propagate=False)
+
+
+def _error_text(exc: Any) -> str:
+    return str(exc) or type(exc).__name__
+
+
+def submit_conversion(
+    filename: str,
+    contents: bytes,
+    options: ConversionOptions,
+    idempotency_key: Optional[str] = None,
+) -> Tuple[str, bool, Optional[Dict[str, Any]]]:
+    """
+    Queue a conversion unless an identical one is already queued or running.
+
+    The task's time limits and queue come from the document's cost estimate.
+
+    Returns:
+    Tuple[str, bool, Optional[Dict[str, Any]]]: The task ID, whether an
+    existing task was reused, and the task's estimate (None if a reused task
+    has none stored).
+    """
+    keys = [
+        DEDUP_PREFIX + key
+        for key in request_keys(
+            content_key(contents, options.model_dump(mode="json")), idempotency_key
+        )
+    ]
+    client = get_redis()
+    task_id = str(uuid.uuid4())
+    # Lets concurrent submissions attach while this one is being queued
+    client.set(QUEUED_PREFIX + task_id, "claimed", ex=CLAIM_GRACE)
+
+    claimed = []
+    for key in keys:
+        # SET NX makes the claim atomic across API processes
+        if client.set(key, task_id, nx=True, ex=DEDUP_TTL):
+            claimed.append(key)
+            continue
+
+        existing = client.get(key)
+        existing = existing.decode() if isinstance(existing, bytes) else existing
+        if existing and _is_reusable(existing):
+            for other in claimed:
+                client.set(other, existing, ex=DEDUP_TTL)
+            logger.info(f"Attaching {filename} to existing task {existing}")
+            client.delete(QUEUED_PREFIX + task_id)
+            return existing, True, load_estimate(existing)
+
+        # The previous submission failed; take the key over
+        client.set(key, task_id, ex=DEDUP_TTL)
+        claimed.append(key)
+
+    try:
+        estimate = estimate_conversion(
+            filename, contents, options, stage="layout" if SPLIT_PIPELINE else "convert"
+        )
+        store_estimate(task_id, estimate, DEDUP_TTL)
+        _queue_conversion(task_id, filename, contents, options, estimate)
+    except Exception:
+        # Don't leave the keys pointing at a task that was never sent
+        client.delete(QUEUED_PREFIX + task_id, *claimed)
+        raise
+    client.set(QUEUED_PREFIX + task_id, "queued", ex=DEDUP_TTL)
+    return task_id, False, estimate.to_dict()
+
+
+def _conversion_response(result, options: ConversionOptions):
+    """Map a convert_pdf task result onto the ConversionResponse shape"""
+    # If result is a dict with status field
+    if isinstance(result, dict) and 'status' in result:
+        # If status is ok, return the markdown
+        if result['status'] == 'ok':
+            response = {"status": "Success", "result": result.get('markdown', '')}
+            if options.image_mode != ImageMode.none:
+                response["images"] = result.get("images", {})
+            if result.get("pages"):
+                response["pages"] = result["pages"]
+            if result.get("converted_pages"):
+                response["converted_pages"] = result["converted_pages"]
+            if result.get("timings"):
+                response["timings"] = result["timings"]
+            return response
+        # If status is Error, propagate the error
+        else:
+            return {"status": "Error", "result": result.get('error', 'Unknown error')}
+    # If result is just a string
+    elif isinstance(result, str):
+        return {"status": "Success", "result": result}
+    # If result is some other structure
+    else:
+        return {"status": "Success", "result": result}
+
+
+async def celery_convert_pdf(
+    pdf_file: UploadFile = File(...),
+    options: Optional[ConversionOptions] = None,
+    idempotency_key: Optional[str] = None,
+):
+    options = options or ConversionOptions()
     contents = await pdf_file.read()
-    task_id = convert_document_to_markdown.delay(pdf_file.filename, contents)
-    return {"task_id": str(task_id), "status": "Processing"}
+    task_id, deduplicated, estimate = await asyncio.to_thread(
+        submit_conversion, pdf_file.filename, contents, options, idempotency_key
+    )
+    return {
+        "task_id": task_id,
+        "status": "Processing",
+        "deduplicated": deduplicated,
+        **_estimate_fields(estimate),
+    }
 
 
 async def celery_result(task_id: str):
-    task = AsyncResult(task_id)
-    if not task.ready():
+    ready, failed, result = await asyncio.to_thread(_task_outcome, task_id)
+    if not ready:
         return JSONResponse(
             status_code=202, content={"task_id": str(task_id), "status": "Processing"}
         )
-    result = task.get()
+    if failed:
+        # e.g. a stage of the split pipeline raised; report it instead of a 500
+        return {"task_id": task_id, "status": "Error", "error": _error_text(result)}
     return {"task_id": task_id, "status": "Success", "result": result}
 
 
+async def celery_finalize_upload(
+    upload_id: str,
+    options: Optional[ConversionOptions] = None,
+    idempotency_key: Optional[str] = None,
+):
+    """Queue the conversion of a completed resumable upload, like ``/celery/convert``"""
+    options = options or ConversionOptions()
+    filename, path, _ = await asyncio.to_thread(finalize_upload, upload_id)
+    try:
+        with open(path, "rb") as f:
+            contents = await asyncio.to_thread(f.read)
+    finally:
+        discard_upload(upload_id, path)
+
+    task_id, deduplicated, estimate = await asyncio.to_thread(
+        submit_conversion, filename, contents, options, idempotency_key
+    )
+    return {
+        "task_id": task_id,
+        "status": "Processing",
+        "deduplicated": deduplicated,
+        **_estimate_fields(estimate),
+    }
+
+
+async def celery_lookup(sha256: str, options: Optional[ConversionOptions] = None):
+    """
+    Find the task for a document by the SHA-256 of its contents.
+
+    A hit lasts as long as the submission's deduplication entry (MARKER_DEDUP_TTL).
+    """
+    options = options or ConversionOptions()
+    key = DEDUP_PREFIX + request_keys(hash_key(sha256, options.model_dump(mode="json")))[-1]
+    task_id = await get_async_redis().get(key)
+    task_id = task_id.decode() if isinstance(task_id, bytes) else task_id
+    # Both read the result backend, so they run off the event loop
+    if not task_id or not await asyncio.to_thread(_is_reusable, task_id):
+        return JSONResponse(status_code=404, content={"status": "Not found"})
+
+    ready, failed, result = await asyncio.to_thread(_task_outcome, task_id)
+    if failed:
+        return JSONResponse(status_code=404, content={"status": "Not found"})
+    if not ready:
+        return JSONResponse(
+            status_code=202, content={"task_id": task_id, "status": "Processing"}
+        )
+    return {"task_id": task_id, "status": "Success", "result": result}
+
+
+async def celery_dead_letters(limit: int = 100):
+    entries = await asyncio.to_thread(list_dead_letters, get_redis(), limit)
+    return {"total": len(entries), "dead_letters": entries}
+
+
 async def celery_offline_root():
     return {"message": "Celery is offline. No API is available."}
 
 
-async def celery_convert_pdf_sync(pdf_file: UploadFile = File(...)):
+async def celery_convert_pdf_sync(
+    pdf_file: UploadFile = File(...),
+    options: Optional[ConversionOptions] = None,
+    idempotency_key: Optional[str] = None,
+):
+    options = options or ConversionOptions()
     contents = await pdf_file.read()
-    task = convert_document_to_markdown.delay(pdf_file.filename, contents)
+    task_id, _, estimate = await asyncio.to_thread(
+        submit_conversion, pdf_file.filename, contents, options, idempotency_key
+    )
+    task = AsyncResult(task_id, app=celery_app)
     try:
-        result = task.get(timeout=600)  # 10-minute timeout
-        # If result is a dict with status field
-        if isinstance(result, dict) and 'status' in result:
-            # If status is ok, return the markdown
-            if result['status'] == 'ok':
-                return {"status": "Success", "result": result.get('markdown', '')}
-            # If status is Error, propagate the error
-            else:
-                return {"status": "Error", "result": result.get('error', 'Unknown error')}
-        # If result is just a string
-        elif isinstance(result, str):
-            return {"status": "Success", "result": result}
-        # If result is some other structure
-        else:
-            return {"status": "Success", "result": result}
+        # Wait as long as the task may queue and run, not a fixed time
+        result = await asyncio.to_thread(task.get, timeout=_wait_timeout(estimate))
+        return _conversion_response(result, options)
     except Exception as e:
         logger.error(f"Error processing {pdf_file.filename}: {str(e)}")
         return {"status": "Error", "result": f"Failed to process document: {str(e)}"}
 
 
-async def celery_convert_pdf_concurrent_await(pdf_file: UploadFile = File(...)):
+async def celery_convert_pdf_concurrent_await(
+    pdf_file: UploadFile = File(...),
+    options: Optional[ConversionOptions] = None,
+    idempotency_key: Optional[str] = None,
+):
+    options = options or ConversionOptions()
     contents = await pdf_file.read()
 
-    # Start the Celery task
-    task = convert_document_to_markdown.delay(pdf_file.filename, contents)
+    # Start the Celery task, or attach to an identical one already running
+    task_id, _, estimate = await asyncio.to_thread(
+        submit_conversion, pdf_file.filename, contents, options, idempotency_key
+    )
 
     # Define an asynchronous function to check task status
     async def check_task_status():
         while True:
-            if task.ready():
-                return task.get()
+            ready, failed, result = await asyncio.to_thread(_task_outcome, task_id)
+            if ready:
+                return failed, result
             await asyncio.sleep(1)  # Wait for 1 second before checking again
 
     try:
         # Wait for the task to complete with a timeout
-        result = await asyncio.wait_for(
-            check_task_status(), timeout=600
-        )  # 10-minute timeout
-        return {"status": "Success", "result": result}
+        failed, result = await asyncio.wait_for(
+            check_task_status(), timeout=_wait_timeout(estimate)
+        )
+        if failed:
+            logger.error(f"Error processing {pdf_file.filename}: {_error_text(result)}")
+            return {
+                "status": "Error",
+                "result": f"Failed to process document: {_error_text(result)}",
+            }
+        return _conversion_response(result, options)
     except asyncio.TimeoutError:
         return JSONResponse(
             status_code=408,
@@ -124,26 +430,116 @@ async def celery_convert_pdf_concurrent_await(pdf_file: UploadFile = File(...)):
 #         )
 
 
-async def celery_batch_convert(pdf_files: List[UploadFile] = File(...)):
+async def celery_batch_convert(
+    pdf_files: List[UploadFile] = File(...),
+    options: Optional[ConversionOptions] = None,
+):
+    options = options or ConversionOptions()
     batch_data = []
     for pdf_file in pdf_files:
         contents = await pdf_file.read()
         batch_data.append((pdf_file.filename, contents))
 
     # Start a single task to process the entire batch
-    task = process_batch.delay(batch_data)
+    # Parsing every document for the estimate is CPU work; keep it off the event loop
+    estimate = await asyncio.to_thread(estimate_batch, batch_data, options)
+    task_id = str(uuid.uuid4())
+    await asyncio.to_thread(start_batch, get_redis(), task_id, len(batch_data))
+    task = process_batch.apply_async(
+        args=(batch_data, options.model_dump(mode="json")),
+        task_id=task_id,
+        **_task_options(estimate),
+    )
 
-    return {"task_id": str(task.id), "status": "Processing", "total": len(batch_data)}
+    return {
+        "task_id": str(task.id),
+        "status": "Processing",
+        "total": len(batch_data),
+        **_estimate_fields(estimate.to_dict()),
+    }
 
 
-async def celery_batch_result(task_id: str):
-    task = AsyncResult(task_id)
+def _page(offset: int, limit: Optional[int]) -> Tuple[int, int]:
+    limit = DEFAULT_PAGE_SIZE if limit is None else limit
+    return max(offset, 0), min(max(limit, 0), MAX_PAGE_SIZE)
 
-    if not task.ready():
+
+async def celery_batch_items(task_id: str, offset: int = 0, limit: Optional[int] = None):
+    """
+    One page of a batch's results, in upload order, while it runs or after.
+
+    Documents that haven't finished yet are missing from the page; ``finished``
+    tells how many have.
+    """
+    offset, limit = _page(offset, limit)
+    client = get_redis()
+    total = await asyncio.to_thread(batch_total, client, task_id)
+    if total is None:
+        return JSONResponse(status_code=404, content={"status": "Not found"})
+
+    items = await asyncio.to_thread(get_items, client, task_id, offset, limit)
+    done = await asyncio.to_thread(AsyncResult(task_id, app=celery_app).ready)
+    next_offset = offset + limit
+    return {
+        "task_id": task_id,
+        "status": "Success" if done else "Processing",
+        "total": total,
+        "finished": await asyncio.to_thread(finished_count, client, task_id),
+        "offset": offset,
+        "limit": limit,
+        "next_offset": next_offset if next_offset < total else None,
+        "items": items,
+    }
+
+
+async def celery_batch_stream(task_id: str):
+    """
+    Stream a batch's results as newline-delimited JSON, each document as soon
+    as it finishes. The stream ends once the batch has finished, or after
+    MARKER_BATCH_STREAM_TIMEOUT seconds.
+    """
+    client = get_async_redis()
+    total = await client.get(total_key(task_id))
+    if total is None:
+        return JSONResponse(status_code=404, content={"status": "Not found"})
+    total = int(total)
+
+    async def items():
+        cursor = 0
+        sent = set()
+        deadline = asyncio.get_running_loop().time() + STREAM_TIMEOUT
+        while len(sent) < total:
+            # Read the task state first so nothing stored before it finished is missed
+            done = await asyncio.to_thread(AsyncResult(task_id, app=celery_app).ready)
+            indices = await client.lrange(finished_key(task_id), cursor, -1)
+            cursor += len(indices)
+            # A redelivered batch may report an index twice
+            new = list(dict.fromkeys(int(i) for i in indices if int(i) not in sent))
+            if new:
+                values = await client.hmget(items_key(task_id), [str(i) for i in new])
+                for index, value in zip(new, values):
+                    if value:
+                        sent.add(index)
+                        yield value + b"\n" if isinstance(value, bytes) else value + "\n"
+            elif done:
+                break
+            elif asyncio.get_running_loop().time() > deadline:
+                logger.warning(f"Batch {task_id} stream timed out with {len(sent)}/{total} results")
+                break
+            else:
+                await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+    return StreamingResponse(items(), media_type="application/x-ndjson")
+
+
+async def celery_batch_result(task_id: str, offset: int = 0, limit: Optional[int] = None):
+    ready, failed, info = await asyncio.to_thread(_task_outcome, task_id)
+
+    if not ready:
         # Check if we can access task information
-        if task.info and isinstance(task.info, dict) and "current" in task.info:
-            current = task.info["current"]
-            total = task.info["total"]
+        if info and isinstance(info, dict) and "current" in info:
+            current = info["current"]
+            total = info["total"]
             return JSONResponse(
                 status_code=202,
                 content={
@@ -151,6 +547,7 @@ async def celery_batch_result(task_id: str):
                     "status": "Processing",
                     "progress": f"{current}/{total}",
                     "percent": round((current / total) * 100, 2),
+                    "finished": info.get("finished", []),
                 },
             )
         else:
@@ -162,17 +559,47 @@ async def celery_batch_result(task_id: str):
                 },
             )
 
+    if failed:
+        logger.error(f"Batch {task_id} failed: {_error_text(info)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "task_id": task_id,
+                "status": "Error",
+                "message": f"The batch failed: {_error_text(info)}",
+            },
+        )
+
     try:
-        results = task.get()
+        summary = info
+        if isinstance(summary, list):
+            # Batches queued before results were stored per document
+            return JSONResponse(
+                status_code=200,
+                content={
+                    "task_id": task_id,
+                    "status": "Success",
+                    "results": summary,
+                    "total": len(summary),
+                    "successful": sum(1 for r in summary if r.get("status") == "Success"),
+                    "failed": sum(1 for r in summary if r.get("status") == "Error"),
+                },
+            )
+
+        # Only one page of results is loaded; the rest are fetched with offset/limit
+        offset, limit = _page(offset, limit)
+        results = await asyncio.to_thread(get_items, get_redis(), task_id, offset, limit)
+        next_offset = offset + limit
         return JSONResponse(
             status_code=200,
             content={
                 "task_id": task_id,
                 "status": "Success",
                 "results": results,
-                "total": len(results),
-                "successful": sum(1 for r in results if r.get("status") == "Success"),
-                "failed": sum(1 for r in results if r.get("status") == "Error"),
+                **summary,
+                "offset": offset,
+                "limit": limit,
+                "next_offset": next_offset if next_offset < summary["total"] else None,
             },
         )
     except Exception as e:
@@ -1,22 +1,93 @@
 from celery import Task
-from marker_api.celery_worker import celery_app
+from celery.exceptions import SoftTimeLimitExceeded
+from marker_api.celery_worker import (
+    BATCH_SOFT_TIME_LIMIT,
+    BATCH_TIME_LIMIT,
+    CONVERT_SOFT_TIME_LIMIT,
+    CONVERT_TIME_LIMIT,
+    MAX_DELIVERIES,
+    celery_app,
+)
+from marker_api.dead_letter import (
+    clear_delivery,
+    dead_letter_if_poison,
+    record_dead_letter,
+)
+import base64
+import hashlib
 import io
 import logging
 import os
-import tempfile
-from pathlib import Path
-import asyncio
-from marker_api.utils import process_image_to_base64
-from celery.signals import worker_process_init
+import time
+from celery.signals import (
+    task_postrun,
+    task_prerun,
+    worker_process_init,
+    worker_process_shutdown,
+    worker_ready,
+    worker_shutdown,
+)
 
-from server import process_document
+from marker_api import devices, heartbeat
+from marker_api.batch_results import stored_indices, store_item, summarize
+from marker_api.cost import batch_order, record_duration, record_timeout
+from marker_api.model.schema import ConversionOptions
+from marker_api.redis_pool import get_redis
+from marker_api.spool import spooled, start_sweeper
+from marker_api.tracing import merge_timings, span, start_trace
+from marker_api.warmup import FAILED, warmup_state
+from marker_api.worker_loop import get_worker_loop, run_coroutine, stop_worker_loop
 
 logger = logging.getLogger(__name__)
 
 
 @worker_process_init.connect
 def initialize_models(**kwargs):
-    print("Worker process initialized")
+    # Pick this process's GPU before anything initializes CUDA
+    devices.assign_device()
+    # Start the process's persistent event loop before the first task arrives
+    get_worker_loop()
+    # Load the models and run a tiny document through them before taking tasks
+    run_coroutine(warmup_state.run())
+    if warmup_state.status == FAILED:
+        # A process that can't convert must not take documents; exit and let
+        # the pool replace it (the error is logged by the warm-up)
+        logger.error("Warm-up failed, exiting pool process")
+        devices.release_device()
+        os._exit(1)
+    devices.mark_loaded()
+    heartbeat.start_heartbeat(heartbeat.CHILD)
+    print(f"Worker process initialized ({warmup_state.to_dict()})")
+
+
+@worker_process_shutdown.connect
+def shutdown_event_loop(**kwargs):
+    stop_worker_loop()
+    heartbeat.stop_heartbeat()
+    devices.release_device()
+
+
+# Heartbeat files for the pod's health server (scripts/celery_health_check.py)
+@worker_ready.connect
+def start_main_heartbeat(**kwargs):
+    heartbeat.start_heartbeat(heartbeat.MAIN)
+    # Pool processes killed mid-task leave their spool files; the main process removes them
+    start_sweeper()
+
+
+@worker_shutdown.connect
+def stop_main_heartbeat(**kwargs):
+    heartbeat.stop_heartbeat()
+
+
+@task_prerun.connect
+def heartbeat_task_started(task=None, **kwargs):
+    heartbeat.task_started(task.name if task else "unknown")
+
+
+@task_postrun.connect
+def heartbeat_task_finished(**kwargs):
+    heartbeat.task_finished()
 
 
 class PDFConversionTask(Task):
@@ -29,30 +100,20 @@ class PDFConversionTask(Task):
         return self.run(*args, **kwargs)
 
 
-@celery_app.task(
-    ignore_result=False, bind=True, base=PDFConversionTask, name="convert_pdf"
-)
-def convert_document_to_markdown(self, filename, file_content):
+def _process_file(filename, file_content, process):
+    """
+    Write an uploaded document to the spool and run ``process`` on its path.
+
+    SoftTimeLimitExceeded is re-raised so the calling task can dead-letter the
+    document; every other error is reported in the result.
+    """
     try:
-        # Extract file extension from the filename
-        _, file_extension = os.path.splitext(filename)
-        
-        # Save content to a temporary file
-        temp_file = tempfile.NamedTemporaryFile(suffix=file_extension, delete=False)
-        temp_file_path = temp_file.name
-        temp_file.close()
-        
-        with open(temp_file_path, 'wb') as f:
-            f.write(file_content)
-        
-        # Process the document using your async function
-        markdown_text = asyncio.run(process_document(Path(temp_file_path)))
-        
-        return {
-            "filename": filename,
-            "markdown": markdown_text,  # Use a consistent field name
-            "status": "ok",
-        }
+        # The spool removes the file when done, and its sweeper does if this process dies
+        with spooled(filename, file_content) as path:
+            return {"filename": filename, "status": "ok", **process(path)}
+
+    except SoftTimeLimitExceeded:
+        raise
     
     except Exception as e:
         logger.error(f"Error processing {filename}: {str(e)}")
@@ -63,29 +124,336 @@ def convert_document_to_markdown(self, filename, file_content):
             "status": "Error",
             "error": str(e)
         }
-    
+
+
+# The API process imports this module to enqueue tasks, so the conversion
+# pipeline (marker, torch, boto3, PIL) is only imported inside the tasks
+
+
+def convert_file(filename, file_content, options=None):
+    """Convert one uploaded document, images included, and return the task result dict"""
+    from marker_api.routes import convert_document
+
+    options = ConversionOptions(**(options or {}))
+
+    def convert(path):
+        # Process the document on the worker's persistent event loop
+        result = run_coroutine(convert_document(path, options))
+        return {
+            "markdown": result["markdown"],  # Use a consistent field name
+            "images": result["images"],
+            "pages": result.get("pages"),
+            "converted_pages": result.get("converted_pages"),
+            "timings": result.get("timings"),
+        }
+
+    return _process_file(filename, file_content, convert)
+
+
+def layout_file(filename, file_content, options=None):
+    """
+    Run only the layout/OCR stage on an uploaded document.
+
+    The images that still need a VLM description are passed on as base64 PNG
+    in ``pending_images`` for the describe_images stage.
+    """
+    from marker_api.routes import collect_images, extract_document, find_images_to_describe
+    from marker_api.utils import process_image_to_base64
+
+    options = ConversionOptions(**(options or {}))
+
+    def layout(path):
+        with start_trace("layout_pdf", enabled=options.timings, file=filename) as trace:
+            extracted = run_coroutine(extract_document(path, options))
+            markdown_text, images = extracted["markdown"], extracted["images"]
+            pending = {}
+            if options.describe_images:
+                pending = find_images_to_describe(markdown_text, images)
+            with span("collect_images", image_mode=options.image_mode.value):
+                collected = collect_images(images, options.image_mode)
+        return {
+            "markdown": markdown_text,
+            "images": collected,
+            "pages": extracted["pages"],
+            "converted_pages": extracted["converted_pages"],
+            "pending_images": {
+                image_path: process_image_to_base64(image, image_path)
+                for image_path, image in pending.items()
+            },
+            "timings": trace.timings() if options.timings and trace else None,
+        }
+
+    return _process_file(filename, file_content, layout)
+
+
+def _dead_letter_result(filename, reason):
+    return {"filename": filename, "status": "Error", "error": reason}
+
+
+def _soft_time_limit(task, default):
+    """The soft time limit this task was sent with, or the task's default"""
+    _, soft = task.request.timelimit or (None, None)
+    return soft or default
+
+
+def _timed(filename, file_content, options, convert, stage="convert"):
+    """Run ``convert`` and add its duration to the cost history if it succeeded"""
+    started = time.perf_counter()
+    result = convert()
+    if result.get("status") == "ok":
+        record_duration(
+            filename,
+            file_content,
+            ConversionOptions(**(options or {})),
+            time.perf_counter() - started,
+            stage,
+        )
+    return result
+
+
+def _retry_with_static_limits(task, soft_limit, hard_limit):
+    """
+    Requeue a task cut off by an adaptive time limit, once, with the static ones.
+
+    An adaptive limit comes from a prediction, which can be wrong; only a
+    document that also runs out the static limit is treated as poison.
+
+    Returns:
+    bool: False if the task already ran with the static limits.
+    """
+    if _soft_time_limit(task, soft_limit) >= soft_limit:
+        return False
+    logger.warning(
+        f"Task {task.request.id} ran past its predicted time limit, retrying with {soft_limit}s"
+    )
+    raise task.retry(countdown=0, soft_time_limit=soft_limit, time_limit=hard_limit)
+
+
+def _run_guarded(task, filename, file_content, convert, options=None, stage="convert"):
+    """
+    Run ``convert`` for a single-document task with poison-document protection.
+    """
+    client = get_redis()
+    sha256 = hashlib.sha256(file_content).hexdigest()
+
+    # A document that keeps killing its worker is redelivered every time
+    # (acks_late); stop after MAX_DELIVERIES and dead-letter it
+    reason = dead_letter_if_poison(
+        client, task.request.id, filename, MAX_DELIVERIES, sha256=sha256
+    )
+    if reason:
+        return _dead_letter_result(filename, reason)
+
+    started = time.perf_counter()
+    try:
+        return convert()
+    except SoftTimeLimitExceeded:
+        record_timeout(
+            filename,
+            file_content,
+            ConversionOptions(**(options or {})),
+            time.perf_counter() - started,
+            stage,
+        )
+        _retry_with_static_limits(task, CONVERT_SOFT_TIME_LIMIT, CONVERT_TIME_LIMIT)
+        limit = _soft_time_limit(task, CONVERT_SOFT_TIME_LIMIT)
+        reason = f"Conversion exceeded the {limit}s time limit"
+        record_dead_letter(client, task.request.id, filename, reason, sha256=sha256)
+        return _dead_letter_result(filename, reason)
     finally:
-        # Clean up temporary file
-        if 'temp_file_path' in locals() and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
+        clear_delivery(client, task.request.id)
+
+
+@celery_app.task(
+    ignore_result=False,
+    bind=True,
+    base=PDFConversionTask,
+    name="convert_pdf",
+    soft_time_limit=CONVERT_SOFT_TIME_LIMIT,
+    time_limit=CONVERT_TIME_LIMIT,
+)
+def convert_document_to_markdown(self, filename, file_content, options=None):
+    return _run_guarded(
+        self,
+        filename,
+        file_content,
+        lambda: _timed(
+            filename, file_content, options, lambda: convert_file(filename, file_content, options)
+        ),
+        options,
+    )
 
 
+# Split pipeline: layout_pdf runs on the model workers, describe_images and
+# assemble_markdown run on the I/O-bound VLM queue (see task_routes).
 @celery_app.task(
-    ignore_result=False, bind=True, base=PDFConversionTask, name="process_batch"
+    ignore_result=False,
+    bind=True,
+    base=PDFConversionTask,
+    name="layout_pdf",
+    soft_time_limit=CONVERT_SOFT_TIME_LIMIT,
+    time_limit=CONVERT_TIME_LIMIT,
 )
-def process_batch(self, batch_data):
-    results = []
+def layout_pdf(self, filename, file_content, options=None):
+    return _run_guarded(
+        self,
+        filename,
+        file_content,
+        lambda: _timed(
+            filename,
+            file_content,
+            options,
+            lambda: layout_file(filename, file_content, options),
+            stage="layout",
+        ),
+        options,
+        stage="layout",
+    )
+
+
+@celery_app.task(name="fail_pipeline")
+def fail_pipeline(request, exc, traceback, final_task_id):
+    """
+    Errback of the split pipeline's stages: record the failure on the chain's
+    last task, whose ID the client polls and which would otherwise stay PENDING.
+    """
+    logger.error(f"Pipeline stage {request.id} failed, failing task {final_task_id}: {exc}")
+    celery_app.backend.mark_as_failure(final_task_id, exc, traceback, call_errbacks=False)
+
+
+@celery_app.task(ignore_result=False, base=PDFConversionTask, name="describe_images")
+def describe_pending_images(layout_result):
+    pending = layout_result.pop("pending_images", None) or {}
+    if layout_result.get("status") != "ok" or not pending:
+        return layout_result
+
+    from PIL import Image
+    from marker_api.routes import describe_images
+
+    images = {
+        image_path: Image.open(io.BytesIO(base64.b64decode(encoded)))
+        for image_path, encoded in pending.items()
+    }
+    # The layout stage's timings are only present if they were requested
+    timings = layout_result.get("timings")
+    with start_trace("describe_images", enabled=bool(timings)) as trace:
+        with span("describe_images"):
+            layout_result["descriptions"] = run_coroutine(describe_images(images))
+    if timings and trace:
+        layout_result["timings"] = merge_timings(timings, trace.timings())
+    return layout_result
+
+
+@celery_app.task(ignore_result=False, base=PDFConversionTask, name="assemble_markdown")
+def assemble_document(described_result):
+    from marker_api.routes import assemble_markdown
+
+    descriptions = described_result.pop("descriptions", None) or {}
+    if described_result.get("status") == "ok":
+        described_result["markdown"] = assemble_markdown(
+            described_result["markdown"], descriptions
+        )
+    return described_result
+
+
+@celery_app.task(
+    ignore_result=False,
+    bind=True,
+    base=PDFConversionTask,
+    name="process_batch",
+    soft_time_limit=BATCH_SOFT_TIME_LIMIT,
+    time_limit=BATCH_TIME_LIMIT,
+)
+def process_batch(self, batch_data, options=None):
+    """
+    Convert a batch of documents, storing each result in Redis as it finishes.
+
+    Returns:
+    Dict[str, Any]: The batch's counts. The results themselves are read
+    from marker_api.batch_results, page by page or as a stream.
+    """
+    client = get_redis()
+    task_id = self.request.id
     total = len(batch_data)
-    for i, (filename, file_content) in enumerate(batch_data, start=1):
-        try:
-            # Call the task directly with self
-            result = convert_document_to_markdown(self, filename, file_content)
-            results.append(result)
-        except Exception as e:
-            logger.error(f"Error processing {filename}: {str(e)}")
-            results.append({"filename": filename, "status": "Error", "error": str(e)})
-
-        # Update progress
-        self.update_state(state="PROGRESS", meta={"current": i, "total": total})
-
-    return results
\ No newline at end of file
+    reason = dead_letter_if_poison(
+        client,
+        task_id,
+        ", ".join(filename for filename, _ in batch_data),
+        MAX_DELIVERIES,
+    )
+    if reason:
+        for index, (filename, _) in enumerate(batch_data):
+            store_item(client, task_id, index, _dead_letter_result(filename, reason))
+        return summarize(client, task_id, total)
+
+    # A redelivered batch picks up where the crashed delivery stopped
+    stored = set(stored_indices(client, task_id))
+    pending = [index for index in range(total) if index not in stored]
+    # Convert the shortest documents first
+    order = [
+        pending[i]
+        for i in batch_order(
+            [batch_data[index] for index in pending], ConversionOptions(**(options or {}))
+        )
+    ]
+    finished = []
+    try:
+        for position, index in enumerate(order):
+            filename, file_content = batch_data[index]
+            started = time.perf_counter()
+            try:
+                result = _timed(
+                    filename,
+                    file_content,
+                    options,
+                    lambda: convert_file(filename, file_content, options),
+                )
+            except SoftTimeLimitExceeded:
+                record_timeout(
+                    filename,
+                    file_content,
+                    ConversionOptions(**(options or {})),
+                    time.perf_counter() - started,
+                )
+                # The retry resumes after the documents already stored
+                _retry_with_static_limits(self, BATCH_SOFT_TIME_LIMIT, BATCH_TIME_LIMIT)
+                limit = _soft_time_limit(self, BATCH_SOFT_TIME_LIMIT)
+                reason = f"Batch exceeded the {limit}s time limit"
+                record_dead_letter(
+                    client,
+                    task_id,
+                    filename,
+                    reason,
+                    sha256=hashlib.sha256(file_content).hexdigest(),
+                )
+                # Everything not converted yet is reported as failed
+                for remaining in order[position:]:
+                    store_item(
+                        client,
+                        task_id,
+                        remaining,
+                        _dead_letter_result(batch_data[remaining][0], reason),
+                    )
+                break
+            except Exception as e:
+                logger.error(f"Error processing {filename}: {str(e)}")
+                result = {"filename": filename, "status": "Error", "error": str(e)}
+
+            store_item(client, task_id, index, result)
+            # Report each finished document with the progress
+            finished.append(
+                {
+                    "index": index,
+                    "filename": filename,
+                    "status": "Success" if result.get("status") == "ok" else "Error",
+                    "error": result.get("error"),
+                }
+            )
+            self.update_state(
+                state="PROGRESS",
+                meta={"current": len(stored) + position + 1, "total": total, "finished": finished},
+            )
+    finally:
+        clear_delivery(client, task_id)
+
+    return summarize(client, task_id, total)
@@ -2,18 +2,17 @@ import os
 from celery import Celery
 import logging
 
+from marker_api.redis_pool import celery_pool_settings
+from marker_api.startup import resolve_broker_url
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Get Redis host
-redis_host = os.environ.get('REDIS_HOST', 'service-redis-084qf-health')
-redis_port = os.environ.get('REDIS_PORT', '3000')
-
-logger.info(f"Connecting to Redis at {redis_host}:{redis_port}")
-
-broker_url = f"redis://{redis_host}:{redis_port}/0"
-backend_url = f"redis://{redis_host}:{redis_port}/0"
+# Redis serves as both broker and result backend; see marker_api.startup for
+# how it is found
+broker_url = resolve_broker_url()
+backend_url = os.environ.get("CELERY_RESULT_BACKEND", broker_url)
 
 logger.info(f"Broker URL: {broker_url}")
 
@@ -24,7 +23,65 @@ celery_app = Celery(
     include=["marker_api.celery_tasks"],
 )
 
+# Time limits (seconds) for a single document and for a whole batch. The soft
+# limit raises SoftTimeLimitExceeded inside the task so it can record the
+# document as poison; the hard limit kills the process if that doesn't help.
+CONVERT_SOFT_TIME_LIMIT = int(os.environ.get("CELERY_CONVERT_SOFT_TIME_LIMIT", 1800))
+CONVERT_TIME_LIMIT = int(os.environ.get("CELERY_CONVERT_TIME_LIMIT", 1900))
+BATCH_SOFT_TIME_LIMIT = int(os.environ.get("CELERY_BATCH_SOFT_TIME_LIMIT", 7200))
+BATCH_TIME_LIMIT = int(os.environ.get("CELERY_BATCH_TIME_LIMIT", 7300))
+
+# Pool processes load the models and run the warm-up document before they
+# report as started. Celery kills a process that doesn't within this many
+# seconds (its default is 4), so it must cover the whole warm-up.
+PROC_ALIVE_TIMEOUT = float(os.environ.get("CELERY_WORKER_PROC_ALIVE_TIMEOUT", 600))
+
+# Unacked messages are redelivered after this many seconds. It is one setting
+# for the whole Redis transport, so it must outlast the longest task (a
+# batch), or running tasks would be executed twice. That only delays recovery
+# when a whole worker is lost (e.g. its node): a pool process that dies is
+# requeued right away through task_reject_on_worker_lost.
+VISIBILITY_TIMEOUT = int(
+    os.environ.get("CELERY_VISIBILITY_TIMEOUT", max(BATCH_TIME_LIMIT, CONVERT_TIME_LIMIT) + 600)
+)
+if VISIBILITY_TIMEOUT <= max(BATCH_TIME_LIMIT, CONVERT_TIME_LIMIT):
+    logger.warning(
+        f"CELERY_VISIBILITY_TIMEOUT ({VISIBILITY_TIMEOUT}s) is below the longest task time "
+        "limit; tasks running longer than it will be executed twice"
+    )
+
+# A message redelivered more often than this is treated as a poison document
+MAX_DELIVERIES = int(os.environ.get("CELERY_MAX_DELIVERIES", 3))
+
+# Queue for the network-bound image-description stages of the split pipeline,
+# consumed by a separate high-concurrency worker (e.g. --pool=threads)
+VLM_QUEUE = os.environ.get("CELERY_VLM_QUEUE", "vlm")
+
+pool_settings = celery_pool_settings()
+
+celery_app.conf.update(
+    # Ack only once the task has finished, and requeue it if the worker process
+    # dies mid-document (e.g. OOM kill) instead of silently losing it
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+    # Conversions are long; don't let one worker reserve documents it can't start
+    worker_prefetch_multiplier=int(os.environ.get("CELERY_WORKER_PREFETCH_MULTIPLIER", 1)),
+    worker_proc_alive_timeout=PROC_ALIVE_TIMEOUT,
+    task_soft_time_limit=CONVERT_SOFT_TIME_LIMIT,
+    task_time_limit=CONVERT_TIME_LIMIT,
+    broker_transport_options={
+        "visibility_timeout": VISIBILITY_TIMEOUT,
+        **pool_settings.pop("broker_transport_options"),
+    },
+    # Same connection limits as the shared pool (marker_api.redis_pool)
+    **pool_settings,
+    task_routes={
+        "describe_images": {"queue": VLM_QUEUE},
+        "assemble_markdown": {"queue": VLM_QUEUE},
+    },
+)
+
 @celery_app.task(name="celery.ping")
 def ping():
     logger.info("Ping task received!")
-    return "pong"
\ No newline at end of file
+    return "pong"
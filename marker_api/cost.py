@@ -0,0 +1,308 @@
+import os
+import json
+import logging
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from marker_api.celery_worker import (
+    BATCH_SOFT_TIME_LIMIT,
+    BATCH_TIME_LIMIT,
+    CONVERT_SOFT_TIME_LIMIT,
+    CONVERT_TIME_LIMIT,
+)
+from marker_api.model.schema import ConversionOptions
+from marker_api.redis_pool import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Set task time limits from the predicted conversion time instead of the fixed ones
+ADAPTIVE_TIMEOUTS = os.environ.get("MARKER_ADAPTIVE_TIMEOUTS", "true").lower() == "true"
+# Soft limit = prediction * factor + margin, but never below the minimum
+TIMEOUT_FACTOR = float(os.environ.get("MARKER_TIMEOUT_FACTOR", 3))
+TIMEOUT_MARGIN = int(os.environ.get("MARKER_TIMEOUT_MARGIN", 120))
+MIN_TIME_LIMIT = int(os.environ.get("MARKER_MIN_TIME_LIMIT", 300))
+# Documents predicted to take longer than this go to CELERY_LARGE_QUEUE, if set
+LARGE_QUEUE = os.environ.get("CELERY_LARGE_QUEUE", "")
+LARGE_DOCUMENT_SECONDS = float(os.environ.get("MARKER_LARGE_DOCUMENT_SECONDS", 600))
+DEFAULT_QUEUE = os.environ.get("CELERY_DEFAULT_QUEUE", "celery")
+# Tasks the workers run at once, to turn queue length into waiting time
+WORKER_SLOTS = int(os.environ.get("MARKER_COST_WORKER_SLOTS", 1))
+# Weight of the newest observation in the moving averages
+EWMA_ALPHA = float(os.environ.get("MARKER_COST_EWMA_ALPHA", 0.2))
+
+# Starting points until history has been recorded, in seconds
+OVERHEAD_SECONDS = 5.0
+DEFAULT_SECONDS_PER_UNIT = {True: 4.0, False: 1.5}  # keyed by use_llm
+# Work units: a page is 1, a described image adds 1, an extracted one 0.2, a MB 0.05
+DESCRIBED_IMAGE_UNITS = 1.0
+EXTRACTED_IMAGE_UNITS = 0.2
+MB_UNITS = 0.05
+# Convert a batch's shortest documents first instead of in upload order
+BATCH_SHORTEST_FIRST = os.environ.get("MARKER_BATCH_SHORTEST_FIRST", "true").lower() == "true"
+# Pages inspected for images; the count is extrapolated to the whole document
+IMAGE_SAMPLE_PAGES = 20
+
+COST_PREFIX = "marker:cost:"
+ESTIMATE_PREFIX = "marker:estimate:"
+
+
+@dataclass
+class DocumentFeatures:
+    pages: int
+    images: int
+    size_bytes: int
+
+
+@dataclass
+class Estimate:
+    predicted_seconds: float
+    soft_time_limit: int
+    time_limit: int
+    queue: str
+    queue_wait_seconds: float
+    estimated_seconds: float
+    estimated_completion: str
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @property
+    def wait_timeout(self) -> float:
+        """How long a caller should wait for the result before giving up"""
+        return self.queue_wait_seconds + self.time_limit
+
+
+def _selected_pages(count: int, options: ConversionOptions) -> int:
+    from marker_api.pages import MAX_PAGES, parse_page_range
+
+    pages = count
+    if options.page_range:
+        pages = len(parse_page_range(options.page_range, count))
+    limits = [limit for limit in (options.max_pages, MAX_PAGES) if limit]
+    return min([pages] + limits)
+
+
+def document_features(filename: str, contents: bytes, options: ConversionOptions) -> DocumentFeatures:
+    """Page and image counts of a document, cheap enough to compute before queuing it"""
+    size = len(contents)
+    if Path(filename).suffix.lower() != ".pdf":
+        return DocumentFeatures(pages=1, images=0, size_bytes=size)
+
+    # Only loaded when a PDF is estimated, to keep the API's startup light
+    import pypdfium2
+    import pypdfium2.raw as pdfium_c
+
+    try:
+        pdf = pypdfium2.PdfDocument(contents)
+    except pypdfium2.PdfiumError:
+        return DocumentFeatures(pages=1, images=0, size_bytes=size)
+    try:
+        count = len(pdf)
+        step = max(count // IMAGE_SAMPLE_PAGES, 1)
+        sampled = list(range(0, count, step))[:IMAGE_SAMPLE_PAGES]
+        images = 0
+        for index in sampled:
+            page = pdf[index]
+            try:
+                images += sum(
+                    1 for obj in page.get_objects(max_depth=2) if obj.type == pdfium_c.FPDF_PAGEOBJ_IMAGE
+                )
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+
+    pages = _selected_pages(count, options)
+    images_per_page = images / len(sampled) if sampled else 0
+    return DocumentFeatures(pages=pages, images=round(images_per_page * pages), size_bytes=size)
+
+
+def work_units(features: DocumentFeatures, options: ConversionOptions) -> float:
+    image_units = DESCRIBED_IMAGE_UNITS if options.describe_images else EXTRACTED_IMAGE_UNITS
+    if not options.extract_images:
+        image_units = 0
+    return (
+        features.pages
+        + features.images * image_units
+        + features.size_bytes / (1024 * 1024) * MB_UNITS
+    )
+
+
+def cost_profile(options: ConversionOptions, stage: str = "convert") -> str:
+    """Documents with the same profile share a conversion rate"""
+    describe = options.describe_images and stage == "convert"
+    return (
+        f"{stage}:llm={int(options.use_llm)}:describe={int(describe)}:fast={options.fast_path}"
+    )
+
+
+def _read_float(client, key: str, default: float) -> float:
+    value = client.get(key)
+    return float(value) if value is not None else default
+
+
+def _update_ewma(client, key: str, observation: float):
+    previous = client.get(key)
+    value = observation if previous is None else (
+        EWMA_ALPHA * observation + (1 - EWMA_ALPHA) * float(previous)
+    )
+    client.set(key, value)
+
+
+def _queue_wait(client, queue: str) -> float:
+    """Seconds until a new task on ``queue`` starts, from its length and the average task time"""
+    try:
+        queued = client.llen(queue)
+    except Exception:
+        return 0.0
+    average = _read_float(client, COST_PREFIX + "task_seconds", OVERHEAD_SECONDS)
+    return queued * average / max(WORKER_SLOTS, 1)
+
+
+def _limits(predicted: float, soft_cap: int, hard_cap: int) -> Tuple[int, int]:
+    if not ADAPTIVE_TIMEOUTS:
+        return soft_cap, hard_cap
+    soft = min(max(int(predicted * TIMEOUT_FACTOR) + TIMEOUT_MARGIN, MIN_TIME_LIMIT), soft_cap)
+    # Keep the configured gap between the soft and the hard limit
+    return soft, min(soft + (hard_cap - soft_cap), hard_cap)
+
+
+def _estimate(predicted: float, soft_cap: int, hard_cap: int, client) -> Estimate:
+    queue = LARGE_QUEUE if LARGE_QUEUE and predicted > LARGE_DOCUMENT_SECONDS else DEFAULT_QUEUE
+    soft, hard = _limits(predicted, soft_cap, hard_cap)
+    wait = _queue_wait(client, queue)
+    total = wait + predicted
+    completion = datetime.now(timezone.utc) + timedelta(seconds=total)
+    return Estimate(
+        predicted_seconds=round(predicted, 1),
+        soft_time_limit=soft,
+        time_limit=hard,
+        queue=queue,
+        queue_wait_seconds=round(wait, 1),
+        estimated_seconds=round(total, 1),
+        estimated_completion=completion.isoformat(timespec="seconds"),
+    )
+
+
+def predict_seconds(
+    filename: str, contents: bytes, options: ConversionOptions, stage: str = "convert", client=None
+) -> float:
+    """Predicted conversion time of one document from its features and the recorded rate"""
+    client = client or get_redis()
+    features = document_features(filename, contents, options)
+    rate = _read_float(
+        client, COST_PREFIX + cost_profile(options, stage), DEFAULT_SECONDS_PER_UNIT[options.use_llm]
+    )
+    return OVERHEAD_SECONDS + rate * work_units(features, options)
+
+
+def estimate_conversion(
+    filename: str, contents: bytes, options: ConversionOptions, stage: str = "convert"
+) -> Estimate:
+    """
+    Predict how long a document takes and derive its time limits and queue.
+
+    Args:
+    filename (str): Name of the document, for its type.
+    contents (bytes): The document.
+    options (ConversionOptions): The conversion options.
+    stage (str): ``convert``, or ``layout`` for the first task of the split pipeline.
+
+    Returns:
+    Estimate: Predicted seconds, time limits, queue and expected completion time.
+    """
+    client = get_redis()
+    predicted = predict_seconds(filename, contents, options, stage, client)
+    return _estimate(predicted, CONVERT_SOFT_TIME_LIMIT, CONVERT_TIME_LIMIT, client)
+
+
+def estimate_batch(batch_data: List[Tuple[str, bytes]], options: ConversionOptions) -> Estimate:
+    """Like estimate_conversion, for a batch converted one document after the other"""
+    client = get_redis()
+    predicted = sum(
+        predict_seconds(filename, contents, options, client=client)
+        for filename, contents in batch_data
+    )
+    return _estimate(predicted, BATCH_SOFT_TIME_LIMIT, BATCH_TIME_LIMIT, client)
+
+
+def batch_order(batch_data: List[Tuple[str, bytes]], options: ConversionOptions) -> List[int]:
+    """
+    The order to convert a batch's documents in: shortest predicted first.
+
+    Converting short documents first minimizes the batch's mean completion
+    time, so one large PDF no longer holds back every small one behind it.
+    Ties keep upload order.
+
+    Args:
+    batch_data (List[Tuple[str, bytes]]): The batch's (filename, contents) pairs.
+    options (ConversionOptions): The conversion options.
+
+    Returns:
+    List[int]: Indices into ``batch_data``, upload order if
+    MARKER_BATCH_SHORTEST_FIRST is off.
+    """
+    indices = list(range(len(batch_data)))
+    if not BATCH_SHORTEST_FIRST:
+        return indices
+
+    client = get_redis()
+
+    def cost(index: int) -> float:
+        filename, contents = batch_data[index]
+        try:
+            return predict_seconds(filename, contents, options, client=client)
+        except Exception as e:
+            logger.warning(f"Could not estimate {filename}, ordering it by size: {e}")
+            return len(contents) / (1024 * 1024)
+
+    costs = {index: cost(index) for index in indices}
+    return sorted(indices, key=lambda index: costs[index])
+
+
+def record_duration(
+    filename: str, contents: bytes, options: ConversionOptions, seconds: float, stage: str = "convert"
+):
+    """Fold an observed conversion time into the history used for predictions"""
+    try:
+        client = get_redis()
+        units = work_units(document_features(filename, contents, options), options)
+        rate = max(seconds - OVERHEAD_SECONDS, 0) / max(units, 1)
+        _update_ewma(client, COST_PREFIX + cost_profile(options, stage), rate)
+        _update_ewma(client, COST_PREFIX + "task_seconds", seconds)
+    except Exception as e:
+        # History is best effort; never fail a conversion over it
+        logger.warning(f"Could not record conversion time of {filename}: {e}")
+
+
+def record_timeout(
+    filename: str, contents: bytes, options: ConversionOptions, seconds: float, stage: str = "convert"
+):
+    """
+    Learn from a conversion cut off by its time limit after ``seconds``.
+
+    The real time is unknown but at least ``seconds``, so the profile's rate
+    is raised to at least what that implies instead of being averaged in.
+    Without this a rate that starts too low would never correct itself,
+    since only finished conversions are recorded.
+    """
+    try:
+        client = get_redis()
+        units = work_units(document_features(filename, contents, options), options)
+        key = COST_PREFIX + cost_profile(options, stage)
+        rate = max(seconds - OVERHEAD_SECONDS, 0) / max(units, 1)
+        client.set(key, max(rate, _read_float(client, key, 0)))
+        _update_ewma(client, COST_PREFIX + "task_seconds", seconds)
+    except Exception as e:
+        logger.warning(f"Could not record the time-out of {filename}: {e}")
+
+
+def store_estimate(task_id: str, estimate: Estimate, ttl: int):
+    get_redis().set(ESTIMATE_PREFIX + task_id, json.dumps(estimate.to_dict()), ex=ttl)
+
+
+def load_estimate(task_id: str) -> Optional[Dict[str, Any]]:
+    value = get_redis().get(ESTIMATE_PREFIX + task_id)
+    return json.loads(value) if value else None
@@ -0,0 +1,82 @@
+import json
+import time
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ATTEMPTS_PREFIX = "marker:attempts:"
+DEAD_LETTER_KEY = "marker:dead_letters"
+# Keep the dead-letter list bounded
+MAX_DEAD_LETTERS = 1000
+ATTEMPTS_TTL = 7 * 24 * 3600
+
+
+def register_delivery(client, task_id: str) -> int:
+    """
+    Count a delivery of a task message.
+
+    Redelivered messages keep their task ID, so the counter tells how many
+    times a worker has started (and possibly crashed on) the same document.
+
+    Returns:
+    int: The number of deliveries including this one.
+    """
+    key = ATTEMPTS_PREFIX + task_id
+    attempts = client.incr(key)
+    client.expire(key, ATTEMPTS_TTL)
+    return int(attempts)
+
+
+def clear_delivery(client, task_id: str):
+    """Forget the delivery counter once a task has finished"""
+    client.delete(ATTEMPTS_PREFIX + task_id)
+
+
+def record_dead_letter(client, task_id: str, filename: str, reason: str, **extra: Any):
+    """
+    Record a poison document that will not be retried.
+
+    Args:
+    client: Redis client.
+    task_id (str): The Celery task ID.
+    filename (str): The document's filename.
+    reason (str): Why the document was dead-lettered.
+    """
+    entry = {
+        "task_id": task_id,
+        "filename": filename,
+        "reason": reason,
+        "timestamp": time.time(),
+        **extra,
+    }
+    logger.error(f"Dead-lettering {filename} ({task_id}): {reason}")
+    client.lpush(DEAD_LETTER_KEY, json.dumps(entry))
+    client.ltrim(DEAD_LETTER_KEY, 0, MAX_DEAD_LETTERS - 1)
+
+
+def dead_letter_if_poison(
+    client, task_id: str, filename: str, max_deliveries: int, **extra: Any
+) -> Optional[str]:
+    """
+    Count this delivery and dead-letter the task if it was delivered too often.
+
+    With late acks a document that crashes its worker is redelivered every
+    time, so a task is considered poison once it exceeds ``max_deliveries``.
+
+    Returns:
+    Optional[str]: The dead-letter reason, or None if the task should run.
+    """
+    attempts = register_delivery(client, task_id)
+    if attempts <= max_deliveries:
+        return None
+
+    reason = f"Worker lost {attempts - 1} times while converting this document"
+    record_dead_letter(client, task_id, filename, reason, attempts=attempts - 1, **extra)
+    clear_delivery(client, task_id)
+    return reason
+
+
+def list_dead_letters(client, limit: int = 100) -> List[Dict[str, Any]]:
+    """Return the most recent dead-letter records, newest first"""
+    return [json.loads(entry) for entry in client.lrange(DEAD_LETTER_KEY, 0, limit - 1)]
@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def content_key(contents: bytes, options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Build the deduplication key for a conversion request.
+
+    Args:
+    contents (bytes): The uploaded document.
+    options (Dict[str, Any]): Options that change the conversion output.
+
+    Returns:
+    str: ``<sha256 of contents>:<short hash of options>``.
+    """
+    return hash_key(hashlib.sha256(contents).hexdigest(), options)
+
+
+def hash_key(digest: str, options: Optional[Dict[str, Any]] = None) -> str:
+    """Deduplication key for a document already hashed, e.g. by the client"""
+    options_digest = hashlib.sha256(
+        json.dumps(options or {}, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    return f"{digest}:{options_digest}"
+
+
+def request_keys(dedup_key: str, idempotency_key: Optional[str] = None) -> List[str]:
+    """Keys under which a submission is registered, most specific first"""
+    keys = [f"content:{dedup_key}"]
+    if idempotency_key:
+        keys.insert(0, f"idempotency:{idempotency_key}")
+    return keys
+
+
+class InflightRegistry:
+    """
+    In-process registry of running conversions for the simple server.
+
+    A duplicate submission awaits the future of the conversion that is already
+    running instead of converting the same document again.
+    """
+
+    def __init__(self):
+        self._futures: Dict[str, asyncio.Future] = {}
+
+    def get_or_start(
+        self, keys: List[str], factory: Callable[[], Awaitable[Any]]
+    ) -> Tuple[asyncio.Future, bool]:
+        """
+        Return the running future for any of ``keys`` or start a new one.
+
+        Returns:
+        Tuple[asyncio.Future, bool]: The future and whether it was deduplicated.
+        """
+        for key in keys:
+            future = self._futures.get(key)
+            if future is not None and not future.done():
+                for other in keys:
+                    self._futures.setdefault(other, future)
+                logger.info(f"Attaching duplicate submission to in-flight conversion {key}")
+                return future, True
+
+        future = asyncio.ensure_future(factory())
+        for key in keys:
+            self._futures[key] = future
+        future.add_done_callback(self._release)
+        return future, False
+
+    def running(self, key: str) -> bool:
+        """Whether a conversion registered under ``key`` is still running"""
+        future = self._futures.get(key)
+        return future is not None and not future.done()
+
+    def _release(self, future: asyncio.Future):
+        for key in [k for k, v in self._futures.items() if v is future]:
+            del self._futures[key]
+
+
+def result_size(result: Dict[str, Any]) -> int:
+    """Approximate memory of a conversion result: its markdown and inline images"""
+    images = result.get("images") or {}
+    return len(result.get("markdown") or "") + sum(len(image) for image in images.values())
+
+
+class ResultCache:
+    """
+    In-process LRU cache of finished conversions for the simple server,
+    keyed like the in-flight registry.
+
+    Bounded both by entries and by the total ``result_size`` of the cached
+    results; a result larger than ``max_bytes`` on its own isn't cached.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.used_bytes = 0
+        self._results: "OrderedDict[str, Tuple[Any, int]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._results.get(key)
+        if entry is None:
+            return None
+        self._results.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: str, result: Any):
+        size = result_size(result)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        if key in self._results:
+            self.used_bytes -= self._results.pop(key)[1]
+        self._results[key] = (result, size)
+        self.used_bytes += size
+        while len(self._results) > self.max_entries or self.used_bytes > self.max_bytes:
+            _, (_, evicted) = self._results.popitem(last=False)
+            self.used_bytes -= evicted
+
+    def __len__(self) -> int:
+        return len(self._results)
@@ -0,0 +1,234 @@
+import os
+import json
+import fcntl
+import logging
+import tempfile
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Pin every worker process to one GPU, spreading processes by free memory
+DEVICE_ASSIGNMENT = os.environ.get("MARKER_DEVICE_ASSIGNMENT", "true").lower() == "true"
+# Pretend there are this many GPUs (CPU-only testing of the assignment)
+SIMULATED_DEVICES = int(os.environ.get("MARKER_SIMULATED_DEVICES", 0))
+SIMULATED_DEVICE_MEMORY_MB = int(os.environ.get("MARKER_SIMULATED_DEVICE_MEMORY_MB", 16384))
+# GPU memory one process's models take, counted against a device until they are loaded
+MODEL_MEMORY_MB = int(os.environ.get("MARKER_MODEL_MEMORY_MB", 5000))
+# Assignments of the processes on this host, shared through a locked file
+DEVICE_DIR = os.environ.get(
+    "MARKER_DEVICE_DIR", os.path.join(tempfile.gettempdir(), "marker_api_devices")
+)
+
+# The devices this host's processes share, before assign_device narrows
+# CUDA_VISIBLE_DEVICES down to one
+_VISIBLE_DEVICES = os.environ.get("CUDA_VISIBLE_DEVICES")
+
+_assigned: Optional["Device"] = None
+
+
+@dataclass
+class Device:
+    index: int
+    # What CUDA_VISIBLE_DEVICES must be set to for this device
+    cuda_id: str
+    name: str
+    total_mb: int
+    free_mb: int
+    utilization_pct: Optional[int] = None
+    simulated: bool = False
+    processes: List[int] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def _visible_ids() -> Optional[List[str]]:
+    if _VISIBLE_DEVICES is None:
+        return None
+    return [v.strip() for v in _VISIBLE_DEVICES.split(",") if v.strip()]
+
+
+def _nvml_devices() -> List[Device]:
+    try:
+        import pynvml
+    except ImportError:
+        return []
+    try:
+        pynvml.nvmlInit()
+    except pynvml.NVMLError:
+        return []
+
+    try:
+        visible = _visible_ids()
+        if visible is None:
+            visible = [str(i) for i in range(pynvml.nvmlDeviceGetCount())]
+
+        devices = []
+        for index, cuda_id in enumerate(visible):
+            if cuda_id.isdigit():
+                handle = pynvml.nvmlDeviceGetHandleByIndex(int(cuda_id))
+            else:
+                handle = pynvml.nvmlDeviceGetHandleByUUID(cuda_id)
+            memory = pynvml.nvmlDeviceGetMemoryInfo(handle)
+            try:
+                utilization = pynvml.nvmlDeviceGetUtilizationRates(handle).gpu
+            except pynvml.NVMLError:
+                utilization = None
+            name = pynvml.nvmlDeviceGetName(handle)
+            devices.append(
+                Device(
+                    index=index,
+                    cuda_id=cuda_id,
+                    name=name.decode() if isinstance(name, bytes) else name,
+                    total_mb=memory.total // (1024**2),
+                    free_mb=memory.free // (1024**2),
+                    utilization_pct=utilization,
+                )
+            )
+        return devices
+    finally:
+        pynvml.nvmlShutdown()
+
+
+def _simulated_devices(assignments: Dict[int, Dict[str, Any]]) -> List[Device]:
+    # Like NVML, free memory only drops once a process has loaded its models
+    devices = []
+    for index in range(SIMULATED_DEVICES):
+        loaded = sum(1 for a in assignments.values() if a["device"] == index and a["loaded"])
+        devices.append(
+            Device(
+                index=index,
+                cuda_id=str(index),
+                name=f"simulated-{index}",
+                total_mb=SIMULATED_DEVICE_MEMORY_MB,
+                free_mb=max(SIMULATED_DEVICE_MEMORY_MB - loaded * MODEL_MEMORY_MB, 0),
+                simulated=True,
+            )
+        )
+    return devices
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class _Assignments:
+    """The host's assignment file, locked for the duration of the ``with`` block"""
+
+    def __enter__(self) -> Dict[int, Dict[str, Any]]:
+        os.makedirs(DEVICE_DIR, exist_ok=True)
+        self._file = open(os.path.join(DEVICE_DIR, "assignments.json"), "a+")
+        fcntl.flock(self._file, fcntl.LOCK_EX)
+        self._file.seek(0)
+        try:
+            data = {int(pid): a for pid, a in json.loads(self._file.read() or "{}").items()}
+        except json.JSONDecodeError:
+            data = {}
+        # Forget processes that exited without releasing their device
+        self.data = {pid: a for pid, a in data.items() if _alive(pid)}
+        return self.data
+
+    def __exit__(self, *exc):
+        try:
+            self._file.seek(0)
+            self._file.truncate()
+            json.dump({str(pid): a for pid, a in self.data.items()}, self._file)
+            self._file.flush()
+        finally:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+
+
+def list_devices() -> List[Device]:
+    """The visible GPUs (or simulated ones) with their memory, utilization and assigned processes"""
+    with _Assignments() as assignments:
+        devices = _simulated_devices(assignments) if SIMULATED_DEVICES else _nvml_devices()
+    for device in devices:
+        device.processes = sorted(pid for pid, a in assignments.items() if a["device"] == device.index)
+    return devices
+
+
+def assign_device() -> Optional[Device]:
+    """
+    Pin this process to the device with the most free memory.
+
+    Memory of processes that were assigned a device but haven't loaded their
+    models yet is counted as used, so processes starting at the same time
+    spread across devices. Must run before torch initializes CUDA; sets
+    CUDA_VISIBLE_DEVICES (and TORCH_DEVICE for marker) for this process.
+
+    Returns:
+    Optional[Device]: The assigned device, or None without GPUs or if
+    MARKER_DEVICE_ASSIGNMENT is off.
+    """
+    global _assigned
+
+    if not DEVICE_ASSIGNMENT or _assigned is not None:
+        return _assigned
+
+    with _Assignments() as assignments:
+        if SIMULATED_DEVICES:
+            devices = _simulated_devices(assignments)
+        else:
+            devices = _nvml_devices()
+        if not devices:
+            return None
+
+        def available(device: Device) -> int:
+            pending = sum(
+                1
+                for a in assignments.values()
+                if a["device"] == device.index and not a["loaded"]
+            )
+            return device.free_mb - pending * MODEL_MEMORY_MB
+
+        device = max(devices, key=available)
+        assignments[os.getpid()] = {"device": device.index, "loaded": False}
+
+    if not device.simulated:
+        # NVML numbers devices in PCI bus order; make CUDA do the same
+        os.environ["CUDA_DEVICE_ORDER"] = "PCI_BUS_ID"
+        os.environ["CUDA_VISIBLE_DEVICES"] = device.cuda_id
+        os.environ["TORCH_DEVICE"] = "cuda"
+    os.environ["MARKER_ASSIGNED_DEVICE"] = str(device.index)
+    logger.info(
+        f"Process {os.getpid()} assigned to device {device.index} ({device.name}, {device.free_mb} MB free)"
+    )
+    _assigned = device
+    return device
+
+
+def mark_loaded():
+    """Record that this process's models are on its device, so its free memory reflects them"""
+    if _assigned is None:
+        return
+    with _Assignments() as assignments:
+        if os.getpid() in assignments:
+            assignments[os.getpid()]["loaded"] = True
+
+
+def release_device():
+    """Give up this process's assignment on a clean shutdown"""
+    global _assigned
+
+    if _assigned is None:
+        return
+    with _Assignments() as assignments:
+        assignments.pop(os.getpid(), None)
+    _assigned = None
+
+
+def device_stats() -> Dict[str, Any]:
+    """Per-device utilization for the stats endpoints"""
+    return {
+        "assignment": DEVICE_ASSIGNMENT,
+        "simulated": bool(SIMULATED_DEVICES),
+        "devices": [device.to_dict() for device in list_devices()],
+    }
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Each worker process keeps a small JSON file here up to date. The pod's health
+# server reads them instead of broadcasting inspect() to the whole cluster.
+HEARTBEAT_DIR = os.environ.get(
+    "MARKER_HEARTBEAT_DIR", os.path.join(tempfile.gettempdir(), "marker_api_heartbeat")
+)
+HEARTBEAT_INTERVAL = float(os.environ.get("MARKER_HEARTBEAT_INTERVAL", 10))
+# A heartbeat older than this means the process is stuck or gone
+HEARTBEAT_MAX_AGE = float(os.environ.get("MARKER_HEARTBEAT_MAX_AGE", 3 * HEARTBEAT_INTERVAL))
+
+MAIN = "main"
+CHILD = "child"
+
+_state: Dict[str, Any] = {}
+_state_pid: Optional[int] = None
+_lock = threading.Lock()
+# Set once the reading process (the health server) has seen a main heartbeat,
+# so a worker that disappears afterwards reads as dead rather than starting
+_main_seen = False
+
+
+def _reset_lock():
+    global _lock
+    # The main process's heartbeat thread may hold the lock while a pool process is forked
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_lock)
+
+
+def _path(pid: int) -> str:
+    return os.path.join(HEARTBEAT_DIR, f"{pid}.json")
+
+
+def _write():
+    os.makedirs(HEARTBEAT_DIR, exist_ok=True)
+    path = _path(os.getpid())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({**_state, "updated": time.time()}, f)
+    os.replace(tmp_path, path)
+
+
+def beat(**changes: Any):
+    """Update this process's heartbeat, e.g. ``beat(state="busy", task=name)``"""
+    global _state, _state_pid
+
+    with _lock:
+        if _state_pid != os.getpid():
+            # Forked pool processes start from a clean state
+            _state = {"pid": os.getpid(), "role": CHILD, "state": "idle", "tasks_done": 0}
+            _state_pid = os.getpid()
+        _state.update(changes)
+        try:
+            _write()
+        except OSError as e:
+            logger.warning(f"Could not write heartbeat: {e}")
+
+
+def task_started(task_name: str):
+    beat(state="busy", task=task_name, task_started=time.time())
+
+
+def task_finished():
+    with _lock:
+        done = _state.get("tasks_done", 0) + 1 if _state_pid == os.getpid() else 1
+    beat(state="idle", task=None, task_started=None, tasks_done=done, last_task_finished=time.time())
+
+
+def start_heartbeat(role: str = CHILD):
+    """Write the heartbeat now and then every HEARTBEAT_INTERVAL seconds from a daemon thread"""
+    beat(role=role)
+
+    def run():
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            beat()
+
+    threading.Thread(target=run, name="heartbeat", daemon=True).start()
+
+
+def stop_heartbeat():
+    """Remove this process's heartbeat file on a clean shutdown"""
+    try:
+        os.unlink(_path(os.getpid()))
+    except FileNotFoundError:
+        pass
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _remove(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def read_heartbeats() -> List[Dict[str, Any]]:
+    """
+    Heartbeats of the worker processes on this host, each with ``alive``.
+
+    Files of dead pool processes are removed. A dead main process's file is
+    kept (so the worker reads as dead, not as starting) until a new main
+    process is running.
+    """
+    heartbeats = []
+    if not os.path.isdir(HEARTBEAT_DIR):
+        return heartbeats
+    for name in os.listdir(HEARTBEAT_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(HEARTBEAT_DIR, name)
+        try:
+            with open(path) as f:
+                heartbeat = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        heartbeat["alive"] = _alive(heartbeat["pid"])
+        if not heartbeat["alive"] and heartbeat.get("role") != MAIN:
+            _remove(path)
+            continue
+        heartbeat["path"] = path
+        heartbeats.append(heartbeat)
+
+    if any(h["alive"] for h in heartbeats if h.get("role") == MAIN):
+        for heartbeat in [h for h in heartbeats if not h["alive"]]:
+            _remove(heartbeat["path"])
+            heartbeats.remove(heartbeat)
+    for heartbeat in heartbeats:
+        del heartbeat["path"]
+    return heartbeats
+
+
+def worker_health() -> Dict[str, Any]:
+    """
+    Summarize the local worker's heartbeats.
+
+    Returns:
+    Dict[str, Any]: ``status`` is ``starting`` until the worker's main process
+    has written a heartbeat, ``ok`` while it is fresh and ``stale`` once it is
+    older than MARKER_HEARTBEAT_MAX_AGE. It is ``dead`` if the main process
+    has exited, or its heartbeat disappeared after this process had seen it.
+    Busy processes, finished tasks and the longest-running task are reported
+    alongside.
+    """
+    global _main_seen
+
+    now = time.time()
+    heartbeats = read_heartbeats()
+    main = [h for h in heartbeats if h.get("role") == MAIN]
+    if not main:
+        status = "dead" if _main_seen else "starting"
+    elif not any(h["alive"] for h in main):
+        status = "dead"
+    elif all(now - h["updated"] > HEARTBEAT_MAX_AGE for h in main):
+        status = "stale"
+    else:
+        status = "ok"
+    _main_seen = _main_seen or bool(main)
+
+    busy = [h for h in heartbeats if h.get("state") == "busy"]
+    finished = [h["last_task_finished"] for h in heartbeats if h.get("last_task_finished")]
+    return {
+        "status": status,
+        "processes": len(heartbeats),
+        "busy": len(busy),
+        "stale_processes": sum(1 for h in heartbeats if now - h["updated"] > HEARTBEAT_MAX_AGE),
+        "tasks_done": sum(h.get("tasks_done", 0) for h in heartbeats),
+        "seconds_since_last_task": round(now - max(finished), 1) if finished else None,
+        "longest_running_task_seconds": round(max(now - h["task_started"] for h in busy), 1)
+        if busy
+        else None,
+    }
@@ -0,0 +1,382 @@
+"""
+Convert a directory or JSONL manifest of documents offline, without the API.
+
+    marker-ingest ./corpus ./out --workers 2
+    marker-ingest manifest.jsonl ./out --options '{"use_llm": false}'
+
+Each manifest line is a JSON object with a ``path`` (relative to the
+manifest), and optionally an ``id`` naming the output and per-document
+``options``. Outputs are written as soon as each document finishes, and
+finished documents are recorded in a checkpoint in the output directory, so
+rerunning the same command after a crash only converts what is left.
+"""
+import os
+import sys
+import json
+import time
+import base64
+import logging
+import argparse
+import multiprocessing
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from marker_api.model.schema import ConversionOptions, ImageMode, OutputFormat
+from marker_api.pages import parse_page_range, pdf_page_count
+
+logger = logging.getLogger(__name__)
+
+# Formats marker can convert
+DEFAULT_EXTENSIONS = (".pdf", ".png", ".jpg", ".jpeg", ".docx", ".pptx", ".xlsx", ".html", ".epub")
+CHECKPOINT_NAME = "ingest_checkpoint.jsonl"
+OUTPUT_EXTENSIONS = {
+    OutputFormat.markdown: ".md",
+    OutputFormat.json: ".json",
+    OutputFormat.html: ".html",
+}
+
+
+@dataclass
+class IngestItem:
+    doc_id: str
+    source: str
+    options: Dict[str, Any] = field(default_factory=dict)
+
+
+def scan_directory(directory: Path, extensions: Iterable[str]) -> List[IngestItem]:
+    """Every document below ``directory``, named by its relative path"""
+    extensions = {e.lower() for e in extensions}
+    items = []
+    for path in sorted(directory.rglob("*")):
+        if path.is_file() and path.suffix.lower() in extensions:
+            items.append(IngestItem(path.relative_to(directory).as_posix(), str(path)))
+    return items
+
+
+def read_manifest(manifest: Path) -> List[IngestItem]:
+    """Documents listed in a JSONL manifest"""
+    items = []
+    with open(manifest) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line)
+            if "path" not in entry:
+                raise ValueError(f"{manifest}:{line_number}: entry has no 'path'")
+            path = Path(entry["path"])
+            if not path.is_absolute():
+                path = manifest.parent / path
+            if entry.get("id"):
+                doc_id = entry["id"]
+                if Path(doc_id).is_absolute() or ".." in Path(doc_id).parts:
+                    raise ValueError(f"{manifest}:{line_number}: id must be a relative path")
+            else:
+                try:
+                    doc_id = path.resolve().relative_to(manifest.parent.resolve()).as_posix()
+                except ValueError:
+                    doc_id = path.name
+            items.append(IngestItem(doc_id, str(path), entry.get("options") or {}))
+    return items
+
+
+def load_checkpoint(checkpoint: Path) -> Dict[str, Dict[str, Any]]:
+    """Last recorded outcome of each document, keyed by document ID"""
+    records = {}
+    if not checkpoint.exists():
+        return records
+    with open(checkpoint) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash mid-write leaves a truncated last line
+                continue
+            records[record["id"]] = record
+    return records
+
+
+def _write_atomic(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_outputs(
+    output_dir: Path, item: IngestItem, result: Dict[str, Any], options: ConversionOptions
+) -> str:
+    """
+    Write a document's output, its images and a metadata sidecar.
+
+    Returns:
+    str: The output file, relative to ``output_dir``.
+    """
+    output = output_dir / f"{item.doc_id}{OUTPUT_EXTENSIONS[options.output_format]}"
+    _write_atomic(output, result["markdown"].encode("utf-8"))
+
+    if options.image_mode == ImageMode.inline:
+        # Decode the images next to the document instead of embedding base64
+        image_dir = output_dir / f"{item.doc_id}_images"
+        for name, image in result["images"].items():
+            if image:
+                _write_atomic(image_dir / Path(name).name, base64.b64decode(image))
+        images = sorted(Path(name).name for name in result["images"])
+    else:
+        images = result["images"]
+
+    meta = {
+        "source": item.source,
+        "images": images,
+        "pages": result.get("pages"),
+        "converted_pages": result.get("converted_pages"),
+        "timings": result.get("timings"),
+    }
+    _write_atomic(
+        output_dir / f"{item.doc_id}.meta.json", json.dumps(meta, indent=2).encode("utf-8")
+    )
+    return output.relative_to(output_dir).as_posix()
+
+
+def _init_worker():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(processName)s - %(message)s")
+    from marker_api.devices import assign_device, mark_loaded
+    from marker_api.warmup import warmup_state
+    from marker_api.worker_loop import run_coroutine
+
+    # Spread the workers over the GPUs, then load the models once per worker
+    assign_device()
+    run_coroutine(warmup_state.run())
+    mark_loaded()
+
+
+def _convert(source: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    from marker_api.routes import convert_document
+    from marker_api.worker_loop import run_coroutine
+
+    start = time.perf_counter()
+    result = run_coroutine(convert_document(Path(source), ConversionOptions(**options)))
+    if result.get("converted_pages"):
+        page_count = len(parse_page_range(result["converted_pages"]))
+    elif source.lower().endswith(".pdf"):
+        page_count = pdf_page_count(Path(source))
+    else:
+        page_count = None
+    return {"result": result, "pages": page_count, "seconds": time.perf_counter() - start}
+
+
+class Throughput:
+    """Running totals for progress reports"""
+
+    def __init__(self, total: int, report_interval: float):
+        self.total = total
+        self.report_interval = report_interval
+        self.start = time.perf_counter()
+        self.last_report = self.start
+        self.done = 0
+        self.failed = 0
+        self.pages = 0
+
+    def record(self, ok: bool, pages: Optional[int]):
+        if ok:
+            self.done += 1
+            self.pages += pages or 0
+        else:
+            self.failed += 1
+        now = time.perf_counter()
+        if now - self.last_report >= self.report_interval:
+            self.last_report = now
+            logger.info(self.summary())
+
+    def summary(self) -> str:
+        elapsed = max(time.perf_counter() - self.start, 1e-9)
+        finished = self.done + self.failed
+        rate = finished / elapsed
+        remaining = (self.total - finished) / rate if rate else float("inf")
+        return (
+            f"{finished}/{self.total} documents ({self.failed} failed) in {elapsed:.0f}s: "
+            f"{self.done / elapsed * 60:.1f} docs/min, {self.pages / elapsed:.2f} pages/s, "
+            f"~{remaining:.0f}s left"
+        )
+
+
+def ingest(
+    items: List[IngestItem],
+    output_dir: Path,
+    options: Dict[str, Any],
+    workers: int = 1,
+    retry_failed: bool = True,
+    report_interval: float = 30.0,
+) -> Throughput:
+    """
+    Convert documents with a pool of worker processes.
+
+    Args:
+    items (List[IngestItem]): The documents to convert.
+    output_dir (Path): Where outputs and the checkpoint are written.
+    options (Dict[str, Any]): Conversion options for every document; a
+        document's own options take precedence.
+    workers (int): Worker processes. Each loads its own copy of the models.
+    retry_failed (bool): Convert documents that failed in a previous run again.
+    report_interval (float): Seconds between progress reports.
+
+    Returns:
+    Throughput: Totals of this run.
+    """
+    seen = set()
+    for item in items:
+        if item.doc_id in seen:
+            raise ValueError(f"Two documents would both be written as {item.doc_id!r}")
+        seen.add(item.doc_id)
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint = output_dir / CHECKPOINT_NAME
+    previous = load_checkpoint(checkpoint)
+    skip_statuses = {"done"} if retry_failed else {"done", "failed"}
+    todo = [item for item in items if previous.get(item.doc_id, {}).get("status") not in skip_statuses]
+    logger.info(
+        f"{len(items)} documents, {len(items) - len(todo)} already in the checkpoint, "
+        f"{len(todo)} to convert with {workers} workers"
+    )
+
+    stats = Throughput(len(todo), report_interval)
+    if not todo:
+        return stats
+
+    # CUDA can't be used in forked children
+    context = multiprocessing.get_context("spawn")
+
+    def new_pool() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=_init_worker
+        )
+
+    queue = iter(todo)
+    pending = {}
+    # Documents that were in flight when a worker process died. Any of them
+    # may have killed it, so they are rerun one at a time to find out which.
+    suspects = deque()
+    isolating = False
+    executor = new_pool()
+    with open(checkpoint, "a") as checkpoint_file:
+
+        def record_result(record: Dict[str, Any]):
+            # The outputs are in place before the checkpoint says so
+            checkpoint_file.write(json.dumps(record) + "\n")
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+            stats.record(record["status"] == "done", record.get("pages"))
+
+        try:
+            while True:
+                if suspects:
+                    isolating = True
+                    if not pending:
+                        item, item_options = suspects.popleft()
+                        future = executor.submit(_convert, item.source, item_options)
+                        pending[future] = (item, item_options)
+                else:
+                    isolating = False
+                    # Keep a couple of documents queued per worker, not the whole corpus
+                    while len(pending) < workers * 2:
+                        item = next(queue, None)
+                        if item is None:
+                            break
+                        item_options = {**options, **item.options}
+                        future = executor.submit(_convert, item.source, item_options)
+                        pending[future] = (item, item_options)
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                broken = any(isinstance(f.exception(), BrokenProcessPool) for f in finished)
+                if broken:
+                    # Every document still in the pool fails with it
+                    finished, _ = wait(pending)
+                for future in finished:
+                    item, item_options = pending.pop(future)
+                    record = {"id": item.doc_id, "source": item.source, "time": time.time()}
+                    try:
+                        converted = future.result()
+                        record["output"] = write_outputs(
+                            output_dir, item, converted["result"], ConversionOptions(**item_options)
+                        )
+                        record.update(
+                            status="done",
+                            pages=converted["pages"],
+                            seconds=round(converted["seconds"], 2),
+                        )
+                    except BrokenProcessPool as e:
+                        if not isolating:
+                            suspects.append((item, item_options))
+                            continue
+                        logger.error(f"Worker process died converting {item.source}")
+                        record.update(status="failed", error=f"Worker process died: {e}")
+                    except Exception as e:
+                        logger.error(f"Failed to convert {item.source}: {e}")
+                        record.update(status="failed", error=str(e))
+                    record_result(record)
+
+                if broken:
+                    logger.warning(
+                        f"A worker process died; restarting the pool. {len(suspects)} "
+                        f"documents that were in flight are rerun one at a time"
+                    )
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    executor = new_pool()
+        finally:
+            executor.shutdown()
+
+    logger.info(f"Finished: {stats.summary()}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Convert a directory or JSONL manifest of documents offline."
+    )
+    parser.add_argument("source", type=Path, help="Directory of documents or .jsonl manifest")
+    parser.add_argument("output_dir", type=Path, help="Where to write outputs and the checkpoint")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each with its own models")
+    parser.add_argument(
+        "--options", type=json.loads, default={}, help='Conversion options as JSON, e.g. \'{"use_llm": false}\''
+    )
+    parser.add_argument(
+        "--extensions",
+        default=",".join(DEFAULT_EXTENSIONS),
+        help="File extensions to pick up from a directory",
+    )
+    parser.add_argument(
+        "--skip-failed", action="store_true", help="Don't retry documents that failed in a previous run"
+    )
+    parser.add_argument("--report-interval", type=float, default=30.0, help="Seconds between progress reports")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    # Fail on bad options before starting any workers
+    ConversionOptions(**args.options)
+
+    if args.source.is_dir():
+        items = scan_directory(args.source, args.extensions.split(","))
+    else:
+        items = read_manifest(args.source)
+
+    stats = ingest(
+        items,
+        args.output_dir,
+        args.options,
+        workers=args.workers,
+        retry_failed=not args.skip_failed,
+        report_interval=args.report_interval,
+    )
+    sys.exit(1 if stats.failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,47 @@ class ServerType(str, Enum):
     distributed = "distributed"
 
 
+class ImageMode(str, Enum):
+    none = "none"
+    inline = "inline"
+    artifact = "artifact"
+
+
+class OutputFormat(str, Enum):
+    markdown = "markdown"
+    json = "json"
+    html = "html"
+
+
+class ConversionOptions(BaseModel):
+    """Per-request conversion options, accepted as query parameters"""
+
+    use_llm: bool = Field(True, description="Run marker's LLM processors")
+    extract_images: bool = Field(True, description="Extract images from the document")
+    describe_images: bool = Field(
+        True, description="Describe images without an LLM description using the VLM endpoint"
+    )
+    image_mode: ImageMode = Field(
+        ImageMode.none, description="How extracted images are returned"
+    )
+    output_format: OutputFormat = Field(
+        OutputFormat.markdown, description="Format of the converted text"
+    )
+    fast_path: Optional[bool] = Field(
+        None,
+        description="Extract born-digital PDF pages from the text layer (defaults to MARKER_FAST_PATH)",
+    )
+    page_range: Optional[str] = Field(
+        None,
+        pattern=r"^\s*\d{1,6}(\s*-\s*\d{1,6})?(\s*,\s*\d{1,6}(\s*-\s*\d{1,6})?)*\s*$",
+        description="Zero-based pages to convert, e.g. '0-4,10'",
+    )
+    max_pages: Optional[int] = Field(
+        None, ge=1, description="Convert at most this many pages (capped by MARKER_MAX_PAGES)"
+    )
+    timings: bool = Field(False, description="Include a per-stage timing breakdown")
+
+
 class HealthResponse(BaseModel):
     message: str
     type: ServerType
@@ -46,30 +87,85 @@ class GeneralMetadata(BaseModel):
 class PDFConversionResult(BaseModel):
     filename: str
     markdown: str
-    metadata: GeneralMetadata
-    images: Dict[str, str]
+    metadata: GeneralMetadata = Field(default_factory=GeneralMetadata)
+    images: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Base64 PNG images (inline mode) or artifact URLs (artifact mode)",
+    )
     status: str
 
 
+class PageTriageResult(BaseModel):
+    page: int = Field(..., description="Zero-based page index")
+    path: str = Field(..., description="'text' (text layer) or 'marker' (layout/OCR/LLM)")
+    reason: str
+
+
 class ConversionResponse(BaseModel):
     status: str
     result: Optional[str] = None
+    images: Optional[Dict[str, str]] = None
+    pages: Optional[List[PageTriageResult]] = Field(
+        None, description="Extraction path of each page, if the fast path triaged the document"
+    )
+    converted_pages: Optional[str] = Field(
+        None, description="Pages converted, if not the whole document"
+    )
+    timings: Optional[Dict[str, Any]] = Field(
+        None, description="Per-stage timing breakdown, if requested with ?timings=true"
+    )
+
+
+class UploadCreateRequest(BaseModel):
+    filename: str
+    size: int = Field(..., gt=0, description="Total size of the document in bytes")
+    sha256: Optional[str] = Field(
+        None, pattern="^[0-9a-fA-F]{64}$", description="Checked when the upload is finalized"
+    )
+
+
+class UploadStatus(BaseModel):
+    upload_id: str
+    filename: str
+    size: int
+    offset: int = Field(..., description="Bytes received so far; the next chunk starts here")
+    complete: bool
 
 
 class CeleryTaskResponse(BaseModel):
     task_id: str
     status: str
+    deduplicated: bool = Field(
+        False, description="True if the request attached to an existing task"
+    )
+    estimated_seconds: Optional[float] = Field(
+        None, description="Predicted seconds until the result is ready, queueing included"
+    )
+    estimated_completion: Optional[str] = Field(
+        None, description="Predicted completion time (ISO 8601, UTC)"
+    )
 
 
 class CeleryResultResponse(BaseModel):
     task_id: str
     status: str
     result: Optional[PDFConversionResult] = None
+    error: Optional[str] = Field(None, description="Why the task failed, if status is Error")
 
 
 class BatchConversionResponse(BaseModel):
     task_id: str
     status: str
+    estimated_seconds: Optional[float] = None
+    estimated_completion: Optional[str] = None
+
+
+class BatchItemStatus(BaseModel):
+    """A finished document of a running batch"""
+    index: int = Field(..., description="Position of the file in the upload")
+    filename: str
+    status: str
+    error: Optional[str] = None
 
 
 class BatchResultResponse(BaseModel):
@@ -79,3 +175,28 @@ class BatchResultResponse(BaseModel):
     completed: Optional[int] = None
     total: Optional[int] = None
     progress: Optional[str] = None
+    finished: Optional[List[BatchItemStatus]] = Field(
+        None, description="Documents finished so far, while the batch is running"
+    )
+    successful: Optional[int] = None
+    failed: Optional[int] = None
+    offset: Optional[int] = None
+    limit: Optional[int] = None
+    next_offset: Optional[int] = Field(
+        None, description="Offset of the next page of results, None on the last page"
+    )
+
+
+class BatchItemsResponse(BaseModel):
+    """A page of a batch's results, available while the batch is still running"""
+    task_id: str
+    status: str
+    total: int
+    finished: int = Field(..., description="Documents finished so far")
+    offset: int
+    limit: int
+    next_offset: Optional[int] = None
+    items: List[Dict[str, Any]] = Field(
+        default_factory=list,
+        description="Finished documents in this page, in upload order, each with its index",
+    )
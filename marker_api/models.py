@@ -0,0 +1,134 @@
+import os
+import copy
+import logging
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+from marker.config.parser import ConfigParser
+from marker.converters.pdf import PdfConverter
+from marker.models import create_model_dict
+
+from marker_api.model.schema import ConversionOptions
+from marker_api.pages import parse_page_range
+from marker_api.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Converters kept per process, one per distinct set of conversion options
+CONVERTER_POOL_SIZE = int(os.environ.get("MARKER_CONVERTER_POOL_SIZE", 8))
+# Conversions running at once per process. They share the models (and the
+# GPU), so raise it only if the device has room for several documents.
+CONVERTER_CONCURRENCY = int(os.environ.get("MARKER_CONVERTER_CONCURRENCY", 1))
+_convert_semaphore = threading.BoundedSemaphore(CONVERTER_CONCURRENCY)
+
+_model_dict: Optional[Dict[str, Any]] = None
+_model_lock = threading.Lock()
+
+
+def get_model_dict() -> Dict[str, Any]:
+    """
+    Return marker's model dict, loading the models on first use.
+
+    The models are loaded once per process and shared by every converter.
+    """
+    global _model_dict
+
+    with _model_lock:
+        if _model_dict is None:
+            with span("model_dict"):
+                logger.info("Loading marker models")
+                _model_dict = create_model_dict()
+        return _model_dict
+
+
+def converter_config(use_llm: bool, extract_images: bool, output_format: str) -> Dict[str, Any]:
+    """marker config for a set of conversion options"""
+    load_dotenv()
+    config = {
+        "output_format": output_format,
+        "use_llm": use_llm,
+        "disable_image_extraction": not extract_images,
+        "process_images_with_llm": use_llm and extract_images,
+    }
+    if use_llm:
+        config.update(
+            {
+                "llm_service": "marker.services.openrouter.OpenRouterService",
+                "aws_access_key_id": os.environ['SAGEMAKER_AWS_ACCESS_KEY_ID'],
+                "aws_secret_access_key": os.environ['SAGEMAKER_AWS_SECRET_ACCESS_KEY'],
+            }
+        )
+    return config
+
+
+@lru_cache(maxsize=CONVERTER_POOL_SIZE)
+def _build_converter(use_llm: bool, extract_images: bool, output_format: str) -> PdfConverter:
+    with span("config"):
+        # Use ConfigParser to handle service initialization
+        config_parser = ConfigParser(converter_config(use_llm, extract_images, output_format))
+        llm_service = config_parser.get_llm_service()
+
+    artifact_dict = get_model_dict()
+    with span("converter_build"):
+        logger.info(
+            f"Building converter (use_llm={use_llm}, extract_images={extract_images}, "
+            f"output_format={output_format})"
+        )
+        return PdfConverter(
+            artifact_dict=artifact_dict,
+            config=config_parser.generate_config_dict(),
+            llm_service=llm_service,
+        )
+
+
+def get_converter(options: ConversionOptions) -> PdfConverter:
+    """
+    Return a converter for the given options from the process's converter pool.
+
+    Converters are shared; run them through ``convert``, which passes the
+    per-document settings and limits how many run at once.
+
+    Args:
+    options (ConversionOptions): The options of the conversion.
+
+    Returns:
+    PdfConverter: A converter sharing the process's models.
+    """
+    return _build_converter(options.use_llm, options.extract_images, options.output_format.value)
+
+
+def convert(
+    converter: PdfConverter,
+    file_path: str,
+    page_range: Optional[str] = None,
+    paginate: bool = False,
+) -> Any:
+    """
+    Run a pooled converter on a document. Blocks; call it from a thread.
+
+    The pooled converter isn't modified: the document's page range and
+    pagination go to a shallow copy with its own config, which shares the
+    models and processors. At most MARKER_CONVERTER_CONCURRENCY conversions
+    run at once in a process, since they share the models and the GPU.
+
+    Args:
+    converter (PdfConverter): A converter from ``get_converter``.
+    file_path (str): The document to convert.
+    page_range (Optional[str]): Only convert these pages, e.g. ``0-2,5``.
+    paginate (bool): Mark page boundaries in the output.
+
+    Returns:
+    Any: marker's rendered output.
+    """
+    config = dict(converter.config or {})
+    if page_range is not None:
+        # Parsed the way marker's ConfigParser would
+        config["page_range"] = parse_page_range(page_range)
+    if paginate:
+        config["paginate_output"] = True
+    call = copy.copy(converter)
+    call.config = config
+    with _convert_semaphore:
+        return call(file_path)
@@ -0,0 +1,97 @@
+import os
+import logging
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import pypdfium2
+
+logger = logging.getLogger(__name__)
+
+# Most pages converted per request, whatever the caller asks for. 0 disables the cap.
+MAX_PAGES = int(os.environ.get("MARKER_MAX_PAGES", 1000))
+# Page indices at or above this are ignored when the page count isn't known
+# (non-PDF documents), so a range like 0-99999999 can't expand unbounded
+MAX_PAGE_INDEX = 100_000
+
+
+def parse_page_range(page_range: str, page_count: Optional[int] = None) -> List[int]:
+    """
+    Parse a page range such as ``0-4,10`` into sorted, unique page indices.
+
+    Args:
+    page_range (str): The range to parse.
+    page_count (Optional[int]): Pages of the document; indices past it are
+    dropped before ranges are expanded. MAX_PAGE_INDEX if unknown.
+
+    Returns:
+    List[int]: The selected page indices below ``page_count``.
+    """
+    bound = page_count if page_count is not None else MAX_PAGE_INDEX
+    pages = set()
+    for part in page_range.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start, end = (int(p) for p in part.split("-", 1))
+            if end < start:
+                raise ValueError(f"Invalid page range {part!r}")
+            pages.update(range(start, min(end + 1, bound)))
+        elif int(part) < bound:
+            pages.add(int(part))
+    return sorted(pages)
+
+
+def page_range_string(pages: Iterable[int]) -> str:
+    """Format page indices as marker's page_range option, e.g. ``0-2,5``"""
+    ranges = []
+    for page in sorted(pages):
+        if ranges and page == ranges[-1][1] + 1:
+            ranges[-1][1] = page
+        else:
+            ranges.append([page, page])
+    return ",".join(str(a) if a == b else f"{a}-{b}" for a, b in ranges)
+
+
+def pdf_page_count(file_path: Path) -> int:
+    pdf = pypdfium2.PdfDocument(str(file_path))
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def select_pages(
+    file_path: Path, page_range: Optional[str] = None, max_pages: Optional[int] = None
+) -> Optional[List[int]]:
+    """
+    Work out which pages of a document to convert.
+
+    The requested range is clipped to the document, then cut to the first
+    ``max_pages`` pages and to the server's MARKER_MAX_PAGES cap.
+
+    Args:
+    file_path (Path): The document to convert.
+    page_range (Optional[str]): Zero-based pages to convert, e.g. ``0-4,10``.
+    max_pages (Optional[int]): Convert at most this many pages.
+
+    Returns:
+    Optional[List[int]]: The page indices to convert, or None for the whole document.
+    """
+    limits = [limit for limit in (max_pages, MAX_PAGES) if limit]
+    limit = min(limits) if limits else None
+
+    if Path(file_path).suffix.lower() != ".pdf":
+        # Only PDFs can be counted up front; other formats get the range as given
+        if not page_range:
+            return None
+        return parse_page_range(page_range)[:limit]
+
+    count = pdf_page_count(file_path)
+    pages = parse_page_range(page_range, count) if page_range else list(range(count))
+    if not pages:
+        raise ValueError(f"Page range {page_range} selects none of the document's {count} pages")
+    if limit and len(pages) > limit:
+        logger.info(f"Converting the first {limit} of {len(pages)} selected pages of {file_path}")
+        pages = pages[:limit]
+    return None if len(pages) == count else pages
@@ -0,0 +1,134 @@
+import os
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Optional
+
+import redis
+import redis.asyncio
+
+from marker_api.startup import resolve_broker_url
+
+logger = logging.getLogger(__name__)
+
+# Connections per process and pool. Callers wait up to POOL_TIMEOUT seconds
+# for a free connection instead of opening more, so a burst of requests
+# queues up rather than exhausting Redis' connection limit.
+MAX_CONNECTIONS = int(os.environ.get("MARKER_REDIS_MAX_CONNECTIONS", 20))
+POOL_TIMEOUT = float(os.environ.get("MARKER_REDIS_POOL_TIMEOUT", 10))
+SOCKET_TIMEOUT = float(os.environ.get("MARKER_REDIS_SOCKET_TIMEOUT", 10))
+CONNECT_TIMEOUT = float(os.environ.get("MARKER_REDIS_CONNECT_TIMEOUT", 2))
+HEALTH_CHECK_INTERVAL = int(os.environ.get("MARKER_REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+_pool: Optional[redis.BlockingConnectionPool] = None
+_pool_pid: Optional[int] = None
+_lock = threading.Lock()
+
+# redis.asyncio connections belong to the loop that opened them, so each
+# event loop (the API's, a worker's persistent loop) gets its own pool
+_async_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, redis.asyncio.BlockingConnectionPool]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _pool_kwargs() -> Dict[str, Any]:
+    return {
+        "max_connections": MAX_CONNECTIONS,
+        "timeout": POOL_TIMEOUT,
+        "socket_timeout": SOCKET_TIMEOUT,
+        "socket_connect_timeout": CONNECT_TIMEOUT,
+        "health_check_interval": HEALTH_CHECK_INTERVAL,
+    }
+
+
+def get_pool() -> redis.BlockingConnectionPool:
+    """This process's Redis connection pool, recreated after a fork"""
+    global _pool, _pool_pid
+
+    with _lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = redis.BlockingConnectionPool.from_url(resolve_broker_url(), **_pool_kwargs())
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def get_redis() -> redis.Redis:
+    """A Redis client on the shared pool. Cheap; create one wherever needed."""
+    return redis.Redis(connection_pool=get_pool())
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """A redis.asyncio client on the running event loop's pool"""
+    loop = asyncio.get_running_loop()
+    pool = _async_pools.get(loop)
+    if pool is None:
+        pool = redis.asyncio.BlockingConnectionPool.from_url(
+            resolve_broker_url(), **_pool_kwargs()
+        )
+        _async_pools[loop] = pool
+    return redis.asyncio.Redis(connection_pool=pool)
+
+
+def celery_pool_settings() -> Dict[str, Any]:
+    """Celery settings that apply the same limits to its broker and result backend pools"""
+    return {
+        "broker_pool_limit": MAX_CONNECTIONS,
+        "redis_max_connections": MAX_CONNECTIONS,
+        "redis_socket_connect_timeout": CONNECT_TIMEOUT,
+        "broker_transport_options": {
+            "max_connections": MAX_CONNECTIONS,
+            "socket_connect_timeout": CONNECT_TIMEOUT,
+            "health_check_interval": HEALTH_CHECK_INTERVAL,
+        },
+    }
+
+
+def _sync_stats(pool) -> Dict[str, Any]:
+    if isinstance(pool, redis.BlockingConnectionPool):
+        created = len(pool._connections)
+        idle = sum(1 for connection in list(pool.pool.queue) if connection is not None)
+    else:
+        created = pool._created_connections
+        idle = len(pool._available_connections)
+    return {
+        "max_connections": pool.max_connections,
+        "created": created,
+        "in_use": created - idle,
+        "idle": idle,
+    }
+
+
+def _async_stats(pool: redis.asyncio.BlockingConnectionPool) -> Dict[str, Any]:
+    in_use = len(pool._in_use_connections)
+    idle = len(pool._available_connections)
+    return {
+        "max_connections": pool.max_connections,
+        "created": in_use + idle,
+        "in_use": in_use,
+        "idle": idle,
+    }
+
+
+def pool_stats(celery_app=None) -> Dict[str, Any]:
+    """
+    Connection counts of this process's Redis pools.
+
+    Args:
+    celery_app (Optional[Celery]): Also report the result backend's pool of this app.
+
+    Returns:
+    Dict[str, Any]: ``shared`` (sync pool), ``async`` (one entry per event
+    loop) and, if requested and created, ``celery_backend``.
+    """
+    stats: Dict[str, Any] = {
+        "pid": os.getpid(),
+        "shared": _sync_stats(_pool) if _pool is not None and _pool_pid == os.getpid() else None,
+        "async": [_async_stats(pool) for pool in list(_async_pools.values())],
+    }
+    if celery_app is not None:
+        try:
+            stats["celery_backend"] = _sync_stats(celery_app.backend.client.connection_pool)
+        except Exception as e:
+            logger.debug(f"No result backend pool stats: {e}")
+    return stats
@@ -1,5 +1,6 @@
 import os
 import time
+import asyncio
 import base64
 from pathlib import Path
 import traceback
@@ -10,113 +11,346 @@ import json
 import boto3
 import re
 import PIL
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 # Marker imports
 from marker.logger import configure_logging
-from marker.config.parser import ConfigParser
-from marker.converters.pdf import PdfConverter
-from marker.models import create_model_dict
 from marker.output import text_from_rendered
 from marker.schema.blocks.picture import Picture
 
+from marker_api.artifacts import artifact_url, store_image_artifact
+from marker_api.model.schema import ConversionOptions, ImageMode, OutputFormat
+from marker_api.models import convert, get_converter
+from marker_api.tracing import profiled, span, start_trace
+from marker_api.pages import page_range_string, select_pages
+from marker_api.triage import FAST_PATH, MARKER_PATH, merge_pages, triage_pdf
+from marker_api.utils import process_image_to_base64
+from marker_api.vlm_batcher import get_batcher
+
 # Initialize logging
 configure_logging()
 logger = logging.getLogger(__name__)
 
+# Maximum concurrent VLM calls per document
+VLM_MAX_CONCURRENCY = int(os.environ.get("VLM_MAX_CONCURRENCY", 8))
+
+# SageMaker VLM endpoint used to describe images (may be set in .env)
+load_dotenv()
+SAGEMAKER_ENDPOINT_NAME = os.environ.get(
+    "SAGEMAKER_ENDPOINT_NAME", "Qwen2-5-VL-72B-Instruct-2025-03-09-10-43-09"
+)
+SAGEMAKER_REGION = os.environ.get("SAGEMAKER_REGION", "ap-southeast-1")
+SAGEMAKER_ENDPOINT_URL = os.environ.get("SAGEMAKER_ENDPOINT_URL") or None
+
+# Micro-batching of VLM calls: up to VLM_BATCH_MAX_SIZE images, or whatever is
+# pending after VLM_BATCH_MAX_WAIT_MS, go in one request. 1 disables batching.
+VLM_BATCH_MAX_SIZE = int(os.environ.get("VLM_BATCH_MAX_SIZE", 1))
+VLM_BATCH_MAX_WAIT_MS = float(os.environ.get("VLM_BATCH_MAX_WAIT_MS", 20))
+
 async def process_document(file_path: Path) -> str:
     """Process a PDF document and convert it to markdown"""
-    try:
-        print("Starting document processing")
-        logging.info("Starting document processing")
+    result = await convert_document(file_path)
+    return result["markdown"]
 
-        load_dotenv()
-        
-        # Configure marker with settings
-        config = {
-            "output_format": "markdown",
-            "use_llm": True,
-            "disable_image_extraction": False,
-            "process_images_with_llm": True,
-            "llm_service": "marker.services.openrouter.OpenRouterService",
-            "aws_access_key_id": os.environ['SAGEMAKER_AWS_ACCESS_KEY_ID'],
-            "aws_secret_access_key": os.environ['SAGEMAKER_AWS_SECRET_ACCESS_KEY'],
-        }
-        
-        # Use ConfigParser to handle service initialization
-        config_parser = ConfigParser(config)
-        llm_service = config_parser.get_llm_service()
-        
-        # Setup converter with the necessary configuration
-        artifact_dict = create_model_dict()
-        converter = PdfConverter(
-            artifact_dict=artifact_dict, 
-            config=config_parser.generate_config_dict(), 
-            llm_service=llm_service
+
+def collect_images(images: Dict[str, Any], image_mode: ImageMode) -> Dict[str, str]:
+    """
+    Package the images extracted by marker according to the requested image mode.
+
+    Args:
+    images (Dict[str, PIL.Image.Image]): Images keyed by their markdown reference.
+    image_mode (ImageMode): How the images should be returned.
+
+    Returns:
+    Dict[str, str]: Base64 strings (inline) or artifact URLs (artifact), keyed by image name.
+    """
+    collected = {}
+    if image_mode == ImageMode.none or not images:
+        return collected
+
+    for name, image in images.items():
+        if not isinstance(image, PIL.Image.Image):
+            continue
+        if image_mode == ImageMode.inline:
+            collected[name] = process_image_to_base64(image, name)
+        else:
+            artifact_id = store_image_artifact(image, name)
+            if artifact_id:
+                collected[name] = artifact_url(artifact_id)
+    return collected
+
+
+IMAGE_PROMPT = "Describe this image in detail. Focus on both visual elements and any text visible in the image."
+IMAGE_PATTERN = re.compile(r'!\[\]\(([^)]+\.(jpeg|jpg|png))\)')
+
+
+async def extract_document(
+    file_path: Path, options: Optional[ConversionOptions] = None
+) -> Dict[str, Any]:
+    """
+    Extract the markdown and images of a document.
+
+    Only the pages selected by ``page_range`` and ``max_pages`` (capped by
+    MARKER_MAX_PAGES) are converted. With the fast path, PDF pages with a
+    clean text layer and no significant images or vector graphics are
+    extracted as plain text, and only the remaining pages go through marker's
+    layout/OCR/LLM pipeline.
+
+    Args:
+    file_path (Path): The document to convert.
+    options (Optional[ConversionOptions]): The conversion options.
+
+    Returns:
+    Dict[str, Any]: The ``markdown`` text, the extracted ``images``, the
+    ``pages`` report if the pages were triaged, and ``converted_pages`` if
+    only part of the document was converted.
+    """
+    print("Starting document processing")
+    logging.info("Starting document processing")
+
+    options = options or ConversionOptions()
+    fast_path = FAST_PATH if options.fast_path is None else options.fast_path
+
+    selected = await asyncio.to_thread(
+        select_pages, file_path, options.page_range, options.max_pages
+    )
+    converted_pages = page_range_string(selected) if selected is not None else None
+    result = {"pages": None, "converted_pages": converted_pages}
+
+    triage = None
+    # Text-layer pages can only be merged into markdown output
+    if (
+        fast_path
+        and options.output_format == OutputFormat.markdown
+        and Path(file_path).suffix.lower() == ".pdf"
+    ):
+        with span("triage"):
+            triage = await asyncio.to_thread(triage_pdf, file_path, selected)
+    if triage is None:
+        result["markdown"], result["images"] = await run_marker(
+            file_path, options, converted_pages
         )
-        
-        # Process the PDF file
-        logging.info("Calling the converter function")
-        rendered = converter(str(file_path))
-        
-        # Extract markdown text and images from the rendered output
+        return result
+
+    pages, texts = triage
+    marker_pages = [page.page for page in pages if page.path == MARKER_PATH]
+    logging.info(
+        f"Triaged {len(pages)} pages: {len(texts)} from the text layer, {len(marker_pages)} through marker"
+    )
+    result["pages"] = [page.to_dict() for page in pages]
+    if not texts:
+        result["markdown"], result["images"] = await run_marker(
+            file_path, options, converted_pages
+        )
+        return result
+
+    markdown_text, images = "", {}
+    if marker_pages:
+        markdown_text, images = await run_marker(
+            file_path, options, page_range_string(marker_pages), paginate=True
+        )
+    result["markdown"] = merge_pages(pages, texts, markdown_text)
+    result["images"] = images
+    return result
+
+
+async def run_marker(
+    file_path: Path,
+    options: ConversionOptions,
+    page_range: Optional[str] = None,
+    paginate: bool = False,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Run the marker layout/OCR pipeline on a document.
+
+    Args:
+    file_path (Path): The document to convert.
+    options (ConversionOptions): The conversion options.
+    page_range (Optional[str]): Only convert these pages, e.g. ``0-2,5``.
+    paginate (bool): Mark page boundaries so the markdown can be split per page.
+
+    Returns:
+    Tuple[str, Dict[str, Any]]: The markdown text and the extracted images.
+    """
+    # Converters and their models are reused across documents with the same
+    # options. Building one may load the models, so keep it off the loop too
+    converter = await asyncio.to_thread(get_converter, options)
+
+    # Process the PDF file. The converter is CPU/GPU bound, so run it off
+    # the event loop to keep other documents' image I/O flowing
+    logging.info("Calling the converter function")
+    with span("convert", file=Path(file_path).name):
+        rendered = await asyncio.to_thread(
+            profiled(convert), converter, str(file_path), page_range, paginate
+        )
+
+    # Extract markdown text and images from the rendered output
+    with span("text_from_rendered"):
         markdown_text, _, images = text_from_rendered(rendered)
-        
-        # Debug the image structure
-        logging.info(f"Images type: {type(images)}")
-        if images:
-            logging.info(f"Images structure: {str(images)[:200]}...")  # Print first 200 chars to see structure
-        
-        # Post-process to handle images that weren't processed by the LLM
-        if "![]" in markdown_text:
-            # Find all image references in the markdown
-            image_pattern = re.compile(r'!\[\]\(([^)]+\.(jpeg|jpg|png))\)')
-            
-            # Process each image match
-            for match in image_pattern.finditer(markdown_text):
-                image_path = match.group(1)
-                logging.info(f"Found image reference: {image_path}")
-                
-                try:
-                    # Try to find the image in the images dictionary
-                    if image_path in images and isinstance(images[image_path], PIL.Image.Image):
-                        img = images[image_path]
-                        logging.info(f"Found image for {image_path}, processing with OpenRouter directly")
-                        description = await process_image_direct(
-                            img,
-                            "Describe this image in detail. Focus on both visual elements and any text visible in the image."
-                        )
-                        
-                        # Replace the placeholder with the image plus description
-                        # short_alt = "Image: " + description.split(".")[0] # Just use the first sentence for alt text
-                        replacement = f"Image ({image_path})\n> Full image description: {description}\n"
-                        markdown_text = markdown_text.replace(match.group(0), replacement)
-                        logging.info(f"Added description for {image_path}")
-                    else:
-                        logging.warning(f"Could not find valid image for {image_path}")
-                        
-                except Exception as e:
-                    logging.info(f"Error processing image reference {image_path}: {e}")
-                    logging.error(f"Exception details: {traceback.format_exc()}")
-        
-        return markdown_text
+    
+    # Debug the image structure
+    logging.info(f"Images type: {type(images)}")
+    if images:
+        logging.info(f"Images structure: {str(images)[:200]}...")  # Print first 200 chars to see structure
+
+    return markdown_text, images
+
+
+def find_images_to_describe(markdown_text: str, images: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Find the image placeholders that weren't processed by the LLM.
+
+    Returns:
+    Dict[str, PIL.Image.Image]: The referenced images, keyed by their markdown path.
+    """
+    to_describe = {}
+    if "![]" not in markdown_text:
+        return to_describe
+
+    # Find all image references in the markdown
+    for match in IMAGE_PATTERN.finditer(markdown_text):
+        image_path = match.group(1)
+        logging.info(f"Found image reference: {image_path}")
+
+        # Try to find the image in the images dictionary
+        if image_path in images and isinstance(images[image_path], PIL.Image.Image):
+            to_describe[image_path] = images[image_path]
+        else:
+            logging.warning(f"Could not find valid image for {image_path}")
+    return to_describe
+
+
+async def describe_images(images: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Describe images with the VLM endpoint.
+
+    Returns:
+    Dict[str, str]: Descriptions keyed by image path. Images that failed are left out.
+    """
+    semaphore = asyncio.Semaphore(VLM_MAX_CONCURRENCY)
+
+    async def describe(image_path, img):
+        try:
+            logging.info(f"Found image for {image_path}, processing with OpenRouter directly")
+            async with semaphore:
+                with span("describe_image", image=image_path):
+                    return image_path, await process_image_direct(img, IMAGE_PROMPT)
+        except Exception as e:
+            logging.info(f"Error processing image reference {image_path}: {e}")
+            logging.error(f"Exception details: {traceback.format_exc()}")
+            return image_path, None
+
+    # The VLM calls are network bound, so describe all images concurrently
+    results = await asyncio.gather(*(describe(path, img) for path, img in images.items()))
+    return {path: description for path, description in results if description is not None}
+
+
+def assemble_markdown(markdown_text: str, descriptions: Dict[str, str]) -> str:
+    """Replace the image placeholders with the images plus their descriptions"""
+    for image_path, description in descriptions.items():
+        # short_alt = "Image: " + description.split(".")[0] # Just use the first sentence for alt text
+        replacement = f"Image ({image_path})\n> Full image description: {description}\n"
+        markdown_text = markdown_text.replace(f"![]({image_path})", replacement)
+        logging.info(f"Added description for {image_path}")
+    return markdown_text
+
+
+async def convert_document(
+    file_path: Path, options: Optional[ConversionOptions] = None
+) -> Dict[str, Any]:
+    """
+    Convert a document to markdown and package its extracted images.
+
+    Args:
+    file_path (Path): The document to convert.
+    options (Optional[ConversionOptions]): The conversion options.
+
+    Returns:
+    Dict[str, Any]: ``markdown`` text, ``images`` packaged per ``image_mode``,
+    the per-page ``pages`` report of the fast path, the ``converted_pages``
+    if not all pages were converted and, if requested, ``timings``.
+    """
+    options = options or ConversionOptions()
+    try:
+        with start_trace(
+            "convert_document", enabled=options.timings, file=Path(file_path).name
+        ) as trace:
+            extracted = await extract_document(file_path, options)
+            markdown_text, images = extracted["markdown"], extracted["images"]
+
+            # Post-process to handle images that weren't processed by the LLM
+            if options.describe_images:
+                with span("describe_images"):
+                    descriptions = await describe_images(
+                        find_images_to_describe(markdown_text, images)
+                    )
+                markdown_text = assemble_markdown(markdown_text, descriptions)
+            with span("collect_images", image_mode=options.image_mode.value):
+                collected = collect_images(images, options.image_mode)
+
+        result = {
+            "markdown": markdown_text,
+            "images": collected,
+            "pages": extracted["pages"],
+            "converted_pages": extracted["converted_pages"],
+        }
+        if options.timings and trace is not None:
+            result["timings"] = trace.timings()
+        return result
 
     except Exception as e:
         logging.error(f"Error processing document {file_path}: {str(e)}")
         logging.error(f"Exception details: {traceback.format_exc()}")
         raise
 
+@lru_cache(maxsize=1)
+def get_sagemaker_client():
+    """SageMaker runtime client, created once per process (boto3 clients are thread-safe)"""
+    load_dotenv()
+    session = boto3.Session(
+        aws_access_key_id=os.environ['SAGEMAKER_AWS_ACCESS_KEY_ID'],
+        aws_secret_access_key=os.environ['SAGEMAKER_AWS_SECRET_ACCESS_KEY'],
+        region_name=SAGEMAKER_REGION
+    )
+    # SAGEMAKER_ENDPOINT_URL points the client at a local stand-in (tests/vlm_stub.py)
+    return session.client('sagemaker-runtime', endpoint_url=SAGEMAKER_ENDPOINT_URL)
+
+
+def invoke_vlm_endpoint(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Call the SageMaker VLM endpoint (blocking) and return the parsed JSON response"""
+    response = get_sagemaker_client().invoke_endpoint(
+        EndpointName=SAGEMAKER_ENDPOINT_NAME,
+        ContentType='application/json',
+        Body=json.dumps(body)
+    )
+    return json.loads(response['Body'].read().decode('utf-8'))
+
+
+def send_vlm_batch(payloads: List[Dict[str, Any]]) -> List[Any]:
+    """
+    Send several image payloads in one request.
+
+    The endpoint takes ``{"batch": [payload, ...]}`` and answers
+    ``{"responses": [response, ...]}`` in the same order; a response with an
+    ``error`` key marks a failed item.
+
+    Returns:
+    List[Any]: The description, or an Exception, for each payload.
+    """
+    output = invoke_vlm_endpoint({"batch": payloads})
+    results = []
+    for response in output["responses"]:
+        if "error" in response:
+            results.append(RuntimeError(str(response["error"])))
+        else:
+            results.append(response["choices"][0]["message"]["content"])
+    return results
+
+
 async def process_image_direct(image, prompt):
     """Process an image directly with Sagemaker"""
     try:
-        load_dotenv()
-        session = boto3.Session(
-            aws_access_key_id=os.environ['SAGEMAKER_AWS_ACCESS_KEY_ID'],
-            aws_secret_access_key=os.environ['SAGEMAKER_AWS_SECRET_ACCESS_KEY'],
-            region_name='ap-southeast-1'
-        )
-        
-        runtime_client = session.client('sagemaker-runtime')
-
         # Convert image to base64
         image_bytes = BytesIO()
         image.save(image_bytes, format="JPEG")
@@ -146,18 +380,14 @@ async def process_image_direct(image, prompt):
             ]
         }
         
-        payload_json = json.dumps(payload)
-        
-        # Call SageMaker endpoint
-        response = runtime_client.invoke_endpoint(
-            EndpointName='Qwen2-5-VL-72B-Instruct-2025-03-09-10-43-09',
-            ContentType='application/json',
-            Body=payload_json
-        )
+        if VLM_BATCH_MAX_SIZE > 1:
+            # Share one endpoint call with other pending images in this process
+            batcher = get_batcher(send_vlm_batch, VLM_BATCH_MAX_SIZE, VLM_BATCH_MAX_WAIT_MS)
+            return await batcher.submit(payload)
 
-        # Parse response
-        response_body = response['Body'].read().decode('utf-8')
-        output = json.loads(response_body)
+        # Call SageMaker endpoint in a thread; boto3 is blocking and would
+        # otherwise stall every other coroutine on the loop
+        output = await asyncio.to_thread(invoke_vlm_endpoint, payload)
         return output["choices"][0]["message"]["content"]
             
     except Exception as e:
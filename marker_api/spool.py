@@ -0,0 +1,308 @@
+import os
+import time
+import asyncio
+import uuid
+import errno
+import fcntl
+import socket
+import logging
+import tempfile
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Uploaded documents are written here for marker, which reads from a path.
+# Every file is accounted against a quota and removed by a sweeper if the
+# process that wrote it dies before cleaning up.
+SPOOL_DIR = os.environ.get(
+    "MARKER_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "marker_api_spool")
+)
+SPOOL_QUOTA = int(os.environ.get("MARKER_SPOOL_QUOTA", 10 * 1024**3))
+SPOOL_MAX_FILE_SIZE = int(os.environ.get("MARKER_SPOOL_MAX_FILE_SIZE", 2 * 1024**3))
+# Files up to TMPFS_MAX_FILE_SIZE go to a RAM-backed directory while it is
+# below its own quota. Empty disables it.
+_DEFAULT_TMPFS_DIR = "/dev/shm/marker_api_spool" if os.path.isdir("/dev/shm") else ""
+SPOOL_TMPFS_DIR = os.environ.get("MARKER_SPOOL_TMPFS_DIR", _DEFAULT_TMPFS_DIR)
+SPOOL_TMPFS_QUOTA = int(os.environ.get("MARKER_SPOOL_TMPFS_QUOTA", 256 * 1024**2))
+SPOOL_TMPFS_MAX_FILE_SIZE = int(os.environ.get("MARKER_SPOOL_TMPFS_MAX_FILE_SIZE", 16 * 1024**2))
+# Files older than this are removed even if their process still runs; longer
+# than the longest task time limit
+SPOOL_MAX_AGE = int(os.environ.get("MARKER_SPOOL_MAX_AGE", 3 * 3600))
+SPOOL_SWEEP_INTERVAL = float(os.environ.get("MARKER_SPOOL_SWEEP_INTERVAL", 60))
+
+LOCK_NAME = ".lock"
+HOSTNAME = socket.gethostname()
+
+
+def _pid_namespace() -> str:
+    try:
+        return str(os.stat("/proc/self/ns/pid").st_ino)
+    except OSError:
+        return ""
+
+
+# Containers of a pod share a hostname but not their PIDs, so files are tagged
+# with the PID namespace too. Without it, only the age can tell orphans apart.
+PID_NAMESPACE = _pid_namespace()
+OWNER = f"{HOSTNAME}.{PID_NAMESPACE}" if PID_NAMESPACE else HOSTNAME
+
+
+class SpoolFullError(Exception):
+    """The document is larger than the spool allows, or the spool is out of quota"""
+
+
+def _tiers() -> List[Dict[str, Any]]:
+    tiers = []
+    if SPOOL_TMPFS_DIR:
+        tiers.append(
+            {
+                "name": "tmpfs",
+                "path": SPOOL_TMPFS_DIR,
+                "quota": SPOOL_TMPFS_QUOTA,
+                "max_file_size": SPOOL_TMPFS_MAX_FILE_SIZE,
+            }
+        )
+    tiers.append(
+        {"name": "disk", "path": SPOOL_DIR, "quota": SPOOL_QUOTA, "max_file_size": SPOOL_MAX_FILE_SIZE}
+    )
+    return tiers
+
+
+@contextmanager
+def _locked(directory: str):
+    """Serialize quota checks and sweeps on a spool directory across processes"""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_NAME), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def _files(directory: str) -> Iterator[os.DirEntry]:
+    """
+    Spooled files in a directory. Subdirectories (e.g. uploads) aren't
+    reserved through the spool, so they don't count against its quota.
+    """
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        try:
+            if not entry.is_dir(follow_symlinks=False) and entry.name != LOCK_NAME:
+                yield entry
+        except FileNotFoundError:
+            continue
+
+
+def _usage(directory: str) -> Dict[str, int]:
+    used = files = 0
+    for entry in _files(directory):
+        try:
+            used += entry.stat(follow_symlinks=False).st_size
+            files += 1
+        except FileNotFoundError:
+            continue
+    return {"used_bytes": used, "files": files}
+
+
+def _reserve(path: str, size: int):
+    """Create the file at its full size, so the space counts against the quota right away"""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        if size:
+            try:
+                os.posix_fallocate(fd, 0, size)
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.EINVAL):
+                    raise
+                os.ftruncate(fd, size)
+    except BaseException:
+        os.close(fd)
+        os.unlink(path)
+        raise
+    os.close(fd)
+
+
+def spool_path(size: int, suffix: str = "") -> str:
+    """
+    Reserve a spool file of ``size`` bytes for the caller to write.
+
+    The file goes to tmpfs if it is small enough and tmpfs has quota left,
+    and to the disk spool otherwise. Release it with ``release``.
+
+    Args:
+    size (int): Bytes that will be written.
+    suffix (str): File extension; marker picks its provider by file type.
+
+    Returns:
+    str: Path of the reserved file.
+
+    Raises:
+    SpoolFullError: If the file exceeds MARKER_SPOOL_MAX_FILE_SIZE or no
+    spool directory has quota left for it.
+    """
+    if size > SPOOL_MAX_FILE_SIZE:
+        raise SpoolFullError(
+            f"Document is {size} bytes, more than the spool's {SPOOL_MAX_FILE_SIZE} byte limit"
+        )
+    # The owner and pid let the sweeper tell orphans from files in use
+    name = f"{OWNER}-{os.getpid()}-{uuid.uuid4().hex}{suffix}"
+    for tier in _tiers():
+        if size > tier["max_file_size"]:
+            continue
+        try:
+            with _locked(tier["path"]):
+                if _usage(tier["path"])["used_bytes"] + size > tier["quota"]:
+                    continue
+                path = os.path.join(tier["path"], name)
+                _reserve(path, size)
+                return path
+        except OSError as e:
+            # tmpfs smaller than its quota, a full disk: fall through to the next tier
+            logger.warning(f"Could not spool {size} bytes to {tier['path']}: {e}")
+    raise SpoolFullError(f"No spool space left for a {size} byte document")
+
+
+def release(path: str):
+    """Remove a spool file once its document is converted"""
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def spooled(filename: str, contents: bytes) -> Iterator[Path]:
+    """
+    Write a document to the spool for the duration of the ``with`` block.
+
+    Args:
+    filename (str): Name of the document, for its extension.
+    contents (bytes): The document.
+
+    Yields:
+    Path: The spooled file, removed when the block exits.
+    """
+    _, extension = os.path.splitext(filename)
+    path = spool_path(len(contents), extension)
+    try:
+        _write(path, contents)
+        yield Path(path)
+    finally:
+        release(path)
+
+
+@asynccontextmanager
+async def spooled_async(filename: str, contents: bytes) -> AsyncIterator[Path]:
+    """
+    ``spooled`` for coroutines. The quota check, which locks the spool and
+    scans it, and the writes run in a thread instead of on the event loop.
+    """
+    _, extension = os.path.splitext(filename)
+    path = await asyncio.to_thread(spool_path, len(contents), extension)
+    try:
+        await asyncio.to_thread(_write, path, contents)
+        yield Path(path)
+    finally:
+        await asyncio.to_thread(release, path)
+
+
+def _write(path: str, contents: bytes):
+    with open(path, "r+b") as f:
+        f.write(contents)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _is_orphan(entry: os.DirEntry, now: float) -> bool:
+    if now - entry.stat(follow_symlinks=False).st_mtime > SPOOL_MAX_AGE:
+        return True
+    parts = entry.name.rsplit("-", 2)
+    if len(parts) != 3 or not parts[1].isdigit():
+        return False
+    owner, pid = parts[0], int(parts[1])
+    # Processes of other hosts or containers sharing the spool can't be
+    # checked; their files expire by age
+    return bool(PID_NAMESPACE) and owner == OWNER and not _alive(pid)
+
+
+def sweep() -> int:
+    """
+    Remove spool files left behind by processes that died, and files older
+    than MARKER_SPOOL_MAX_AGE. Partial resumable uploads, which live under the
+    spool, are swept by marker_api.uploads instead.
+
+    Returns:
+    int: The number of files removed.
+    """
+    removed = 0
+    now = time.time()
+    for tier in _tiers():
+        if not os.path.isdir(tier["path"]):
+            continue
+        with _locked(tier["path"]):
+            for entry in os.scandir(tier["path"]):
+                try:
+                    if entry.is_dir(follow_symlinks=False) or entry.name == LOCK_NAME:
+                        continue
+                    if _is_orphan(entry, now):
+                        os.unlink(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    continue
+    if removed:
+        logger.info(f"Swept {removed} orphaned spool files")
+    return removed
+
+
+_sweeper_pid: Optional[int] = None
+
+
+def start_sweeper():
+    """Sweep now and then every MARKER_SPOOL_SWEEP_INTERVAL seconds from a daemon thread"""
+    global _sweeper_pid
+
+    if _sweeper_pid == os.getpid():
+        return
+    _sweeper_pid = os.getpid()
+
+    def run():
+        while True:
+            try:
+                sweep()
+            except Exception as e:
+                logger.warning(f"Spool sweep failed: {e}")
+            time.sleep(SPOOL_SWEEP_INTERVAL)
+
+    threading.Thread(target=run, name="spool-sweeper", daemon=True).start()
+
+
+def spool_stats() -> Dict[str, Any]:
+    """Usage of each spool directory against its quota, for the stats endpoints"""
+    tiers = []
+    for tier in _tiers():
+        usage = _usage(tier["path"])
+        tiers.append(
+            {
+                **tier,
+                **usage,
+                "used_pct": round(100 * usage["used_bytes"] / tier["quota"], 1)
+                if tier["quota"]
+                else None,
+            }
+        )
+    return {"tiers": tiers}
@@ -0,0 +1,114 @@
+import os
+import time
+import queue
+import logging
+import threading
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "service-redis-084qf-health")
+REDIS_PORT = os.environ.get("REDIS_PORT", "3000")
+# Other places Redis may live, tried alongside REDIS_HOST. Comma-separated
+# hosts or redis:// URLs; set to an empty string to only use REDIS_HOST.
+REDIS_CANDIDATES = os.environ.get(
+    "MARKER_REDIS_CANDIDATES",
+    "service-redis-084qf-health,redis,redis.platform-service.svc.cluster.local,"
+    "service-redis-084qf-health.platform-service.svc.cluster.local",
+)
+# Seconds to wait for any candidate to answer before falling back to REDIS_HOST
+PROBE_DEADLINE = float(os.environ.get("MARKER_BROKER_PROBE_DEADLINE", 3))
+
+_broker_url: Optional[str] = None
+_lock = threading.Lock()
+
+
+def redis_url(host: str, port: str = REDIS_PORT) -> str:
+    """URL for a Redis host, or the host itself if it already is a URL"""
+    if host.startswith(("redis://", "rediss://", "unix://")):
+        return host
+    return f"redis://{host}:{port}/0"
+
+
+def broker_candidates() -> List[str]:
+    """Broker URLs to probe, REDIS_HOST first, without duplicates"""
+    hosts = [REDIS_HOST] + [h.strip() for h in REDIS_CANDIDATES.split(",") if h.strip()]
+    return list(dict.fromkeys(redis_url(host) for host in hosts))
+
+
+def _probe(url: str, timeout: float, results: queue.Queue):
+    import redis
+
+    client = redis.Redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+    try:
+        results.put((url, bool(client.ping()), None))
+    except Exception as e:
+        results.put((url, False, e))
+    finally:
+        client.close()
+
+
+def probe_brokers(candidates: List[str], deadline: float = PROBE_DEADLINE) -> Optional[str]:
+    """
+    Ping all candidates at once and return the first one that answers.
+
+    Args:
+    candidates (List[str]): Redis URLs to try.
+    deadline (float): Seconds to wait in total, however many candidates there are.
+
+    Returns:
+    Optional[str]: The URL that answered first, or None if none did in time.
+    """
+    results: queue.Queue = queue.Queue()
+    for url in candidates:
+        # Daemon threads, so a hanging DNS lookup can't hold up startup or exit
+        threading.Thread(
+            target=_probe, args=(url, deadline, results), name="broker-probe", daemon=True
+        ).start()
+
+    end = time.monotonic() + deadline
+    for _ in candidates:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            url, ok, error = results.get(timeout=remaining)
+        except queue.Empty:
+            break
+        if ok:
+            return url
+        logger.info(f"Redis at {url} did not answer: {error}")
+    return None
+
+
+def resolve_broker_url() -> str:
+    """
+    The Redis URL used as Celery broker and result backend, found once per process.
+
+    CELERY_BROKER_URL is used as-is if set. Otherwise the candidates are
+    probed concurrently within MARKER_BROKER_PROBE_DEADLINE seconds. The
+    winner is exported as CELERY_BROKER_URL, so child processes (Celery pool
+    workers, uvicorn workers) inherit it instead of probing again.
+    """
+    global _broker_url
+
+    with _lock:
+        if _broker_url is None:
+            configured = os.environ.get("CELERY_BROKER_URL")
+            if configured:
+                _broker_url = configured
+            else:
+                candidates = broker_candidates()
+                start = time.perf_counter()
+                winner = probe_brokers(candidates)
+                elapsed = time.perf_counter() - start
+                if winner:
+                    logger.info(f"Using Redis at {winner} (found in {elapsed:.2f}s)")
+                else:
+                    winner = candidates[0]
+                    logger.warning(
+                        f"No Redis candidate answered within {elapsed:.2f}s, using {winner}"
+                    )
+                _broker_url = winner
+                os.environ["CELERY_BROKER_URL"] = winner
+        return _broker_url
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import tempfile
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Log a JSON trace of every conversion
+TRACE_LOG = os.environ.get("MARKER_TRACE", "false").lower() == "true"
+# Fraction of conversions whose converter call is profiled
+PROFILE_SAMPLE_RATE = float(os.environ.get("MARKER_PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR = os.environ.get(
+    "MARKER_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "marker_api_profiles")
+)
+
+_current_trace: contextvars.ContextVar[Optional["Trace"]] = contextvars.ContextVar(
+    "marker_trace", default=None
+)
+_current_span: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "marker_span", default=None
+)
+
+
+class Trace:
+    """
+    Spans recorded for one conversion, in an OpenTelemetry-like shape.
+
+    Spans are started with :func:`span` anywhere below :func:`start_trace`;
+    the active trace and parent span travel through contextvars, so spans
+    created in gathered coroutines and ``asyncio.to_thread`` calls are
+    attached to the right parent.
+    """
+
+    def __init__(self, name: str, profile: bool = False, **attributes: Any):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.profile = profile
+        self.start = time.perf_counter()
+        self.start_unix_nano = time.time_ns()
+        self.end: Optional[float] = None
+        self.spans: List[Dict[str, Any]] = []
+
+    def add_span(self, span: Dict[str, Any]):
+        self.spans.append(span)
+
+    def timings(self) -> Dict[str, Any]:
+        """Timing breakdown returned to the caller"""
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "trace_id": self.trace_id,
+            "total_ms": round((end - self.start) * 1000, 2),
+            "stages": sorted(self.spans, key=lambda s: s["start_ms"]),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_time_unix_nano": self.start_unix_nano,
+            "attributes": self.attributes,
+            **self.timings(),
+        }
+
+
+@contextmanager
+def start_trace(name: str, enabled: bool = False, **attributes: Any):
+    """
+    Trace a conversion if requested, logged as JSON, or sampled for profiling.
+
+    Yields the Trace, or None if tracing is off for this conversion.
+    """
+    profile = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    if not (enabled or TRACE_LOG or profile):
+        yield None
+        return
+
+    trace = Trace(name, profile=profile, **attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        trace.end = time.perf_counter()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        if TRACE_LOG:
+            logger.info(f"Trace: {json.dumps(trace.to_dict(), default=str)}")
+
+
+@contextmanager
+def span(name: str, **attributes: Any):
+    """Time a stage of the active trace. A no-op when nothing is being traced."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    span_id = uuid.uuid4().hex[:16]
+    parent_id = _current_span.get()
+    token = _current_span.set(span_id)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        _current_span.reset(token)
+        trace.add_span(
+            {
+                "span_id": span_id,
+                "parent_id": parent_id,
+                "name": name,
+                "start_ms": round((start - trace.start) * 1000, 2),
+                "duration_ms": round((time.perf_counter() - start) * 1000, 2),
+                "status": status,
+                "attributes": attributes,
+            }
+        )
+
+
+def profiled(fn: Callable) -> Callable:
+    """
+    Wrap ``fn`` so it runs under a profiler if the active trace was sampled.
+
+    Uses pyinstrument when installed, cProfile otherwise. The profile is
+    written to MARKER_PROFILE_DIR named after the trace ID. Wrap the function
+    that runs in the worker thread, since both profilers only see the thread
+    they were started in.
+    """
+    trace = _current_trace.get()
+    if trace is None or not trace.profile:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            Profiler = None
+
+        if Profiler is not None:
+            profiler = Profiler()
+            profiler.start()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.stop()
+                path = os.path.join(PROFILE_DIR, f"{trace.trace_id}.html")
+                with open(path, "w") as f:
+                    f.write(profiler.output_html())
+                logger.info(f"Wrote profile for trace {trace.trace_id} to {path}")
+
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(fn, *args, **kwargs)
+        finally:
+            path = os.path.join(PROFILE_DIR, f"{trace.trace_id}.prof")
+            profiler.dump_stats(path)
+            logger.info(f"Wrote profile for trace {trace.trace_id} to {path}")
+
+    return wrapper
+
+
+def merge_timings(*timings: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Combine the timing breakdowns of pipeline stages that ran as separate tasks"""
+    timings = [t for t in timings if t]
+    if not timings:
+        return None
+    return {
+        "trace_id": timings[0]["trace_id"],
+        "total_ms": round(sum(t["total_ms"] for t in timings), 2),
+        "stages": [stage for t in timings for stage in t["stages"]],
+    }
@@ -0,0 +1,200 @@
+import os
+import re
+import ctypes
+import logging
+import unicodedata
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import pypdfium2
+import pypdfium2.raw as pdfium_c
+
+logger = logging.getLogger(__name__)
+
+# Send pages with a clean text layer through plain text extraction instead of marker
+FAST_PATH = os.environ.get("MARKER_FAST_PATH", "false").lower() == "true"
+# A page needs at least this many characters of text to count as born-digital
+TRIAGE_MIN_CHARS = int(os.environ.get("MARKER_TRIAGE_MIN_CHARS", 100))
+# Fraction of the text that must be readable characters
+TRIAGE_MIN_QUALITY = float(os.environ.get("MARKER_TRIAGE_MIN_QUALITY", 0.95))
+# Pages whose images cover more than this fraction of the page go to marker
+TRIAGE_MAX_IMAGE_AREA = float(os.environ.get("MARKER_TRIAGE_MAX_IMAGE_AREA", 0.1))
+# Pages with more vector paths than this (tables, charts) go to marker
+TRIAGE_MAX_PATHS = int(os.environ.get("MARKER_TRIAGE_MAX_PATHS", 50))
+# Pages with more horizontal rules than this go to marker: ruled tables need
+# only a handful of paths. A rule spans at least TRIAGE_MIN_RULE_WIDTH of the
+# page width, so footnote separators and fraction bars don't count.
+TRIAGE_MAX_RULES = int(os.environ.get("MARKER_TRIAGE_MAX_RULES", 1))
+TRIAGE_MIN_RULE_WIDTH = float(os.environ.get("MARKER_TRIAGE_MIN_RULE_WIDTH", 0.3))
+# Pages where more than this fraction of the characters are set in math fonts
+# go to marker; the text layer flattens equations
+TRIAGE_MAX_MATH_SHARE = float(os.environ.get("MARKER_TRIAGE_MAX_MATH_SHARE", 0.02))
+
+# TeX math fonts (Computer Modern, AMS), OpenType math fonts and Symbol
+MATH_FONT = re.compile(r"^(CMMI|CMSY|CMEX|CMBSY|MSAM|MSBM|EUFM|EUSM|RSFS|Symbol)|Math", re.I)
+
+TEXT_PATH = "text"
+MARKER_PATH = "marker"
+
+
+@dataclass
+class PageTriage:
+    page: int
+    path: str
+    reason: str
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"page": self.page, "path": self.path, "reason": self.reason}
+
+
+def text_quality(text: str) -> float:
+    """Fraction of non-whitespace characters that are letters, digits, punctuation or symbols"""
+    total = good = 0
+    for char in text:
+        if char.isspace():
+            continue
+        total += 1
+        # Broken font encodings show up as replacement, private-use or control characters
+        if char != "\ufffd" and unicodedata.category(char)[0] in "LNPS":
+            good += 1
+    return good / total if total else 0.0
+
+
+def _math_share(textpage) -> float:
+    """Fraction of the page's non-whitespace characters set in a math font"""
+    total = math = 0
+    name = ctypes.create_string_buffer(256)
+    flags = ctypes.c_int()
+    for index in range(textpage.count_chars()):
+        if chr(pdfium_c.FPDFText_GetUnicode(textpage.raw, index)).isspace():
+            continue
+        total += 1
+        pdfium_c.FPDFText_GetFontInfo(textpage.raw, index, name, len(name), ctypes.byref(flags))
+        # Embedded subsets are named like ABCDEF+CMMI10
+        if MATH_FONT.search(name.value.decode(errors="replace").split("+")[-1]):
+            math += 1
+    return math / total if total else 0.0
+
+
+def _page_text(page) -> Tuple[str, float]:
+    """The page's text and the share of it set in math fonts"""
+    textpage = page.get_textpage()
+    try:
+        text = textpage.get_text_range().replace("\r\n", "\n").replace("\r", "\n")
+        return text, _math_share(textpage)
+    finally:
+        textpage.close()
+
+
+def _classify(index: int, page, text: str, math_share: float = 0.0) -> PageTriage:
+    chars = len(text.strip())
+    if chars < TRIAGE_MIN_CHARS:
+        return PageTriage(index, MARKER_PATH, f"no text layer ({chars} chars)")
+
+    quality = text_quality(text)
+    if quality < TRIAGE_MIN_QUALITY:
+        return PageTriage(index, MARKER_PATH, f"low text quality ({quality:.2f})")
+
+    width, height = page.get_size()
+    page_area = max(width * height, 1.0)
+    image_area = 0.0
+    paths = rules = 0
+    for obj in page.get_objects(max_depth=2):
+        if obj.type not in (pdfium_c.FPDF_PAGEOBJ_IMAGE, pdfium_c.FPDF_PAGEOBJ_PATH):
+            continue
+        # get_pos() was renamed get_bounds() in pypdfium2 5
+        bounds = obj.get_bounds if hasattr(obj, "get_bounds") else obj.get_pos
+        left, bottom, right, top = bounds()
+        if obj.type == pdfium_c.FPDF_PAGEOBJ_IMAGE:
+            image_area += max(right - left, 0) * max(top - bottom, 0)
+        else:
+            paths += 1
+            if top - bottom < 2 and right - left >= TRIAGE_MIN_RULE_WIDTH * width:
+                rules += 1
+
+    if image_area / page_area > TRIAGE_MAX_IMAGE_AREA:
+        return PageTriage(index, MARKER_PATH, f"images cover {image_area / page_area:.0%} of page")
+    if paths > TRIAGE_MAX_PATHS:
+        return PageTriage(index, MARKER_PATH, f"{paths} vector paths (tables or figures)")
+    if rules > TRIAGE_MAX_RULES:
+        return PageTriage(index, MARKER_PATH, f"{rules} horizontal rules (table)")
+    if math_share > TRIAGE_MAX_MATH_SHARE:
+        return PageTriage(index, MARKER_PATH, f"{math_share:.1%} of text in math fonts (equations)")
+    return PageTriage(index, TEXT_PATH, f"text layer ({chars} chars, quality {quality:.2f})")
+
+
+def triage_pdf(
+    file_path: Path, page_indices: Optional[List[int]] = None
+) -> Optional[Tuple[List[PageTriage], Dict[int, str]]]:
+    """
+    Decide per page whether the text layer can be used as-is.
+
+    Args:
+    file_path (Path): The PDF to inspect.
+    page_indices (Optional[List[int]]): Only triage these pages; all pages if None.
+
+    Returns:
+    Optional[Tuple[List[PageTriage], Dict[int, str]]]: A list of PageTriage and a dict of extracted text for the
+    pages on the text path, or None if the file can't be opened as a PDF.
+    """
+    try:
+        pdf = pypdfium2.PdfDocument(str(file_path))
+    except pypdfium2.PdfiumError as e:
+        logger.warning(f"Could not triage {file_path}: {e}")
+        return None
+
+    pages: List[PageTriage] = []
+    texts: Dict[int, str] = {}
+    try:
+        for index in page_indices if page_indices is not None else range(len(pdf)):
+            page = pdf[index]
+            try:
+                text, math_share = _page_text(page)
+                triage = _classify(index, page, text, math_share)
+                pages.append(triage)
+                if triage.path == TEXT_PATH:
+                    texts[index] = text.strip()
+            finally:
+                page.close()
+    finally:
+        pdf.close()
+    return pages, texts
+
+
+# marker's markdown renderer starts each page with "{page_id}" plus 48 dashes
+# when paginate_output is set
+PAGE_SEPARATOR = re.compile(r"^\{(\d+)\}-{48}$", re.MULTILINE)
+
+
+def split_paginated_markdown(markdown_text: str) -> Dict[int, str]:
+    """Split marker's paginated markdown into the markdown of each page, keyed by page index"""
+    parts = PAGE_SEPARATOR.split(markdown_text)
+    # parts is [preamble, page_id, text, page_id, text, ...]
+    return {int(page_id): text.strip() for page_id, text in zip(parts[1::2], parts[2::2])}
+
+
+def merge_pages(pages: List[PageTriage], texts: Dict[int, str], marker_markdown: str) -> str:
+    """
+    Put the text-path pages and marker's pages back together in page order.
+
+    Args:
+    pages (List[PageTriage]): The triage result of every page.
+    texts (Dict[int, str]): Extracted text of the text-path pages.
+    marker_markdown (str): Paginated markdown marker produced for the other pages.
+
+    Returns:
+    str: The markdown of the whole document.
+    """
+    marker_pages = split_paginated_markdown(marker_markdown)
+    if marker_markdown.strip() and not marker_pages:
+        # No page markers to split on; keep marker's output at its first page
+        first = next(p.page for p in pages if p.path == MARKER_PATH)
+        marker_pages = {first: marker_markdown.strip()}
+
+    parts = []
+    for page in pages:
+        text = texts.get(page.page) if page.path == TEXT_PATH else marker_pages.get(page.page)
+        if text:
+            parts.append(text)
+    return "\n\n".join(parts)
@@ -0,0 +1,244 @@
+import os
+import re
+import json
+import time
+import uuid
+import fcntl
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+
+from marker_api.spool import SPOOL_DIR
+
+logger = logging.getLogger(__name__)
+
+# Where partial uploads are spooled. In the distributed setup only the API
+# server touches them; the finished document is sent to Celery as usual.
+# Inside the spool directory by default, so the sweepers share a disk; they
+# are bounded by MAX_UPLOAD_SIZE and UPLOAD_TTL rather than the spool quota.
+UPLOAD_DIR = os.environ.get("MARKER_UPLOAD_DIR", os.path.join(SPOOL_DIR, "uploads"))
+# Unfinished uploads are removed after this many seconds without a chunk
+UPLOAD_TTL = int(os.environ.get("MARKER_UPLOAD_TTL", 24 * 3600))
+MAX_CHUNK_SIZE = int(os.environ.get("MARKER_UPLOAD_MAX_CHUNK_SIZE", 64 * 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.environ.get("MARKER_UPLOAD_MAX_SIZE", 2 * 1024 * 1024 * 1024))
+
+UPLOAD_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _meta_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{upload_id}.json")
+
+
+def _data_path(upload_id: str) -> str:
+    return os.path.join(UPLOAD_DIR, f"{upload_id}.part")
+
+
+def _not_found() -> HTTPException:
+    return HTTPException(status_code=404, detail="Upload not found")
+
+
+def _load_meta(upload_id: str) -> Dict[str, Any]:
+    if not UPLOAD_ID_PATTERN.fullmatch(upload_id):
+        raise _not_found()
+    try:
+        with open(_meta_path(upload_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise _not_found()
+
+
+def _status(upload_id: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        offset = os.path.getsize(_data_path(upload_id))
+    except FileNotFoundError:
+        # Finalized by a concurrent request, or swept as expired
+        raise _not_found()
+    return {
+        "upload_id": upload_id,
+        "filename": meta["filename"],
+        "size": meta["size"],
+        "offset": offset,
+        "complete": offset == meta["size"],
+    }
+
+
+def sweep_expired_uploads():
+    """Remove uploads that haven't received a chunk within UPLOAD_TTL"""
+    if not os.path.isdir(UPLOAD_DIR):
+        return
+    cutoff = time.time() - UPLOAD_TTL
+    for name in os.listdir(UPLOAD_DIR):
+        upload_id, extension = os.path.splitext(name)
+        path = os.path.join(UPLOAD_DIR, name)
+        try:
+            # The data file's mtime moves with every chunk; the metadata's doesn't
+            if extension == ".json" and os.path.exists(_data_path(upload_id)):
+                continue
+            if os.path.getmtime(path) < cutoff:
+                discard_upload(upload_id, path)
+                logger.info(f"Removed expired upload {upload_id}")
+        except FileNotFoundError:
+            pass
+
+
+def upload_stats() -> Dict[str, Any]:
+    """Space taken by resumable uploads, which the spool's quota leaves out, for the stats endpoints"""
+    used = in_progress = 0
+    try:
+        entries = list(os.scandir(UPLOAD_DIR))
+    except FileNotFoundError:
+        entries = []
+    for entry in entries:
+        try:
+            used += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            continue
+        if entry.name.endswith(".json"):
+            in_progress += 1
+    return {"path": UPLOAD_DIR, "used_bytes": used, "in_progress": in_progress}
+
+
+def create_upload(
+    filename: str,
+    size: int,
+    sha256: Optional[str] = None,
+    max_size: int = MAX_UPLOAD_SIZE,
+) -> Dict[str, Any]:
+    """
+    Start a resumable upload.
+
+    Args:
+    filename (str): Name of the document, used for its extension.
+    size (int): Total size in bytes.
+    sha256 (Optional[str]): Expected hash, checked when the upload is finalized.
+    max_size (int): Largest upload accepted; MARKER_UPLOAD_MAX_SIZE by default.
+
+    Returns:
+    Dict[str, Any]: The upload status, including its ``upload_id``.
+    """
+    if size <= 0 or size > max_size:
+        raise HTTPException(status_code=413, detail=f"Uploads must be 1 to {max_size} bytes")
+
+    sweep_expired_uploads()
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    upload_id = uuid.uuid4().hex
+    meta = {
+        "filename": os.path.basename(filename),
+        "size": size,
+        "sha256": sha256.lower() if sha256 else None,
+        "created": time.time(),
+    }
+    open(_data_path(upload_id), "wb").close()
+    with open(_meta_path(upload_id), "w") as f:
+        json.dump(meta, f)
+    logger.info(f"Created upload {upload_id} for {meta['filename']} ({size} bytes)")
+    return _status(upload_id, meta)
+
+
+def upload_status(upload_id: str) -> Dict[str, Any]:
+    """Current offset of an upload, for resuming it"""
+    return _status(upload_id, _load_meta(upload_id))
+
+
+def write_chunk(upload_id: str, offset: int, data: bytes) -> Dict[str, Any]:
+    """
+    Append a chunk at ``offset``, which must be the upload's current length.
+
+    A client that lost track of what arrived asks for the offset with
+    ``upload_status`` and continues from there.
+    """
+    meta = _load_meta(upload_id)
+    if offset + len(data) > meta["size"]:
+        raise HTTPException(status_code=413, detail="Chunk goes past the declared upload size")
+
+    try:
+        f = open(_data_path(upload_id), "r+b")
+    except FileNotFoundError:
+        raise _not_found()
+    with f:
+        # Serialize writers across API processes
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"Upload is at offset {current}, not {offset}",
+                    headers={"Upload-Offset": str(current)},
+                )
+            f.seek(offset)
+            f.write(data)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return _status(upload_id, meta)
+
+
+def finalize_upload(upload_id: str) -> Tuple[str, str, str]:
+    """
+    Check that an upload is complete and intact and move it into place for conversion.
+
+    Returns:
+    Tuple[str, str, str]: The document's filename, the path of its data
+    (with the document's extension) and its SHA-256.
+    """
+    meta = _load_meta(upload_id)
+    status = _status(upload_id, meta)
+    if not status["complete"]:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload is incomplete: {status['offset']} of {meta['size']} bytes",
+            headers={"Upload-Offset": str(status["offset"])},
+        )
+
+    digest = hashlib.sha256()
+    try:
+        with open(_data_path(upload_id), "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    except FileNotFoundError:
+        raise _not_found()
+    sha256 = digest.hexdigest()
+    if meta["sha256"] and meta["sha256"] != sha256:
+        discard_upload(upload_id)
+        raise HTTPException(status_code=422, detail="Upload does not match the declared sha256")
+
+    # Keep the extension; marker picks the provider by file type
+    _, extension = os.path.splitext(meta["filename"])
+    path = os.path.join(UPLOAD_DIR, f"{upload_id}{extension or '.pdf'}")
+    try:
+        os.replace(_data_path(upload_id), path)
+    except FileNotFoundError:
+        # Another request finalized it first
+        raise _not_found()
+    # Restart the expiry clock, or an upload whose last chunk arrived long ago
+    # could be swept while it is being converted
+    os.utime(path)
+    try:
+        os.unlink(_meta_path(upload_id))
+    except FileNotFoundError:
+        pass
+    return meta["filename"], path, sha256
+
+
+def discard_upload(upload_id: str, path: Optional[str] = None):
+    """Remove an upload's files, whether or not it was finalized"""
+    for candidate in (_meta_path(upload_id), _data_path(upload_id), path):
+        try:
+            if candidate:
+                os.unlink(candidate)
+        except FileNotFoundError:
+            pass
+
+
+async def read_chunk(request: Request) -> bytes:
+    """Read a chunk from the request body, refusing chunks above MAX_CHUNK_SIZE"""
+    chunks = []
+    received = 0
+    async for data in request.stream():
+        received += len(data)
+        if received > MAX_CHUNK_SIZE:
+            raise HTTPException(status_code=413, detail=f"Chunks are limited to {MAX_CHUNK_SIZE} bytes")
+        chunks.append(data)
+    return b"".join(chunks)
@@ -1,11 +1,14 @@
 import base64
-import torch
 from enum import Enum
-import pynvml
 import io
-from art import text2art
-from PIL import Image
+import os
 import logging
+from typing import TYPE_CHECKING
+
+# torch, pynvml, art and PIL are imported where they are used, so the API
+# process can import this module without loading them
+if TYPE_CHECKING:
+    from PIL import Image
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +18,7 @@ class DeviceType(Enum):
     GPU = "gpu"
 
 
-def process_image_to_base64(image: Image.Image, filename: str) -> str:
+def process_image_to_base64(image: "Image.Image", filename: str) -> str:
     """
     Process an image and convert it to base64.
 
@@ -45,26 +48,19 @@ def get_ram_available():
     """
     Function to get VRAM/RAM availability on device
 
-    Used to set the number of workers
+    Used to set the number of workers. On GPUs this is the free memory of
+    this process's assigned device, or of all visible devices combined.
 
     """
+    import torch
+    from marker_api.devices import list_devices
 
     if torch.cuda.is_available():
-        # Initialize NVML to access GPU memory info
-        pynvml.nvmlInit()
-
-        # Get handle for the first GPU
-        handle = pynvml.nvmlDeviceGetHandleByIndex(0)
-
-        # Get memory info
-        mem_info = pynvml.nvmlDeviceGetMemoryInfo(handle)
-
-        # Calculate available VRAM in MB
-        ram_available = mem_info.free // (1024**2)  # Convert bytes to MB
-
-        # Cleanup NVML
-        pynvml.nvmlShutdown()
-
+        gpus = [device for device in list_devices() if not device.simulated]
+        assigned = os.environ.get("MARKER_ASSIGNED_DEVICE")
+        if assigned is not None:
+            gpus = [device for device in gpus if device.index == int(assigned)]
+        ram_available = sum(device.free_mb for device in gpus)
         return DeviceType.GPU, ram_available
 
     else:
@@ -79,6 +75,8 @@ def get_ram_available():
 
 
 def print_markerapi_text_art(suffix=None):
+    from art import text2art
+
     font = "nancyj"
     ascii_text = "Marker-api"
     if suffix:
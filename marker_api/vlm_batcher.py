@@ -0,0 +1,100 @@
+import asyncio
+import logging
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class VLMBatcher:
+    """
+    Collects image-description requests and sends them as one batched call.
+
+    Requests are buffered until ``max_batch_size`` are pending or the oldest
+    has waited ``max_wait_ms``. ``send_batch`` is a blocking function that
+    takes the list of payloads and returns one result per payload (either the
+    description or an Exception); it runs in a thread so the loop stays free.
+    Each caller gets back the answer for its own payload.
+    """
+
+    def __init__(
+        self,
+        send_batch: Callable[[List[Dict[str, Any]]], List[Any]],
+        max_batch_size: int,
+        max_wait_ms: float,
+    ):
+        self.send_batch = send_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks; hold the in-flight
+        # sends so they can't be garbage collected mid-batch
+        self._sending: Set[asyncio.Task] = set()
+
+    async def submit(self, payload: Dict[str, Any]) -> str:
+        """Queue a payload for the next batch and wait for its description"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((payload, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[: self.max_batch_size], self._pending[self.max_batch_size:]
+        if batch:
+            task = asyncio.ensure_future(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+        if self._pending:
+            # More requests arrived than fit in one batch; start the next window
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush)
+
+    async def _send(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        payloads = [payload for payload, _ in batch]
+        logger.info(f"Sending batch of {len(payloads)} image description requests")
+        try:
+            results = await asyncio.to_thread(self.send_batch, payloads)
+            if len(results) != len(batch):
+                raise ValueError(
+                    f"VLM endpoint returned {len(results)} responses for {len(batch)} requests"
+                )
+        except Exception as e:
+            results = [e] * len(batch)
+
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+# One batcher per event loop: on a worker that is the persistent loop shared
+# by all tasks in the process, so requests from different documents batch together.
+_batchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, VLMBatcher]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_batcher(
+    send_batch: Callable[[List[Dict[str, Any]]], List[Any]],
+    max_batch_size: int,
+    max_wait_ms: float,
+) -> VLMBatcher:
+    """Return the batcher of the running event loop, creating it if needed"""
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        batcher = VLMBatcher(send_batch, max_batch_size, max_wait_ms)
+        _batchers[loop] = batcher
+    return batcher
@@ -0,0 +1,117 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+from marker_api.model.schema import ConversionOptions, ImageMode
+from marker_api.spool import spooled_async
+
+logger = logging.getLogger(__name__)
+
+# Load the models and run a tiny document through the pipeline at startup
+WARMUP = os.environ.get("MARKER_WARMUP", "true").lower() == "true"
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+
+# Everything that could leave the process (LLM, VLM, artifact storage) is off
+WARMUP_OPTIONS = ConversionOptions(
+    use_llm=False,
+    describe_images=False,
+    image_mode=ImageMode.none,
+    fast_path=False,
+)
+
+
+def tiny_pdf() -> bytes:
+    """A one-page PDF with a line of text, enough to exercise every model"""
+    stream = b"BT /F1 24 Tf 72 700 Td (Marker warm-up page) Tj ET"
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+        b"/Resources << /Font << /F1 4 0 R >> >> /Contents 5 0 R >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return pdf
+
+
+class WarmupState:
+    """Progress of this process's warm-up, reported by the readiness endpoint"""
+
+    def __init__(self):
+        self.status = PENDING if WARMUP else READY
+        self.started: Optional[float] = None
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == READY
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "warmup_seconds": round(self.duration, 2) if self.duration is not None else None,
+            "error": self.error,
+        }
+
+    async def run(self):
+        """
+        Load the models and convert a tiny PDF, so the first real request
+        doesn't pay for lazy initialization.
+
+        Runs once; later calls return immediately.
+        """
+        with self._lock:
+            if self.status != PENDING:
+                return
+            self.status = RUNNING
+            self.started = time.perf_counter()
+
+        # Imported here so only processes that convert documents load marker
+        from marker_api.models import get_converter, get_model_dict
+        from marker_api.routes import convert_document
+
+        logger.info("Warming up: loading models")
+        try:
+            await asyncio.to_thread(get_model_dict)
+
+            async with spooled_async("warmup.pdf", tiny_pdf()) as path:
+                await convert_document(str(path), WARMUP_OPTIONS)
+
+            try:
+                # Prebuild the converter for the default options as well
+                await asyncio.to_thread(get_converter, ConversionOptions())
+            except KeyError as e:
+                logger.warning(f"Skipped building the default converter, {e} is not set")
+        except Exception as e:
+            self.error = str(e)
+            self.status = FAILED
+            logger.error(f"Warm-up failed: {e}")
+        else:
+            self.status = READY
+        finally:
+            self.duration = time.perf_counter() - self.started
+            logger.info(f"Warm-up finished in {self.duration:.1f}s ({self.status})")
+
+
+warmup_state = WarmupState()
@@ -0,0 +1,81 @@
+import os
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Coroutine, Optional
+
+logger = logging.getLogger(__name__)
+
+# One event loop per worker process, running in a background thread. Tasks
+# submit coroutines to it instead of creating and tearing down a loop with
+# asyncio.run, so I/O from different tasks (e.g. image descriptions) can
+# overlap and loop-bound resources survive between tasks.
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_pid: Optional[int] = None
+_lock = threading.Lock()
+
+# Blocking I/O (boto3 calls) is pushed to the loop's default executor. It is
+# shared by every task in the process, so size it for all of their calls
+# rather than asyncio's default of min(32, cpu_count + 4).
+IO_THREADS = int(os.environ.get("WORKER_LOOP_IO_THREADS", 64))
+
+
+def _run_loop(loop: asyncio.AbstractEventLoop):
+    asyncio.set_event_loop(loop)
+    loop.run_forever()
+
+
+def get_worker_loop() -> asyncio.AbstractEventLoop:
+    """
+    Return this process's persistent event loop, starting it if needed.
+
+    The loop is recreated after a fork, since the thread running the parent's
+    loop does not exist in the child.
+    """
+    global _loop, _loop_pid
+
+    with _lock:
+        if _loop is None or _loop_pid != os.getpid() or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _loop.set_default_executor(
+                ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="worker-io")
+            )
+            _loop_pid = os.getpid()
+            thread = threading.Thread(
+                target=_run_loop, args=(_loop,), name="worker-event-loop", daemon=True
+            )
+            thread.start()
+            logger.info(f"Started persistent event loop in process {_loop_pid}")
+        return _loop
+
+
+def run_coroutine(coro: Coroutine, timeout: Optional[float] = None) -> Any:
+    """
+    Run a coroutine on the persistent loop and block until it finishes.
+
+    Args:
+    coro (Coroutine): The coroutine to run.
+    timeout (Optional[float]): Seconds to wait before giving up.
+
+    Returns:
+    Any: The coroutine's result. Exceptions raised by it propagate.
+    """
+    future = asyncio.run_coroutine_threadsafe(coro, get_worker_loop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        # Don't leave the coroutine running if the caller stops waiting,
+        # e.g. on timeout or SoftTimeLimitExceeded
+        future.cancel()
+        raise
+
+
+def stop_worker_loop():
+    """Stop the persistent loop of this process, if it was started"""
+    global _loop
+
+    with _lock:
+        if _loop is not None and _loop_pid == os.getpid() and not _loop.is_closed():
+            _loop.call_soon_threadsafe(_loop.stop)
+        _loop = None
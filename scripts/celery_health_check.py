@@ -12,6 +12,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+from marker_api.devices import device_stats
+from marker_api.heartbeat import worker_health
+from marker_api.spool import spool_stats
+
 app = Flask(__name__)
 
 # Get the health check path from environment or use default
@@ -20,46 +24,26 @@ health_check_path = os.environ.get(
     '/qsynthesis/container/marker-celery-worker-9v1tr-health'
 )
 
-# Global variable to track worker status
-worker_status = {"status": "starting", "service": "celery-worker"}
-
 @app.route('/health', methods=['GET'])  # Additional simple health endpoint
 @app.route('/', methods=['GET'])        # Root path for simple testing
 @app.route(health_check_path, methods=['GET'])  # The actual path checked by the deployment platform
 def health_check():
-    logger.info(f"Health check requested")
-    # Always return 200 for health checks to allow the container to start up
-    return jsonify(worker_status), 200
+    # Read the heartbeat files the local worker processes keep up to date,
+    # instead of broadcasting inspect() to every worker in the cluster
+    status = {"service": "celery-worker", **worker_health()}
+    # 200 while starting so the container can come up; 503 once the worker
+    # stops beating or has exited
+    return jsonify(status), 503 if status["status"] in ("stale", "dead") else 200
 
-def update_worker_status():
-    """Function to periodically update worker status in the background"""
-    global worker_status
-    
-    while True:
-        try:
-            # Import and use Celery's inspection API to check worker status
-            from marker_api.celery_worker import celery_app
-            
-            inspection = celery_app.control.inspect()
-            active_workers = inspection.active()
-            
-            if active_workers:
-                logger.info(f"Active workers: {list(active_workers.keys())}")
-                worker_status = {
-                    "status": "ok", 
-                    "service": "celery-worker", 
-                    "workers": list(active_workers.keys())
-                }
-            else:
-                logger.info("No active workers found yet")
-                worker_status = {"status": "starting", "service": "celery-worker"}
-        except Exception as e:
-            logger.error(f"Error checking worker status: {str(e)}")
-            worker_status = {"status": "starting", "service": "celery-worker", "error": str(e)}
-        
-        # Check every 10 seconds
-        import time
-        time.sleep(10)
+@app.route('/devices', methods=['GET'])
+def devices():
+    # GPU memory and utilization, and which worker processes use each GPU
+    return jsonify(device_stats()), 200
+
+@app.route('/spool/stats', methods=['GET'])
+def spool():
+    # Disk and tmpfs usage of the document spool the worker processes share
+    return jsonify(spool_stats()), 200
 
 def start_celery():
     logger.info("Starting Celery worker...")
@@ -89,11 +73,6 @@ if __name__ == '__main__':
     celery_thread.daemon = True
     celery_thread.start()
     
-    # Start a background thread to update worker status 
-    status_thread = threading.Thread(target=update_worker_status)
-    status_thread.daemon = True
-    status_thread.start()
-    
     # Log the port we're running on
     port = 8080
     logger.info(f"Starting Flask health check server on port {port}")
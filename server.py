@@ -1,11 +1,12 @@
 import os
 import asyncio
 import argparse
-import tempfile
-from fastapi import FastAPI, Form, Query, UploadFile, File, APIRouter
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, Form, Header, Query, UploadFile, File, APIRouter
+from fastapi import Path as FastAPIPath
+from fastapi import Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Optional
+from typing import Awaitable, Callable, List, Dict, Optional
 import traceback
 from pathlib import Path
 import uuid
@@ -13,17 +14,36 @@ import concurrent.futures
 from marker.logger import configure_logging  # Import logging configuration
 # from marker.models import load_all_models  # Import function to load models
 from marker_api.routes import (
+    convert_document,
     process_document,
 )
+from marker_api.artifacts import artifact_response
+from marker_api.dedup import InflightRegistry, ResultCache, content_key, hash_key, request_keys
+from marker_api.uploads import (
+    create_upload,
+    discard_upload,
+    finalize_upload,
+    read_chunk,
+    upload_stats,
+    upload_status,
+    write_chunk,
+)
 from marker_api.utils import print_markerapi_text_art
+from marker_api.devices import assign_device, device_stats, mark_loaded, release_device
+from marker_api.spool import spool_stats, spooled_async, start_sweeper
+from marker_api.warmup import FAILED, warmup_state
 from contextlib import asynccontextmanager
 import logging
 # import gradio as gr
 from marker_api.model.schema import (
     BatchConversionResponse,
+    ConversionOptions,
     ConversionResponse,
     HealthResponse,
+    ImageMode,
     ServerType,
+    UploadCreateRequest,
+    UploadStatus,
 )
 # from marker_api.demo import demo_ui
 from marker_api.routes import process_document
@@ -45,7 +65,21 @@ async def lifespan(app: FastAPI):
     logger.debug("--------------------- Loading OCR Model -----------------------")
     print_markerapi_text_art()
     # model_list = load_all_models()
+    # Warm up in the background so /livez answers while the models load;
+    # /readyz reports ready once they have
+    # Pick a GPU first, so several server processes on one node spread out
+    await asyncio.to_thread(assign_device)
+    # Remove spool files of server processes that died mid-conversion
+    start_sweeper()
+    warmup = asyncio.create_task(warm_up())
     yield
+    warmup.cancel()
+    release_device()
+
+
+async def warm_up():
+    await warmup_state.run()
+    await asyncio.to_thread(mark_loaded)
 
 # Initialize FastAPI app
 load_dotenv(override=True)
@@ -75,42 +109,225 @@ def server():
     """
     return HealthResponse(message="Welcome to Marker-api", type=ServerType.simple)
 
+
+@app.get("/livez")
+def livez():
+    """Liveness probe. Fails only if the warm-up failed, so the pod gets restarted."""
+    status_code = 503 if warmup_state.status == FAILED else 200
+    return JSONResponse(warmup_state.to_dict(), status_code=status_code)
+
+
+@app.get("/devices")
+def devices():
+    """Memory and utilization of the GPUs, and the processes assigned to each"""
+    return device_stats()
+
+
+@app.get("/spool/stats")
+def spool():
+    """Disk and tmpfs usage of the spool against its quotas, and of resumable uploads"""
+    return {**spool_stats(), "uploads": upload_stats()}
+
+
+@app.get("/readyz")
+def readyz():
+    """Readiness probe. Ready once the models are loaded and warmed up."""
+    return JSONResponse(warmup_state.to_dict(), status_code=200 if warmup_state.ready else 503)
+
+# Conversions currently running in this process, keyed by content hash and idempotency key
+inflight_conversions = InflightRegistry()
+# Finished conversions, keyed by content hash, so unchanged documents aren't converted again
+RESULT_CACHE_SIZE = int(os.environ.get("MARKER_RESULT_CACHE_SIZE", 128))
+# Inline images can make a single result hundreds of MB
+RESULT_CACHE_BYTES = int(os.environ.get("MARKER_RESULT_CACHE_BYTES", 256 * 1024 * 1024))
+conversion_results = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_BYTES)
+
+
+async def convert_uploaded_file(filename: str, file_content: bytes, options: ConversionOptions):
+    """
+    Write an uploaded document to the spool and convert it.
+    """
+    async with spooled_async(filename, file_content) as path:
+        return await convert_document(str(path), options)
+
+
 # Endpoint to convert a single PDF to markdown
 @app.post("/convert", response_model=ConversionResponse)
-async def convert_document_to_markdown(document_file: UploadFile):
+async def convert_document_to_markdown(
+    document_file: UploadFile,
+    options: ConversionOptions = Depends(),
+    idempotency_key: Optional[str] = Header(None),
+):
     """
     Endpoint to convert various document types to markdown.
+
+    The conversion options are passed as query parameters (see
+    ``ConversionOptions``). ``image_mode`` controls whether extracted images
+    are omitted, inlined as base64, or stored as artifacts fetchable from
+    ``/artifacts/{id}``. ``timings`` adds the duration of each conversion
+    stage to the response.
+
+    A resubmission of a document that is still being converted (same content
+    and options, or same ``Idempotency-Key`` header) waits for the running
+    conversion instead of starting a new one, and one that was converted
+    recently is answered from the result cache.
     """
     logger.debug(f"Received file: {document_file.filename}")
-    
-    # Save uploaded file to a temporary location
-    _, file_extension = os.path.splitext(document_file.filename)
-    temp_file = tempfile.NamedTemporaryFile(suffix=file_extension, delete=False)
-    temp_file_path = temp_file.name
-    temp_file.close()
-    
+
     try:
-        # Write the uploaded file content to the temporary file
         file_content = await document_file.read()
-        with open(temp_file_path, 'wb') as f:
-            f.write(file_content)
-        
-        # Process the document
-        markdown_text = await process_document(temp_file_path)
-        
-        return ConversionResponse(status="Success", result=markdown_text)
+        result = await deduplicated_conversion(
+            document_file.filename,
+            content_key(file_content, options.model_dump(mode="json")),
+            idempotency_key,
+            lambda: convert_uploaded_file(document_file.filename, file_content, options),
+        )
+        return conversion_response(result, options)
         
     except Exception as e:
         logger.error(f"Error processing {document_file.filename}: {str(e)}")
         logger.error(traceback.format_exc())
         return ConversionResponse(status="Error", result=f"Failed to process document: {str(e)}")
-        
+
+
+async def deduplicated_conversion(
+    filename: str,
+    dedup_key: str,
+    idempotency_key: Optional[str],
+    factory: Callable[[], Awaitable[Dict]],
+) -> Dict:
+    """
+    Return a cached result, wait for an identical running conversion, or start ``factory``.
+    """
+    cached = conversion_results.get(dedup_key)
+    if cached is not None:
+        logger.info(f"Returning cached conversion of {filename}")
+        return cached
+
+    keys = request_keys(dedup_key, idempotency_key)
+    conversion, deduplicated = inflight_conversions.get_or_start(keys, factory)
+    if deduplicated:
+        logger.info(f"Deduplicated conversion of {filename}")
+
+    # Shield the shared conversion so a disconnecting client doesn't cancel it for others
+    result = await asyncio.shield(conversion)
+    conversion_results.put(dedup_key, result)
+    return result
+
+
+def conversion_response(result: Dict, options: ConversionOptions) -> ConversionResponse:
+    return ConversionResponse(
+        status="Success",
+        result=result["markdown"],
+        images=result["images"] if options.image_mode != ImageMode.none else None,
+        pages=result.get("pages"),
+        converted_pages=result.get("converted_pages"),
+        timings=result.get("timings"),
+    )
+
+
+# Endpoint to check for a finished conversion by document hash before uploading it
+@app.api_route("/lookup/{sha256}", methods=["GET", "HEAD"], response_model=ConversionResponse)
+async def lookup_conversion(
+    sha256: str = FastAPIPath(..., pattern="^[0-9a-f]{64}$"),
+    options: ConversionOptions = Depends(),
+):
+    """
+    Look up the result of a document by the SHA-256 of its contents.
+
+    Returns the cached result (200), 202 while a conversion of the document
+    is running, or 404 if it has to be uploaded.
+    """
+    dedup_key = hash_key(sha256, options.model_dump(mode="json"))
+    cached = conversion_results.get(dedup_key)
+    if cached is not None:
+        return conversion_response(cached, options)
+    if inflight_conversions.running(request_keys(dedup_key)[-1]):
+        return JSONResponse(status_code=202, content={"status": "Processing"})
+    return JSONResponse(status_code=404, content={"status": "Not found"})
+
+
+# Resumable uploads: create a session, PUT chunks at increasing offsets, then finalize
+@app.post("/uploads", response_model=UploadStatus, status_code=201)
+def start_upload(request: UploadCreateRequest):
+    return create_upload(request.filename, request.size, request.sha256)
+
+
+@app.get("/uploads/{upload_id}", response_model=UploadStatus)
+def get_upload(upload_id: str):
+    return upload_status(upload_id)
+
+
+@app.head("/uploads/{upload_id}")
+def head_upload(upload_id: str):
+    status = upload_status(upload_id)
+    return Response(
+        headers={"Upload-Offset": str(status["offset"]), "Upload-Length": str(status["size"])}
+    )
+
+
+@app.put("/uploads/{upload_id}", response_model=UploadStatus)
+async def put_upload_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    data = await read_chunk(request)
+    return await asyncio.to_thread(write_chunk, upload_id, offset, data)
+
+
+@app.delete("/uploads/{upload_id}", status_code=204)
+def delete_upload(upload_id: str):
+    upload_status(upload_id)
+    discard_upload(upload_id)
+
+
+@app.post("/uploads/{upload_id}/finalize", response_model=ConversionResponse)
+async def finalize_upload_and_convert(
+    upload_id: str,
+    options: ConversionOptions = Depends(),
+    idempotency_key: Optional[str] = Header(None),
+):
+    """
+    Convert a completed upload. Answers like ``/convert``.
+    """
+    filename, path, sha256 = await asyncio.to_thread(finalize_upload, upload_id)
+
+    started = []
+
+    async def convert():
+        try:
+            return await convert_document(path, options)
+        finally:
+            discard_upload(upload_id, path)
+
+    def start_conversion():
+        started.append(True)
+        return convert()
+
+    try:
+        result = await deduplicated_conversion(
+            filename,
+            hash_key(sha256, options.model_dump(mode="json")),
+            idempotency_key,
+            start_conversion,
+        )
+        return conversion_response(result, options)
+    except Exception as e:
+        logger.error(f"Error processing {filename}: {str(e)}")
+        logger.error(traceback.format_exc())
+        return ConversionResponse(status="Error", result=f"Failed to process document: {str(e)}")
     finally:
-        # Clean up the temporary file
-        if os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
+        # The upload isn't needed if the result was cached or already being converted;
+        # otherwise the conversion removes it once done
+        if not started:
+            discard_upload(upload_id, path)
 
 
+# Endpoint to fetch an image artifact produced in artifact image mode
+@app.get("/artifacts/{artifact_id}")
+def get_artifact(artifact_id: str, range: Optional[str] = Header(None)):
+    """
+    Serve a stored artifact. Supports single byte-range requests.
+    """
+    return artifact_response(artifact_id, range)
+
 
 # # Endpoint to convert multiple PDFs to markdown
 # @app.post("/batch_convert", response_model=BatchConversionResponse)
@@ -273,6 +490,15 @@ async def read_root():
                 <div class="route">
                     <strong>2. /convert</strong> - Convert uploaded documents to markdown.
                 </div>
+                <div class="route">
+                    <strong>3. /artifacts/{id}</strong> - Fetch an extracted image artifact.
+                </div>
+                <div class="route">
+                    <strong>4. /lookup/{sha256}</strong> - Check for a finished conversion of a document by hash.
+                </div>
+                <div class="route">
+                    <strong>5. /uploads</strong> - Resumable chunked upload of large documents.
+                </div>
             </div>
             
             <p>Make sure to use the above endpoints for server functionality.</p>
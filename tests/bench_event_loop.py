@@ -0,0 +1,68 @@
+"""
+Benchmark: asyncio.run per task vs the worker's persistent event loop.
+
+Simulates Celery tasks that each describe a few images. Every image call is a
+blocking request pushed to a thread (like the boto3 ``invoke_endpoint`` call in
+``process_image_direct``). Runs the tasks sequentially (prefork/solo pool) and
+from a thread pool (threads pool), once with ``asyncio.run`` per task and once
+with ``marker_api.worker_loop.run_coroutine``.
+
+    python tests/bench_event_loop.py --tasks 200 --images 4 --latency 0.02
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from marker_api.worker_loop import run_coroutine, stop_worker_loop  # noqa: E402
+
+
+async def fake_document(images: int, latency: float):
+    async def describe():
+        await asyncio.to_thread(time.sleep, latency)
+
+    await asyncio.gather(*(describe() for _ in range(images)))
+
+
+def per_task_loop(images, latency):
+    asyncio.run(fake_document(images, latency))
+
+
+def persistent_loop(images, latency):
+    run_coroutine(fake_document(images, latency))
+
+
+def bench(runner, tasks, images, latency, concurrency):
+    start = time.perf_counter()
+    if concurrency == 1:
+        for _ in range(tasks):
+            runner(images, latency)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: runner(images, latency), range(tasks)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark worker event loop strategies.")
+    parser.add_argument("--tasks", type=int, default=200, help="Number of simulated tasks")
+    parser.add_argument("--images", type=int, default=4, help="Image calls per task")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds per image call")
+    parser.add_argument("--concurrency", type=int, default=8, help="Threads for the threaded run")
+    args = parser.parse_args()
+
+    print(f"{args.tasks} tasks x {args.images} image calls of {args.latency * 1000:.0f} ms")
+    print(f"{'strategy':<18}{'pool':<12}{'total s':>10}{'ms/task':>10}")
+    for concurrency, pool in ((1, "sequential"), (args.concurrency, f"threads={args.concurrency}")):
+        for name, runner in (("asyncio.run", per_task_loop), ("persistent loop", persistent_loop)):
+            elapsed = bench(runner, args.tasks, args.images, args.latency, concurrency)
+            print(f"{name:<18}{pool:<12}{elapsed:>10.2f}{elapsed / args.tasks * 1000:>10.2f}")
+    stop_worker_loop()
+
+
+if __name__ == "__main__":
+    main()
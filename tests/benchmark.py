@@ -0,0 +1,199 @@
+"""
+Offline end-to-end benchmark for server.py and distributed_server.py.
+
+Sends the PDFs in --pdf-dir to a running server with a fixed concurrency and
+reports latency percentiles, documents per minute and pages per second.
+
+Simple server, started by the harness together with the local VLM stub:
+
+    python tests/benchmark.py --launch --requests 20 --concurrency 2
+
+Distributed server (start Redis, the workers and distributed_server.py with
+SAGEMAKER_ENDPOINT_URL pointing at `python tests/vlm_stub.py` first):
+
+    python tests/benchmark.py --mode distributed --url http://localhost:8080
+
+Note that marker's own LLM service (use_llm) still calls its configured
+remote; only the image-description endpoint is replaced by the stub.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from vlm_stub import StubConfig, start_stub
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def count_pages(path):
+    """Page count via pypdfium2 when installed, otherwise a rough parse of the PDF"""
+    try:
+        import pypdfium2
+
+        return len(pypdfium2.PdfDocument(path))
+    except ImportError:
+        with open(path, "rb") as f:
+            return max(len(re.findall(rb"/Type\s*/Page[^s]", f.read())), 1)
+
+
+def convert_simple(session, url, path):
+    with open(path, "rb") as f:
+        response = session.post(
+            f"{url}/convert",
+            files={"document_file": (os.path.basename(path), f, "application/pdf")},
+        )
+    response.raise_for_status()
+    body = response.json()
+    if body.get("status") != "Success":
+        raise RuntimeError(body.get("result"))
+
+
+def convert_distributed(session, url, path, poll_interval=1.0, timeout=1800):
+    with open(path, "rb") as f:
+        response = session.post(
+            f"{url}/celery/convert",
+            files={"pdf_file": (os.path.basename(path), f, "application/pdf")},
+        )
+    response.raise_for_status()
+    task_id = response.json()["task_id"]
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = session.get(f"{url}/celery/result/{task_id}")
+        if response.status_code == 200:
+            result = response.json().get("result") or {}
+            if result.get("status") == "Error":
+                raise RuntimeError(result.get("error"))
+            return
+        time.sleep(poll_interval)
+    raise TimeoutError(f"Task {task_id} did not finish in {timeout}s")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def run(args, pdfs):
+    convert = convert_simple if args.mode == "simple" else convert_distributed
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    jobs = [random.choice(pdfs) for _ in range(args.requests)]
+    latencies, pages_done, errors = [], 0, []
+
+    def timed(path):
+        start = time.perf_counter()
+        convert(session, args.url, path)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = {pool.submit(timed, path): path for path in jobs}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                latencies.append(future.result())
+                pages_done += pdfs[path]
+            except Exception as e:
+                errors.append(f"{os.path.basename(path)}: {e}")
+    wall = time.perf_counter() - start
+
+    report = {
+        "mode": args.mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "succeeded": len(latencies),
+        "failed": len(errors),
+        "wall_seconds": round(wall, 2),
+        "docs_per_minute": round(len(latencies) / wall * 60, 2),
+        "pages_per_second": round(pages_done / wall, 3),
+    }
+    if latencies:
+        for pct in (50, 95, 99):
+            report[f"p{pct}_seconds"] = round(percentile(latencies, pct), 2)
+    return report, errors
+
+
+def launch_simple_server(args):
+    env = dict(
+        os.environ,
+        SAGEMAKER_ENDPOINT_URL=f"http://127.0.0.1:{args.stub_port}",
+        SAGEMAKER_AWS_ACCESS_KEY_ID=os.environ.get("SAGEMAKER_AWS_ACCESS_KEY_ID", "stub"),
+        SAGEMAKER_AWS_SECRET_ACCESS_KEY=os.environ.get("SAGEMAKER_AWS_SECRET_ACCESS_KEY", "stub"),
+    )
+    port = args.url.rsplit(":", 1)[-1].rstrip("/")
+    process = subprocess.Popen(
+        [sys.executable, "server.py", "--host", "127.0.0.1", "--port", port], cwd=ROOT, env=env
+    )
+    for _ in range(300):
+        try:
+            if requests.get(f"{args.url}/health", timeout=1).ok:
+                return process
+        except requests.ConnectionError:
+            pass
+        time.sleep(1)
+    process.terminate()
+    raise RuntimeError("server.py did not become healthy")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end conversion benchmark.")
+    parser.add_argument("--url", default="http://127.0.0.1:8080", help="Server base URL")
+    parser.add_argument("--mode", choices=["simple", "distributed"], default="simple")
+    parser.add_argument("--pdf-dir", default=os.path.join(ROOT, "examples", "data"))
+    parser.add_argument("--requests", type=int, default=20, help="Total documents to convert")
+    parser.add_argument("--concurrency", type=int, default=2, help="Requests in flight")
+    parser.add_argument("--launch", action="store_true", help="Start server.py and the VLM stub")
+    parser.add_argument("--stub-port", type=int, default=8090)
+    parser.add_argument("--stub-latency-ms", type=float, default=500)
+    parser.add_argument("--stub-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+
+    pdfs = {
+        os.path.join(args.pdf_dir, name): count_pages(os.path.join(args.pdf_dir, name))
+        for name in sorted(os.listdir(args.pdf_dir))
+        if name.lower().endswith(".pdf")
+    }
+    if not pdfs:
+        parser.error(f"No PDFs found in {args.pdf_dir}")
+    print(f"Loaded {len(pdfs)} PDFs ({sum(pdfs.values())} pages) from {args.pdf_dir}")
+
+    server = None
+    if args.launch:
+        if args.mode != "simple":
+            parser.error("--launch only starts the simple server")
+        StubConfig.latency_ms = args.stub_latency_ms
+        StubConfig.error_rate = args.stub_error_rate
+        start_stub(port=args.stub_port)
+        server = launch_simple_server(args)
+
+    try:
+        report, errors = run(args, pdfs)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(timeout=30)
+
+    print(json.dumps(report, indent=2))
+    for error in errors[:10]:
+        print(f"error: {error}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
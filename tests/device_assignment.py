@@ -0,0 +1,79 @@
+"""
+Simulate GPU assignment on a CPU-only machine.
+
+Starts several processes, the way Celery's prefork pool does, with
+MARKER_SIMULATED_DEVICES set, and checks that they spread evenly over the
+simulated devices and release them on exit. Each process "loads its models"
+for --load-seconds before marking them loaded, so processes starting
+together are spread by the pending-memory accounting, and later ones by the
+free memory the simulated devices report.
+
+    python device_assignment.py --devices 4 --processes 8
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def worker(ready, release, load_seconds):
+    from marker_api import devices
+
+    device = devices.assign_device()
+    time.sleep(load_seconds)
+    devices.mark_loaded()
+    ready.put((os.getpid(), device.index))
+    release.wait()
+    devices.release_device()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated multi-GPU device assignment.")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--load-seconds", type=float, default=0.2)
+    args = parser.parse_args()
+
+    # Set before marker_api.devices is imported, here and in the children
+    os.environ["MARKER_SIMULATED_DEVICES"] = str(args.devices)
+    os.environ["MARKER_DEVICE_DIR"] = tempfile.mkdtemp(prefix="marker_devices_")
+    sys.path.insert(0, ROOT)
+    from marker_api.devices import device_stats
+
+    context = multiprocessing.get_context("fork")
+    ready = context.Queue()
+    release = context.Event()
+    processes = [
+        context.Process(target=worker, args=(ready, release, args.load_seconds))
+        for _ in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+        # Stagger a little, like pool processes coming up one after another
+        time.sleep(0.05)
+
+    assigned = dict(ready.get(timeout=30) for _ in processes)
+    counts = Counter(assigned.values())
+    for device in device_stats()["devices"]:
+        print(
+            f"device {device['index']}: {len(device['processes'])} processes, "
+            f"{device['free_mb']}/{device['total_mb']} MB free"
+        )
+
+    release.set()
+    for process in processes:
+        process.join()
+    leftover = sum(len(d["processes"]) for d in device_stats()["devices"])
+
+    balanced = max(counts.values()) - min(counts.get(i, 0) for i in range(args.devices)) <= 1
+    print(f"balanced: {balanced}, assignments left after exit: {leftover}")
+    sys.exit(0 if balanced and leftover == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
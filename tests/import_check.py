@@ -0,0 +1,82 @@
+"""
+Regression check for the API process's import path.
+
+Imports each module in a fresh interpreter under ``python -X importtime``,
+prints the slowest imports and fails if a heavy ML dependency was pulled in
+or the import took longer than the budget.
+
+    python import_check.py
+    python import_check.py --module distributed_server --budget-ms 1500
+"""
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only the workers may load
+HEAVY_MODULES = ("marker", "torch", "transformers", "surya", "boto3", "PIL", "pynvml", "pypdfium2")
+
+DEFAULT_MODULES = ("marker_api.celery_routes", "distributed_server")
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def import_times(module):
+    """Run ``import module`` under -X importtime and return [(name, self_us, cumulative_us, depth)]"""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    times = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            times.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    if completed.returncode != 0:
+        errors = [line for line in completed.stderr.splitlines() if not line.startswith("import time:")]
+        raise RuntimeError(f"import {module} failed:\n" + "\n".join(errors[-20:]))
+    return times
+
+
+def check_module(module, budget_ms, top):
+    times = import_times(module)
+    total_ms = sum(self_us for _, self_us, _, _ in times) / 1000
+    heavy = sorted({name for name, _, _, _ in times if name.split(".")[0] in HEAVY_MODULES})
+
+    print(f"{module}: {len(times)} modules imported in {total_ms:.0f} ms")
+    for name, _, cumulative_us, depth in sorted(times, key=lambda t: -t[2])[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {'  ' * depth}{name}")
+
+    ok = True
+    if heavy:
+        print(f"  FAIL: imports heavy modules: {', '.join(heavy)}")
+        ok = False
+    if budget_ms and total_ms > budget_ms:
+        print(f"  FAIL: {total_ms:.0f} ms is over the {budget_ms:.0f} ms budget")
+        ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check what the API process imports at startup.")
+    parser.add_argument(
+        "--module", action="append", help="Module to check (repeatable); defaults to the API modules"
+    )
+    parser.add_argument("--budget-ms", type=float, default=0, help="Fail above this total import time")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports to list")
+    args = parser.parse_args()
+
+    results = [check_module(module, args.budget_ms, args.top) for module in args.module or DEFAULT_MODULES]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
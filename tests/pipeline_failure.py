@@ -0,0 +1,97 @@
+"""
+Local check that a failed stage of the split pipeline is reported through
+``/celery/result`` instead of leaving the client polling.
+
+Starts a real worker for the app in ``marker_api.celery_worker`` (with the
+warm-up off, so marker isn't needed), queues a chain whose first stage raises
+with the pipeline's ``fail_pipeline`` errback, and checks that the chain's
+task ID answers 200 with status ``Error`` and the stage's exception.
+
+Needs a local Redis:
+
+    docker run -d -p 6379:6379 redis
+    PIPELINE_TEST_REDIS_URL=redis://localhost:6379/15 python tests/pipeline_failure.py
+"""
+import os
+import sys
+import time
+import uuid
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REDIS_URL = os.environ.get("PIPELINE_TEST_REDIS_URL", "redis://localhost:6379/15")
+
+# Set before marker_api is imported, here and in the worker
+os.environ["CELERY_BROKER_URL"] = REDIS_URL
+os.environ["MARKER_WARMUP"] = "false"
+sys.path.insert(0, ROOT)
+
+from celery import chain  # noqa: E402
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from marker_api.celery_tasks import assemble_document, fail_pipeline  # noqa: E402
+from marker_api.celery_worker import celery_app  # noqa: E402
+
+STAGE_ERROR = "layout stage exploded"
+
+
+@celery_app.task(name="pipeline_failure.failing_stage")
+def failing_stage():
+    raise RuntimeError(STAGE_ERROR)
+
+
+def start_worker():
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "celery", "-A", "marker_api.celery_worker.celery_app",
+            "worker", "-I", "pipeline_failure", "--pool=prefork", "--concurrency=1",
+            "--loglevel=warning", "-n", f"pipeline-{uuid.uuid4().hex[:6]}@%h",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, PYTHONPATH=ROOT),
+    )
+
+
+def check(name, condition):
+    print(f"[{'PASS' if condition else 'FAIL'}] {name}")
+    return condition
+
+
+def main():
+    from distributed_server import setup_routes
+
+    app = FastAPI()
+    setup_routes(app, celery_live=True)
+    client = TestClient(app)
+
+    worker = start_worker()
+    ok = True
+    try:
+        # Queued the way marker_api.celery_routes queues the split pipeline
+        task_id = str(uuid.uuid4())
+        errback = fail_pipeline.s(task_id)
+        chain(
+            failing_stage.s().on_error(errback),
+            assemble_document.s(),
+        ).apply_async(task_id=task_id)
+
+        deadline = time.monotonic() + 120
+        response = client.get(f"/celery/result/{task_id}")
+        while response.status_code == 202 and time.monotonic() < deadline:
+            time.sleep(0.5)
+            response = client.get(f"/celery/result/{task_id}")
+
+        body = response.json()
+        ok &= check("failed pipeline answers 200, not 202 or 500", response.status_code == 200)
+        ok &= check("result reports status Error", body.get("status") == "Error")
+        ok &= check("result carries the stage's exception", STAGE_ERROR in (body.get("error") or ""))
+    finally:
+        worker.terminate()
+        worker.wait(timeout=30)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,9 +7,9 @@ import logging
 logger = logging.getLogger(__name__)
 
 PORT = 8080
-HOST = f"http://51.8.81.159:8080"
+HOST = os.environ.get("MARKER_API_HOST", f"http://localhost:{PORT}")
 
-PDF_DIR = "./data"
+PDF_DIR = os.environ.get("MARKER_API_PDF_DIR", "../examples/data")
 
 
 def load_pdf_files():
@@ -0,0 +1,50 @@
+"""
+Check the fast-path triage on the bundled example paper.
+
+Tables set with a few horizontal rules (pages 5, 7 and 9, zero-based) and
+pages of displayed equations (3 and 4) must go through marker, which keeps
+their structure; the reference pages are plain text and may take the text
+layer.
+
+    python tests/triage_check.py
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from marker_api.triage import MARKER_PATH, TEXT_PATH, triage_pdf  # noqa: E402
+
+EXAMPLE = os.path.join(ROOT, "examples", "data", "attention_is_all_you_need.pdf")
+TABLE_PAGES = (5, 7, 9)
+EQUATION_PAGES = (3, 4)
+TEXT_PAGES = (10, 11)
+
+
+def check(name, condition):
+    print(f"[{'PASS' if condition else 'FAIL'}] {name}")
+    return condition
+
+
+def main():
+    pages, texts = triage_pdf(EXAMPLE)
+    paths = {page.page: page for page in pages}
+    for page in pages:
+        print(f"  page {page.page}: {page.path} ({page.reason})")
+
+    ok = True
+    for index in TABLE_PAGES:
+        ok &= check(f"table page {index} goes to marker", paths[index].path == MARKER_PATH)
+    for index in EQUATION_PAGES:
+        ok &= check(f"equation page {index} goes to marker", paths[index].path == MARKER_PATH)
+    for index in TEXT_PAGES:
+        ok &= check(
+            f"text page {index} takes the text layer",
+            paths[index].path == TEXT_PATH and bool(texts.get(index)),
+        )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Local stand-in for the SageMaker VLM endpoint.
+
+Answers ``invoke_endpoint`` calls (``POST /endpoints/<name>/invocations``)
+with the same response shape as the hosted model, after a configurable
+latency and with a configurable error rate. Batched requests
+(``{"batch": [...]}``, see VLM_BATCH_MAX_SIZE) are answered with
+``{"responses": [...]}``.
+
+    python tests/vlm_stub.py --port 8090 --latency-ms 800 --error-rate 0.02
+
+Then point the server or workers at it:
+
+    SAGEMAKER_ENDPOINT_URL=http://localhost:8090 \
+    SAGEMAKER_AWS_ACCESS_KEY_ID=stub SAGEMAKER_AWS_SECRET_ACCESS_KEY=stub \
+    python server.py
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubConfig:
+    latency_ms = 500.0
+    jitter_ms = 100.0
+    per_item_ms = 50.0
+    error_rate = 0.0
+
+
+class Stats:
+    lock = threading.Lock()
+    requests = 0
+    images = 0
+    errors = 0
+
+
+def _completion(index):
+    return {
+        "id": f"stub-{index}",
+        "object": "chat.completion",
+        "choices": [
+            {
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": f"Stub description #{index}: a figure with a chart and a caption.",
+                },
+                "finish_reason": "stop",
+            }
+        ],
+    }
+
+
+def _failed():
+    return random.random() < StubConfig.error_rate
+
+
+class VLMStubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        # SageMaker's container health check path
+        if self.path == "/ping":
+            self._send(200, {"status": "ok"})
+        else:
+            self._send(404, {"message": "Not found"})
+
+    def do_POST(self):
+        if not (self.path.startswith("/endpoints/") and self.path.endswith("/invocations")):
+            self._send(404, {"message": "Not found"})
+            return
+
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        batch = body.get("batch")
+        items = len(batch) if batch is not None else 1
+
+        delay = StubConfig.latency_ms + random.uniform(-1, 1) * StubConfig.jitter_ms
+        delay += StubConfig.per_item_ms * (items - 1)
+        time.sleep(max(delay, 0) / 1000)
+
+        with Stats.lock:
+            Stats.requests += 1
+            Stats.images += items
+            index = Stats.images
+
+        if batch is None:
+            if _failed():
+                with Stats.lock:
+                    Stats.errors += 1
+                self._send(500, {"ErrorCode": "INTERNAL_FAILURE_FROM_MODEL", "Message": "Stub failure"})
+            else:
+                self._send(200, _completion(index))
+            return
+
+        responses = []
+        for offset in range(items):
+            if _failed():
+                with Stats.lock:
+                    Stats.errors += 1
+                responses.append({"error": "Stub failure"})
+            else:
+                responses.append(_completion(index - items + offset + 1))
+        self._send(200, {"responses": responses})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub(host="127.0.0.1", port=8090):
+    """Start the stub in a background thread and return the server"""
+    server = ThreadingHTTPServer((host, port), VLMStubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the SageMaker VLM endpoint.")
+    parser.add_argument("--host", default="0.0.0.0", help="Host to bind")
+    parser.add_argument("--port", type=int, default=8090, help="Port to bind")
+    parser.add_argument("--latency-ms", type=float, default=500, help="Mean latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=100, help="Uniform latency jitter")
+    parser.add_argument("--per-item-ms", type=float, default=50, help="Extra latency per batched image")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of failed images")
+    args = parser.parse_args()
+
+    StubConfig.latency_ms = args.latency_ms
+    StubConfig.jitter_ms = args.jitter_ms
+    StubConfig.per_item_ms = args.per_item_ms
+    StubConfig.error_rate = args.error_rate
+
+    server = ThreadingHTTPServer((args.host, args.port), VLMStubHandler)
+    server.daemon_threads = True
+    print(f"VLM stub listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"requests={Stats.requests} images={Stats.images} errors={Stats.errors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Local worker-crash simulation for the Celery reliability settings.
+
+Starts a real prefork worker with the same acks/prefetch/redelivery settings
+as ``marker_api.celery_worker`` and checks that:
+
+1. a task whose worker process dies mid-task (like an OOM kill) is redelivered
+   and completes on the next attempt, and
+2. a task that kills its worker every time is dead-lettered after
+   ``CELERY_MAX_DELIVERIES`` deliveries instead of looping forever.
+
+Needs a local Redis:
+
+    docker run -d -p 6379:6379 redis
+    CRASH_TEST_REDIS_URL=redis://localhost:6379/15 python tests/worker_crash.py
+"""
+import os
+import sys
+import uuid
+import tempfile
+import subprocess
+
+import redis
+from celery import Celery
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from marker_api.celery_worker import MAX_DELIVERIES, celery_app  # noqa: E402
+from marker_api.dead_letter import (  # noqa: E402
+    DEAD_LETTER_KEY,
+    clear_delivery,
+    dead_letter_if_poison,
+    list_dead_letters,
+)
+
+REDIS_URL = os.environ.get("CRASH_TEST_REDIS_URL", "redis://localhost:6379/15")
+
+RELIABILITY_SETTINGS = (
+    "task_acks_late",
+    "task_reject_on_worker_lost",
+    "worker_prefetch_multiplier",
+    "broker_transport_options",
+)
+
+crash_app = Celery("worker_crash", broker=REDIS_URL, backend=REDIS_URL)
+crash_app.conf.update({key: celery_app.conf[key] for key in RELIABILITY_SETTINGS})
+
+
+def _client():
+    return redis.Redis.from_url(REDIS_URL)
+
+
+@crash_app.task(bind=True, name="worker_crash.crash_once")
+def crash_once(self, marker_path):
+    client = _client()
+    reason = dead_letter_if_poison(client, self.request.id, "crash_once.pdf", MAX_DELIVERIES)
+    if reason:
+        return {"status": "Error", "error": reason}
+    if not os.path.exists(marker_path):
+        open(marker_path, "w").close()
+        # Die without cleanup, exactly like the kernel OOM killer would
+        os._exit(1)
+    clear_delivery(client, self.request.id)
+    return {"status": "ok"}
+
+
+@crash_app.task(bind=True, name="worker_crash.always_crash")
+def always_crash(self):
+    reason = dead_letter_if_poison(_client(), self.request.id, "poison.pdf", MAX_DELIVERIES)
+    if reason:
+        return {"status": "Error", "error": reason}
+    os._exit(1)
+
+
+def start_worker():
+    env = dict(os.environ, PYTHONPATH=ROOT, CRASH_TEST_REDIS_URL=REDIS_URL)
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "celery", "-A", "worker_crash.crash_app", "worker",
+            "--pool=prefork", "--concurrency=1", "--loglevel=warning",
+            "-n", f"crash-{uuid.uuid4().hex[:6]}@%h",
+        ],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+    )
+
+
+def check(name, condition):
+    print(f"[{'PASS' if condition else 'FAIL'}] {name}")
+    return condition
+
+
+def main():
+    client = _client()
+    client.delete(DEAD_LETTER_KEY)
+    worker = start_worker()
+    ok = True
+    try:
+        marker_path = os.path.join(tempfile.mkdtemp(), "crashed")
+        result = crash_once.delay(marker_path).get(timeout=120)
+        ok &= check("task is redelivered after its worker process dies", result["status"] == "ok")
+
+        result = always_crash.delay().get(timeout=120)
+        ok &= check("poison task ends with an error result", result["status"] == "Error")
+        dead_letters = list_dead_letters(client)
+        ok &= check(
+            f"poison task is dead-lettered after {MAX_DELIVERIES} deliveries",
+            len(dead_letters) == 1 and dead_letters[0]["attempts"] == MAX_DELIVERIES,
+        )
+    finally:
+        worker.terminate()
+        worker.wait(timeout=30)
+        client.delete(DEAD_LETTER_KEY)
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()